@@ -0,0 +1,205 @@
+"""
+Load benchmark of the API: the server runs in a forked process (by default on the embedded memory store, so no
+MySQL is needed), and a local load generator drives each scenario with a fixed number of concurrent requests,
+reporting req/s and p50 / p95 / p99 latency per scenario. Scenarios run in order on the same server, after a seed of
+tasks is created; "delete_one" runs last as it deletes seeded tasks.
+
+Usage (from the root of the repository):
+    PYTHONPATH=src python benchmark/api_load.py [--concurrency 32] [--requests 2000] [--tasks 10000]
+        [--scenarios get_one list_page ...] [--store memory|mysql] [--wal-path /tmp/bench.wal] [--output results.json]
+With --store mysql, the server connects to MySQL with MYSQL_HOST, MYSQL_USER and MYSQL_PASSWORD like src/main.py.
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from tornado.gen import multi
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+
+from task_man.app import serve
+from task_man.config import Config, MysqlConfig, StoreConfig
+from task_man.store import STORE_MEMORY, STORE_MYSQL
+
+from results import write_results
+
+BULK_SIZE = 100
+
+
+def make_scenarios(first_id: int, tasks: int, rng: random.Random) -> Dict[str, Callable[[int], dict]]:
+    """
+    Return {name: function of the index of a request returning the arguments of HTTPRequest, with a relative url}.
+
+    :param first_id: id of the first seeded task, the seeded tasks have consecutive ids
+    :param tasks: number of seeded tasks
+    :param rng: random.Random
+    """
+    deleted_ids = iter(range(first_id + tasks - 1, first_id - 1, -1))
+
+    def body(value) -> dict:
+        return dict(body=json.dumps(value))
+
+    def expiry_dt() -> str:
+        return (datetime.now() + timedelta(days=1 + rng.random() * 29)).isoformat()
+
+    def random_id() -> int:
+        return rng.randint(first_id, first_id + tasks - 1)
+
+    return {
+        "get_one": lambda i: dict(url=f"/v1/tasks/{random_id()}"),
+        "list_page": lambda i: dict(url=f"/v1/tasks?limit=100&after_id={random_id()}"),
+        "list_expiry": lambda i: dict(url="/v1/tasks?order_by=expiry_dt&limit=100"),
+        "expiring": lambda i: dict(url="/v1/tasks/expiring?within=7d&limit=100"),
+        "post_one": lambda i: dict(url="/v1/tasks", method="POST", **body({"title": f"post {i}", "expiry_dt": expiry_dt()})),
+        "post_bulk": lambda i: dict(url="/v1/tasks", method="POST", **body(
+            {"tasks": [{"title": f"bulk {i}/{j}", "expiry_dt": expiry_dt()} for j in range(BULK_SIZE)]}
+        )),
+        "put_one": lambda i: dict(url=f"/v1/tasks/{random_id()}", method="PUT", **body({"title": f"put {i}"})),
+        "put_bulk": lambda i: dict(url="/v1/tasks", method="PUT", **body(
+            {"tasks": [{"id": random_id(), "title": f"put {i}/{j}"} for j in range(BULK_SIZE)]}
+        )),
+        "patch_one": lambda i: dict(url=f"/v1/tasks/{random_id()}", method="PATCH", **body({"description": f"patch {i}"})),
+        "delete_one": lambda i: dict(url=f"/v1/tasks/{next(deleted_ids)}", method="DELETE"),
+    }
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    """
+    :param latencies: sorted latencies
+    :param p: percentile, between 0 and 100
+    :return: nearest-rank percentile
+    """
+    return latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)]
+
+
+async def run_scenario(client: AsyncHTTPClient, base_url: str, make_request: Callable[[int], dict], count: int,
+                       concurrency: int) -> dict:
+    """
+    Send count requests with concurrency workers, each sending its next request when the previous one is answered.
+
+    :return: dict of the results
+    """
+    latencies = []
+    errors = 0
+    next_index = iter(range(count))
+
+    async def work():
+        nonlocal errors
+        for index in next_index:
+            arguments = make_request(index)
+            request = HTTPRequest(base_url + arguments.pop("url"), **arguments)
+            started_at = time.perf_counter()
+            response = await client.fetch(request, raise_error=False)
+            latencies.append(time.perf_counter() - started_at)
+            errors += response.code >= 400 or response.code < 200
+
+    started_at = time.perf_counter()
+    await multi([work() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    return dict(requests=count, errors=errors, req_per_s=round(count / elapsed, 1),
+                **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 3) for p in (50, 95, 99)},
+                max_ms=round(latencies[-1] * 1000, 3))
+
+
+async def wait_until_ready(client: AsyncHTTPClient, base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = await client.fetch(base_url + "/v1/health", raise_error=False)
+            if response.code == 200:
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("The server is not ready.")
+        await IOLoop.current().run_in_executor(None, time.sleep, 0.1)
+
+
+async def run(args: argparse.Namespace, base_url: str) -> List[dict]:
+    AsyncHTTPClient.configure(None, max_clients=args.concurrency)
+    client = AsyncHTTPClient()
+    await wait_until_ready(client, base_url)
+    rng = random.Random(args.seed)
+    response = await client.fetch(base_url + "/v1/tasks", method="DELETE")
+    assert response.code == 200
+    seeded = 0
+    while seeded < args.tasks:
+        chunk = min(1000, args.tasks - seeded)
+        await client.fetch(base_url + "/v1/tasks", method="POST", body=json.dumps({"tasks": [
+            {"title": f"seed {seeded + j}", "description": "seed",
+             "expiry_dt": (datetime.now() + timedelta(days=1 + rng.random() * 29)).isoformat()}
+            for j in range(chunk)
+        ]}))
+        seeded += chunk
+    first_id = json.loads((await client.fetch(base_url + "/v1/tasks?limit=1")).body)["tasks"][0]["id"]
+    scenarios = make_scenarios(first_id, args.tasks, rng)
+
+    results = []
+    for name in args.scenarios:
+        make_request = scenarios[name]
+        await run_scenario(client, base_url, make_request, min(args.warmup, args.requests), args.concurrency)
+        result = dict(name=name, concurrency=args.concurrency,
+                      **await run_scenario(client, base_url, make_request, args.requests, args.concurrency))
+        print(f"{name:<13}{result['req_per_s']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+              f"{result['p99_ms']:>10}{result['errors']:>8}")
+        results.append(result)
+    return results
+
+
+def run_server(config: Config, sockets):
+    logging.getLogger("tornado.access").setLevel(logging.WARNING)
+    serve(config, sockets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=200, help="requests per scenario before measuring")
+    parser.add_argument("--tasks", type=int, default=10000, help="tasks created before the scenarios")
+    scenario_names = list(make_scenarios(1, 1, random.Random()))
+    parser.add_argument("--scenarios", nargs="+", default=scenario_names, choices=scenario_names)
+    parser.add_argument("--store", default=STORE_MEMORY, choices=[STORE_MEMORY, STORE_MYSQL])
+    parser.add_argument("--wal-path", help="write-ahead log of the memory store, none by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="path of the JSON results, - for stdout")
+    args = parser.parse_args()
+    if "delete_one" in args.scenarios:  # delete_one deletes the seeded tasks from the highest id
+        args.scenarios = [name for name in args.scenarios if name != "delete_one"] + ["delete_one"]
+        if args.warmup + args.requests > args.tasks:
+            parser.error("delete_one needs --tasks of at least --warmup + --requests.")
+
+    config = Config(
+        store=StoreConfig(backend=args.store, wal_path=args.wal_path),
+        mysql=MysqlConfig(
+            host=os.environ.get("MYSQL_HOST") or "localhost:3306",
+            user=os.environ.get("MYSQL_USER") or "root",
+            password=os.environ.get("MYSQL_PASSWORD") or "root",
+        ),
+    )
+    sockets = bind_sockets(0, "127.0.0.1")
+    base_url = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+    server = multiprocessing.get_context("fork").Process(target=run_server, args=(config, sockets), daemon=True)
+    server.start()
+    for sock in sockets:
+        sock.close()
+    try:
+        print(f"{'scenario':<13}{'req/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+        results = IOLoop.current().run_sync(lambda: run(args, base_url))
+    finally:
+        server.terminate()
+        server.join()
+    write_results(args.output, "api_load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
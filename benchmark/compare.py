@@ -0,0 +1,63 @@
+"""
+Compare two result files of a benchmark (see benchmark/results.py), and report the metrics which regressed by more
+than a threshold. Exits with status 1 if any metric regressed, e.g. to fail a CI job.
+
+Usage (from the root of the repository):
+    python benchmark/compare.py baseline.json current.json [--threshold 0.1]
+"""
+import argparse
+import json
+import sys
+from typing import List, Tuple
+
+
+def compare(baseline: dict, current: dict) -> List[Tuple[str, str, float, float, float]]:
+    """
+    :param baseline: result document of the baseline
+    :param current: result document of the current run
+    :return: list of (name, metric, baseline value, current value, relative change) of all compared metrics,
+        where a positive change is an improvement
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        base = baseline_results.get(result["name"])
+        if base is None:
+            continue
+        for metric, value in result.items():
+            base_value = base.get(metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(base_value, (int, float)) \
+                    or not base_value:
+                continue
+            change = (value - base_value) / abs(base_value)
+            if not metric.endswith("_per_s"):
+                change = -change
+            changes.append((result["name"], metric, base_value, value, change))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change beyond which a worse metric is a regression, 0.1 for 10%%")
+    args = parser.parse_args()
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    if baseline["benchmark"] != current["benchmark"]:
+        raise SystemExit(f"Cannot compare {baseline['benchmark']} with {current['benchmark']}.")
+
+    regressions = 0
+    print(f"{'name':<32}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, metric, base_value, value, change in compare(baseline, current):
+        regressed = change < -args.threshold
+        regressions += regressed
+        print(f"{name:<32}{metric:<16}{base_value:>12.4g}{value:>12.4g}{change:>+9.1%}{'  REGRESSED' if regressed else ''}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Simulation of expiry processing: TaskExpiryAlert with the "ioloop" scheduler and a NotificationDispatcher drain a
+cache of tasks whose expiries are spread over a simulated span, on a FakeClock advanced by a step at a time,
+so a day of alerts is processed without waiting. Reports the wall time, the alert throughput and the lag of the
+alerts in simulated time (alert_dt - (expiry_dt - 15 minutes)), which is bounded by the step.
+
+Usage (from the root of the repository):
+    PYTHONPATH=src python benchmark/expiry_simulation.py [--tasks 100000] [--span-hours 24] [--step-seconds 60]
+        [--backends sorted_set timing_wheel compact] [--output results.json]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from task_man.clock import FakeClock
+from task_man.notification import Alert, AlertSink, NotificationDispatcher
+from task_man.scheduling import TaskExpiryAlert, TIMEDELTA
+from task_man.task_cache import TASK_CACHE_BACKENDS, BaseTaskCache, create_task_cache
+
+from results import write_results
+
+START = datetime(2030, 1, 1)
+
+
+class RecordingSink(AlertSink):
+    name = "recording"
+
+    def __init__(self):
+        super().__init__(batch_size=1000)
+        self.count = 0
+        self.lags: List[float] = []  # seconds of simulated time
+
+    async def send(self, alerts: List[Alert]):
+        self.count += len(alerts)
+        self.lags.extend((alert.alert_dt - (alert.expiry_dt - TIMEDELTA)).total_seconds() for alert in alerts)
+
+
+def is_processed(cache: BaseTaskCache, clock: FakeClock) -> bool:
+    task = cache.get_next_task()
+    return task is None or task[2] >= clock() + TIMEDELTA
+
+
+async def simulate(backend: str, size: int, span: timedelta, step: timedelta, seed: int) -> dict:
+    rng = random.Random(seed)
+    clock = FakeClock(START)
+    cache = create_task_cache(backend)
+    sink = RecordingSink()
+    dispatcher = NotificationDispatcher([sink], queue_size=size + 1)
+    TaskExpiryAlert.set_task_cache(cache)
+    TaskExpiryAlert.set_clock(clock)
+    TaskExpiryAlert.set_dispatcher(dispatcher)
+    dispatcher.start()
+    span_seconds = span.total_seconds()
+    cache.load_tasks(sorted(
+        ((id, f"task title {id}", START + TIMEDELTA + timedelta(seconds=rng.random() * span_seconds))
+         for id in range(size)), key=lambda task: (task[2], task[0])
+    ))
+    TaskExpiryAlert.start_scheduler()
+    try:
+        started_at = time.perf_counter()
+        steps = 0
+        while clock() < START + span + step:
+            clock.advance(step)
+            steps += 1
+            TaskExpiryAlert.wake_up()
+            while not is_processed(cache, clock):
+                await gen.sleep(0)
+        while sink.count < size and time.perf_counter() - started_at < 60:
+            await gen.sleep(0.001)
+        elapsed = time.perf_counter() - started_at
+    finally:
+        TaskExpiryAlert.stop_scheduler()
+        await dispatcher.stop()
+        TaskExpiryAlert.set_clock()
+        TaskExpiryAlert.set_dispatcher(None)
+    assert sink.count == size, f"{backend} alerted {sink.count} of {size} tasks"
+    lags = sorted(sink.lags)
+    return dict(name=f"{backend}/{size}", backend=backend, tasks=size, steps=steps, seconds=round(elapsed, 3),
+                alerts_per_s=round(size / elapsed), simulated_per_s=round(span_seconds / elapsed),
+                p50_lag_s=round(lags[len(lags) // 2], 3), max_lag_s=round(lags[-1], 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--span-hours", type=float, default=24)
+    parser.add_argument("--step-seconds", type=float, default=60)
+    parser.add_argument("--backends", nargs="+", default=list(TASK_CACHE_BACKENDS), choices=list(TASK_CACHE_BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="path of the JSON results, - for stdout")
+    args = parser.parse_args()
+    results = []
+    print(f"{'backend':<14}{'tasks':>10}{'seconds':>10}{'alerts/s':>12}{'p50 lag (s)':>13}{'max lag (s)':>13}")
+    for backend in args.backends:
+        result = IOLoop.current().run_sync(lambda: simulate(
+            backend, args.tasks, timedelta(hours=args.span_hours), timedelta(seconds=args.step_seconds), args.seed
+        ))
+        print(f"{backend:<14}{args.tasks:>10}{result['seconds']:>10}{result['alerts_per_s']:>12}"
+              f"{result['p50_lag_s']:>13}{result['max_lag_s']:>13}")
+        results.append(result)
+    write_results(args.output, "expiry_simulation", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
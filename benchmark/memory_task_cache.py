@@ -0,0 +1,67 @@
+"""
+Memory benchmark of the task cache backends: bytes per pending task, measured with tracemalloc.
+
+Usage (from the root of the repository):
+    PYTHONPATH=src python benchmark/memory_task_cache.py [--sizes 1000000 10000000] [--backends sorted_set compact]
+        [--output results.json]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from task_man.task_cache import TASK_CACHE_BACKENDS, create_task_cache
+
+from results import write_results
+
+CHUNK_SIZE = 100000
+
+
+def measure(backend: str, size: int) -> dict:
+    """
+    Load size tasks into a new cache of backend in pre-sorted chunks, like the warm-up, and measure the memory
+    held by the cache.
+
+    :param backend: str, name of the backend
+    :param size: int, number of tasks
+    :return: dict of the results
+    """
+    start = datetime(2021, 1, 1)
+    gc.collect()
+    tracemalloc.start()
+    begin = tracemalloc.get_traced_memory()[0]
+    started_at = time.perf_counter()
+    cache = create_task_cache(backend)
+    for offset in range(0, size, CHUNK_SIZE):
+        cache.load_tasks([
+            (id, f"task title {id}", start + timedelta(seconds=id))
+            for id in range(offset, min(offset + CHUNK_SIZE, size))
+        ])
+    elapsed = time.perf_counter() - started_at
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - begin
+    tracemalloc.stop()
+    assert cache.get_next_task()[0] == 0
+    del cache
+    return dict(name=f"{backend}/{size}", backend=backend, size=size, bytes_per_task=round(used / size, 1), load_seconds=round(elapsed, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--backends", nargs="+", default=["sorted_set", "compact"], choices=list(TASK_CACHE_BACKENDS))
+    parser.add_argument("--output", help="path of the JSON results, - for stdout")
+    args = parser.parse_args()
+    results = []
+    print(f"{'backend':<14}{'tasks':>12}{'bytes/task':>12}{'load (s)':>10}")
+    for size in args.sizes:
+        for backend in args.backends:
+            result = measure(backend, size)
+            print(f"{backend:<14}{size:>12}{result['bytes_per_task']:>12}{result['load_seconds']:>10}")
+            results.append(result)
+    write_results(args.output, "memory_task_cache", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Machine-readable output of the benchmarks, for regression comparison with benchmark/compare.py.
+
+Each benchmark writes one JSON document:
+    {
+        "benchmark": name of the benchmark script,
+        "created_at": datetime in isoformat,
+        "commit": git commit of the working tree, or null,
+        "python": Python version,
+        "platform": platform string,
+        "parameters": command line arguments,
+        "results": [{"name": unique name of the measurement, metric: number, ...}, ...]
+    }
+Metrics named with a "_per_s" suffix are better when higher, the other numeric metrics are better when lower.
+"""
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: Optional[str], benchmark: str, parameters: dict, results: List[dict]):
+    """
+    Write the results of a benchmark as JSON.
+
+    :param path: path of the JSON file, "-" for stdout, or None to skip
+    :param benchmark: name of the benchmark
+    :param parameters: parameters of the run, e.g. vars() of the parsed arguments
+    :param results: list of measurements, each with a unique "name"
+    :return:
+    """
+    if path is None:
+        return
+    document = {
+        "benchmark": benchmark,
+        "created_at": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {name: value for name, value in parameters.items() if name != "output"},
+        "results": results,
+    }
+    if path == "-":
+        json.dump(document, sys.stdout, indent=2)
+        print()
+        return
+    with open(path, "w") as file:
+        json.dump(document, file, indent=2)
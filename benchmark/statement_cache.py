@@ -0,0 +1,91 @@
+"""
+CPU benchmark of StatementCache: time to turn the statement of a request into SQL and driver arguments,
+compiled on each execution like encode/databases does, versus compiled once and bound per execution.
+No DB is needed, as only the work done in the API process before the query is sent is measured.
+
+Usage (from the root of the repository):
+    PYTHONPATH=src python benchmark/statement_cache.py [--iterations 20000] [--output results.json]
+"""
+import argparse
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+from task_man.config import MysqlConfig
+from task_man.db import compile_query, create_db_container
+from task_man.handlers.v1.pagination import TASK_FIELDS, TaskListQuery
+
+from results import write_results
+
+
+def make_shapes(tasks: sqlalchemy.Table) -> dict:
+    """
+    Return {name: (build the statement with literal values, key, build the parameterized statement, values)}
+    for the hot statements of the task handlers.
+    """
+    list_query = TaskListQuery({"limit": [b"100"], "after_id": [b"12345"]})
+    pk = sqlalchemy.bindparam("pk")
+    return {
+        "get_by_id": (
+            lambda: sqlalchemy.select([tasks.c[field] for field in TASK_FIELDS + ("update_dt",)])
+            .where(tasks.c.id == 12345),
+            ("get_by_id",),
+            lambda: sqlalchemy.select([tasks.c[field] for field in TASK_FIELDS + ("update_dt",)])
+            .where(tasks.c.id == pk),
+            {"pk": 12345},
+        ),
+        "update_by_id": (
+            lambda: tasks.update().where(tasks.c.id == 12345)
+            .values(title="title", expiry_dt=datetime(2021, 1, 1)),
+            ("update_by_id",),
+            lambda: tasks.update().where(tasks.c.id == pk).values(
+                title=sqlalchemy.bindparam("set_title"), expiry_dt=sqlalchemy.bindparam("set_expiry_dt")
+            ),
+            {"pk": 12345, "set_title": "title", "set_expiry_dt": datetime(2021, 1, 1)},
+        ),
+        "delete_by_id": (
+            lambda: tasks.delete().where(tasks.c.id == 12345),
+            ("delete_by_id",),
+            lambda: tasks.delete().where(tasks.c.id == pk),
+            {"pk": 12345},
+        ),
+        "list_page": (
+            lambda: list_query.query(tasks),
+            ("list_page", list_query.shape()),
+            lambda: list_query.query(tasks),
+            list_query.parameters(),
+        ),
+    }
+
+
+def measure(function, iterations: int) -> float:
+    """
+    :return: float, CPU microseconds per call
+    """
+    started_at = time.process_time()
+    for _ in range(iterations):
+        function()
+    return (time.process_time() - started_at) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--output", help="path of the JSON results, - for stdout")
+    args = parser.parse_args()
+    results = []
+    db_container = create_db_container(MysqlConfig())
+    statements = db_container.statements
+    print(f"{'statement':<14}{'compiled (us)':>15}{'cached (us)':>13}{'saved (us)':>12}")
+    for name, (build, key, build_parameterized, values) in make_shapes(db_container.tasks).items():
+        compiled = measure(lambda: compile_query(build()), args.iterations)
+        cached = measure(lambda: statements.bind(statements.compile(key, build_parameterized), values),
+                         args.iterations)
+        print(f"{name:<14}{compiled:>15.1f}{cached:>13.1f}{compiled - cached:>12.1f}")
+        results.append(dict(name=name, compiled_us=round(compiled, 2), cached_us=round(cached, 2)))
+    write_results(args.output, "statement_cache", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+CPU benchmark of the task cache backends: throughput of add, reschedule, remove and drain (pop_due_tasks) on a
+cache holding a given number of pending tasks. Drain advances a simulated cutoff over the whole span of the expiries,
+like the scheduler does over time, without waiting.
+
+Usage (from the root of the repository):
+    PYTHONPATH=src python benchmark/task_cache_ops.py [--sizes 10000 100000 1000000 10000000]
+        [--backends sorted_set timing_wheel compact] [--ops 100000] [--output results.json]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from task_man.task_cache import TASK_CACHE_BACKENDS, BaseTaskCache, Task, create_task_cache
+
+from results import write_results
+
+START = datetime(2030, 1, 1)
+SPAN = timedelta(days=30)  # expiries of the tasks are spread over SPAN from START
+CHUNK_SIZE = 100000
+DRAIN_STEPS = 1000
+
+
+def make_tasks(ids: range, rng: random.Random) -> List[Task]:
+    span_seconds = SPAN.total_seconds()
+    return [(id, f"task title {id}", START + timedelta(seconds=rng.random() * span_seconds)) for id in ids]
+
+
+def load(backend: str, size: int, rng: random.Random) -> BaseTaskCache:
+    """
+    Create a cache of backend holding size tasks, loaded in pre-sorted chunks like the warm-up.
+    """
+    cache = create_task_cache(backend)
+    tasks = sorted(make_tasks(range(size), rng), key=lambda task: (task[2], task[0]))
+    for offset in range(0, size, CHUNK_SIZE):
+        cache.load_tasks(tasks[offset:offset + CHUNK_SIZE])
+    return cache
+
+
+def measure(backend: str, size: int, ops: int, seed: int) -> List[dict]:
+    """
+    :return: a result per operation
+    """
+    rng = random.Random(seed)
+    cache = load(backend, size, rng)
+    ops = min(ops, size)
+    operations = {
+        "add": [(cache.add_task, task) for task in make_tasks(range(size, size + ops), rng)],
+        "reschedule": [(cache.add_task, task) for task in make_tasks(rng.sample(range(size), ops), rng)],
+        "remove": [(cache.remove_task, id) for id in rng.sample(range(size + ops), ops)],
+    }
+    results = []
+    for op, calls in operations.items():
+        started_at = time.perf_counter()
+        for function, argument in calls:
+            function(argument)
+        results.append(make_result(backend, op, size, len(calls), time.perf_counter() - started_at))
+
+    pending = len(cache.get_tasks())
+    drained = 0
+    started_at = time.perf_counter()
+    for step in range(1, DRAIN_STEPS + 1):
+        drained += len(cache.pop_due_tasks(START + SPAN * step / DRAIN_STEPS + timedelta(microseconds=1)))
+    results.append(make_result(backend, "drain", size, drained, time.perf_counter() - started_at))
+    assert drained == pending and cache.get_next_task() is None, f"{backend} drained {drained} of {pending} tasks"
+    return results
+
+
+def make_result(backend: str, op: str, size: int, ops: int, seconds: float) -> dict:
+    return dict(name=f"{backend}/{op}/{size}", backend=backend, op=op, size=size, ops=ops,
+                ops_per_s=round(ops / seconds), us_per_op=round(seconds / ops * 1e6, 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--backends", nargs="+", default=list(TASK_CACHE_BACKENDS), choices=list(TASK_CACHE_BACKENDS))
+    parser.add_argument("--ops", type=int, default=100000, help="operations per measurement, at most the size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="path of the JSON results, - for stdout")
+    args = parser.parse_args()
+    results = []
+    print(f"{'backend':<14}{'op':<12}{'tasks':>10}{'ops/s':>12}{'us/op':>10}")
+    for size in args.sizes:
+        for backend in args.backends:
+            for result in measure(backend, size, args.ops, args.seed):
+                print(f"{backend:<14}{result['op']:<12}{size:>10}{result['ops_per_s']:>12}{result['us_per_op']:>10}")
+                results.append(result)
+    write_results(args.output, "task_cache_ops", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,5 +7,7 @@ CREATE TABLE IF NOT EXISTS task_man.task (
     description  TEXT        NULL,
     expiry_dt    DATETIME(6) NULL,
     create_dt    DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
-    update_dt    DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
-);
\ No newline at end of file
+    update_dt    DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    INDEX idx_task_expiry_dt_id (expiry_dt, id),
+    INDEX idx_task_update_dt_id (update_dt, id)
+);
@@ -1,12 +1,15 @@
 import os
 
 from task_man.app import main
-from task_man.config import Config, MysqlConfig
+from task_man.config import AdminConfig, Config, MysqlConfig, StoreConfig
 
 
 if __name__ == "__main__":
     main(Config(
         port=8888,
+        processes=int(os.environ.get("PROCESSES") or 1),
+        store=StoreConfig(backend=os.environ.get("STORE") or "mysql"),
+        admin=AdminConfig(token=os.environ.get("ADMIN_TOKEN") or None),
         mysql=MysqlConfig(
             host=os.environ.get("MYSQL_HOST") or "localhost:3306",
             user=os.environ.get("MYSQL_USER") or "root",
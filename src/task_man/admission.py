@@ -0,0 +1,149 @@
+"""
+Admission control of the API handlers: requests are classified as read, write or bulk, and each class has its own
+limit of concurrently admitted requests and its own bounded queue of waiting requests. A request which finds the queue
+full, or which is not admitted within queue_timeout, is answered at once with 503 and Retry-After, instead of piling
+up on the DB pool and making the latency of every request grow.
+
+With AdmissionConfig.adaptive, the limit of each class follows AIMD on the latency of its admitted requests, which is
+dominated by DB: it is decreased multiplicatively (at most once per latency_target) when a request is slower than
+latency_target, and increased by 1 after a limit's worth of requests within latency_target, between min_limit and the
+configured limit. So the concurrency settles near the knee of the DB instead of overloading it.
+
+Limiters are used on the IOLoop thread only, so they hold no locks.
+"""
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Deque, Dict, Optional
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.util import TimeoutError
+
+from .config import AdmissionConfig
+from .metrics import ADMISSION_LIMIT, ADMISSION_REJECTED
+
+ADMISSION_READ = "read"
+ADMISSION_WRITE = "write"
+ADMISSION_BULK = "bulk"
+
+REJECTED_QUEUE_FULL = "queue_full"
+REJECTED_TIMEOUT = "timeout"
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float, adaptive: bool = False,
+                 latency_target: float = 0.05, min_limit: int = 1, backoff: float = 0.9):
+        """
+        :param name: name of the class of requests
+        :param limit: max number of concurrently admitted requests, the initial and max limit if adaptive
+        :param queue_size: max number of waiting requests
+        :param queue_timeout: seconds a request waits for admission
+        :param adaptive: adjust the limit by AIMD on the latency of admitted requests
+        :param latency_target: seconds, latency beyond which the adaptive limit is decreased
+        :param min_limit: lower bound of the adaptive limit
+        :param backoff: factor of the multiplicative decrease of the adaptive limit
+        """
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self.__max_limit = limit
+        self.__queue_size = queue_size
+        self.__queue_timeout = timedelta(seconds=queue_timeout)
+        self.__adaptive = adaptive
+        self.__latency_target = latency_target
+        self.__min_limit = min(min_limit, limit)
+        self.__backoff = backoff
+        self.__waiters: Deque[Future] = deque()
+        self.__successes = 0
+        self.__decreased_at = float("-inf")
+
+    @property
+    def waiting(self) -> int:
+        return len(self.__waiters)
+
+    async def acquire(self) -> bool:
+        """
+        Admit a request, waiting in the queue up to queue_timeout if the limit is reached.
+        An admitted request should call release when it is finished.
+
+        :return: bool, False if the request is rejected
+        """
+        if self.in_use < self.limit and not self.__waiters:
+            self.in_use += 1
+            return True
+        if len(self.__waiters) >= self.__queue_size:
+            self.__reject(REJECTED_QUEUE_FULL)
+            return False
+        waiter = Future()
+        self.__waiters.append(waiter)
+        try:
+            await gen.with_timeout(self.__queue_timeout, waiter)
+            return True
+        except TimeoutError:
+            if waiter.done():  # admitted at the same time
+                return True
+            self.__waiters.remove(waiter)
+            self.__reject(REJECTED_TIMEOUT)
+            return False
+
+    def release(self, latency: Optional[float] = None):
+        """
+        Release the slot of an admitted request, to the first waiting request if the limit allows it.
+
+        :param latency: seconds since the request was admitted, which adjusts the adaptive limit
+        :return:
+        """
+        if latency is not None and self.__adaptive:
+            self.__adapt(latency)
+        if self.__waiters and self.in_use <= self.limit:
+            self.__waiters.popleft().set_result(None)  # the slot is handed over, in_use is unchanged
+            return
+        self.in_use -= 1
+
+    def __adapt(self, latency: float):
+        if latency > self.__latency_target:
+            self.__successes = 0
+            now = time.monotonic()
+            if now - self.__decreased_at >= self.__latency_target:  # requests admitted before were already slow
+                self.limit = max(self.__min_limit, int(self.limit * self.__backoff))
+                self.__decreased_at = now
+            return
+        self.__successes += 1
+        if self.__successes >= self.limit and self.limit < self.__max_limit:
+            self.__successes = 0
+            self.limit += 1
+            self.__admit_waiters()
+
+    def __admit_waiters(self):
+        while self.in_use < self.limit and self.__waiters:
+            self.in_use += 1
+            self.__waiters.popleft().set_result(None)
+
+    def __reject(self, reason: str):
+        ADMISSION_REJECTED.inc(label_values=(self.name, reason))
+
+
+class AdmissionControl:
+    """
+    Limiters of the classes of requests, in the settings of the Application as "admission".
+    """
+    def __init__(self, config: AdmissionConfig):
+        self.retry_after = config.retry_after
+        self.__limiters: Dict[str, AdmissionLimiter] = {
+            name: AdmissionLimiter(name, limit, config.queue_size, config.queue_timeout, config.adaptive,
+                                   config.latency_target, config.min_limit, config.backoff)
+            for name, limit in (
+                (ADMISSION_READ, config.read_limit),
+                (ADMISSION_WRITE, config.write_limit),
+                (ADMISSION_BULK, config.bulk_limit),
+            )
+        }
+        ADMISSION_LIMIT.set_function(lambda: {
+            (name, state): value
+            for name, limiter in self.__limiters.items()
+            for state, value in (("limit", limiter.limit), ("in_use", limiter.in_use), ("waiting", limiter.waiting))
+        })
+
+    def get_limiter(self, name: str) -> AdmissionLimiter:
+        return self.__limiters[name]
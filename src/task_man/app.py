@@ -1,51 +1,184 @@
-import threading
+import os
+import socket
+from datetime import timedelta
+from typing import Optional, List
+
 from tornado.httpserver import HTTPServer
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.netutil import bind_sockets, bind_unix_socket
+from tornado.process import cpu_count, fork_processes
 from tornado.web import Application
 
+from .handlers.v1.admin import ProfileHandler
 from .handlers.v1.health import HealthHandler
-from .handlers.v1.task import TasksHandler, TaskByIdHandler
-from .db import create_db_container, DbContainer
+from .handlers.v1.metrics import MetricsHandler
+from .handlers.v1.task import TasksHandler, TaskByIdHandler, ExpiringTasksHandler
+from .admission import AdmissionControl
+from .change_sync import ChangeSync
+from .cluster import elect_shard, shard_path, SchedulerServer, ShardRouter
+from .db import create_db_container
 from .logger import app_log
+from .memory_store import MemoryTaskStore
+from .metrics import TASK_CACHE_ENTRIES
+from .notification import create_dispatcher
+from .response_cache import ResponseCache
 from .scheduling import TaskExpiryAlert
-from .config import Config
+from .store import TaskStore, MysqlTaskStore, STORE_MYSQL, STORE_MEMORY
+from .task_cache import create_task_cache
+from .write_coalescing import WriteCoalescer
+from .config import AdminConfig, AdmissionConfig, Config
+
+
+WARM_UP_BLOCKING = "blocking"
+WARM_UP_BACKGROUND = "background"
 
 
-def make_app(db_container: DbContainer):
+def make_app(store: TaskStore, compress_response: bool = True, response_cache: Optional[ResponseCache] = None,
+             scheduler=TaskExpiryAlert, admin: AdminConfig = AdminConfig(),
+             admission: AdmissionConfig = AdmissionConfig()):
+    task_handler_kwargs = dict(store=store, scheduler=scheduler, response_cache=response_cache)
     return Application([
         (HealthHandler.endpoint, HealthHandler),
-        (TasksHandler.endpoint, TasksHandler, dict(tasks=db_container.tasks, database=db_container.database, scheduler=TaskExpiryAlert)),
-        (TaskByIdHandler.endpoint, TaskByIdHandler, dict(tasks=db_container.tasks, database=db_container.database, scheduler=TaskExpiryAlert)),
-    ])
+        (MetricsHandler.endpoint, MetricsHandler),
+        (ProfileHandler.endpoint, ProfileHandler,
+         dict(max_seconds=admin.max_profile_seconds, sample_interval=admin.sample_interval)),
+        (TasksHandler.endpoint, TasksHandler, task_handler_kwargs),
+        (TaskByIdHandler.endpoint, TaskByIdHandler, task_handler_kwargs),
+        (ExpiringTasksHandler.endpoint, ExpiringTasksHandler, dict(store=store, scheduler=scheduler)),
+    ], compress_response=compress_response, admin_token=admin.token,
+        admission=AdmissionControl(admission) if admission.enabled else None)
+
+
+def task_cache_entries() -> dict:
+    tasks, stale = TaskExpiryAlert.get_cache_stats()
+    return {("tasks",): tasks, ("stale",): stale}
+
+
+def get_process_count(config: Config) -> int:
+    """
+    :param config: Config
+    :return: int, number of API server processes, Config.processes or the number of CPUs if it is 0
+    """
+    return config.processes or cpu_count()
 
 
 def main(config: Config):
-    db_container = create_db_container(config.mysql)
+    process_count = get_process_count(config)
+    if config.cluster.scheduler_shards > process_count:
+        raise ValueError(f"scheduler_shards ({config.cluster.scheduler_shards}) should not exceed processes ({process_count}).")
+    if config.store.backend == STORE_MEMORY and (process_count > 1 or config.snapshot.enabled or config.sync.enabled):
+        raise ValueError("The memory store only supports a single process, without snapshot and sync.")
+    sockets = bind_sockets(config.port)
+    task_id = 0
+    if process_count > 1:
+        # each child runs its own IOLoop and DB pool, dead children are restarted by the parent with the same task id
+        task_id = fork_processes(process_count)
+    serve(config, sockets, task_id)
+
 
-    async def connect_db():
-        await db_container.database.connect()
+def serve(config: Config, sockets: List[socket.socket], task_id: int = 0):
+    """
+    Run the API server on sockets in this process.
+    With multiple processes, tasks are partitioned by id % scheduler_shards. The process holding the lock file of a
+    shard owns TaskExpiryAlert of the shard and serves the events forwarded by the other processes over a Unix socket,
+    so each task is alerted once.
+
+    :param config: Config
+    :param sockets: listening sockets of the API server
+    :param task_id: int, task id of the forked process, the preferred shard to own
+    :return:
+    """
+    db_container = create_db_container(config.mysql)
+    if config.store.backend == STORE_MYSQL:
+        write_coalescer = WriteCoalescer(db_container.database, db_container.tasks, config.write_coalescing.window,
+                                         config.write_coalescing.max_batch) if config.write_coalescing.enabled else None
+        store = MysqlTaskStore(db_container, write_coalescer)
+    elif config.store.backend == STORE_MEMORY:
+        store = MemoryTaskStore(config.store.wal_path, config.store.flush_interval,
+                                compact_min_records=config.store.compact_min_records)
+    else:
+        raise ValueError(f"Unknown store backend {config.store.backend}.")
+    multi_process = get_process_count(config) > 1  # as processes are only forked then by main
+    shard_count = config.cluster.scheduler_shards
+    # shard_lock is kept referenced until serve returns, the lock is released when it is closed
+    shard_index, shard_lock = elect_shard(config.cluster.lock_path, shard_count, task_id) if multi_process else (0, None)
+    is_owner = shard_index is not None
+    dispatcher = create_dispatcher(config.notification) if is_owner else None
+    scheduler_server = None
+    router = ShardRouter(config.cluster.socket_path, shard_count, shard_index) if multi_process else None
+    snapshot_path = shard_path(config.snapshot.path, shard_index, shard_count) if is_owner else None
+    snapshot_callback = None
+    change_sync = ChangeSync(db_container, config.sync.interval, config.sync.batch_size,
+                             timedelta(seconds=config.sync.lag), shard_index, shard_count) \
+        if is_owner and config.sync.enabled else None
 
     async def start_up_event():
-        await TaskExpiryAlert.initialize(db_container)
+        if config.store.backend == STORE_MEMORY:
+            await TaskExpiryAlert.load_from_store(store)
+            return
+        if change_sync is not None:
+            await change_sync.mark()
+        if config.snapshot.enabled and await TaskExpiryAlert.restore(
+                db_container, snapshot_path, shard_index, shard_count, config.scheduler.warm_up_chunk_size):
+            return
+        await TaskExpiryAlert.initialize(db_container, shard_index, shard_count, config.scheduler.warm_up_chunk_size)
 
-    async def disconnect_db():
-        await db_container.database.disconnect()
+    async def save_snapshot():
+        try:
+            await TaskExpiryAlert.save_snapshot(db_container, snapshot_path, shard_index, shard_count,
+                                                timedelta(seconds=config.snapshot.lag))
+        except Exception as e:
+            app_log.error(f"Failed to save snapshot: {e}")
 
-    IOLoop.current().run_sync(connect_db)
-    IOLoop.current().run_sync(start_up_event)
-    threading.Thread(target=TaskExpiryAlert.scheduler).start()
+    IOLoop.current().run_sync(store.open)
+    if is_owner:
+        TaskExpiryAlert.set_task_cache(create_task_cache(config.scheduler.cache_backend))
+        TaskExpiryAlert.set_store(store)
+        TASK_CACHE_ENTRIES.set_function(task_cache_entries)
+        if config.scheduler.warm_up == WARM_UP_BACKGROUND:
+            IOLoop.current().spawn_callback(start_up_event)
+        elif config.scheduler.warm_up == WARM_UP_BLOCKING:
+            IOLoop.current().run_sync(start_up_event)
+        else:
+            raise ValueError(f"Unknown warm up mode {config.scheduler.warm_up}.")
+        dispatcher.start()
+        TaskExpiryAlert.set_dispatcher(dispatcher)
+        TaskExpiryAlert.start_scheduler(config.scheduler.mode)
+        if change_sync is not None:
+            change_sync.start()
+        if config.snapshot.enabled:
+            snapshot_callback = PeriodicCallback(save_snapshot, config.snapshot.interval * 1000)
+            snapshot_callback.start()
+        if multi_process:
+            scheduler_server = SchedulerServer()
+            scheduler_server.add_socket(bind_unix_socket(shard_path(config.cluster.socket_path, shard_index, shard_count)))
+            app_log.info(f"Process {os.getpid()} owns scheduler shard {shard_index}/{shard_count}.")
+    response_cache = None
+    if config.response_cache.enabled and multi_process:
+        # the cache of a process is only invalidated by the writes of the process, so it could serve stale tasks
+        if task_id == 0:
+            app_log.warning("The response cache is disabled with multiple processes.")
+    elif config.response_cache.enabled:
+        response_cache = ResponseCache(config.response_cache.max_entries, config.response_cache.ttl)
     try:
-        app = make_app(db_container)
-        app.listen(config.port)
-        # if config.processes < 2:
-        #     app.listen(config.port)
-        # else:
-        #     server = HTTPServer(app)
-        #     server.bind(config.port)
-        #     server.start(config.processes)
+        app = make_app(store, config.compress_response, response_cache, router or TaskExpiryAlert, config.admin,
+                       config.admission)
+        server = HTTPServer(app)
+        server.add_sockets(sockets)
         IOLoop.current().start()
     except Exception as e:
         app_log.error(e)
     finally:
-        IOLoop.current().run_sync(disconnect_db)
-        TaskExpiryAlert.stop_scheduler()
+        if router is not None:
+            router.close()
+        if is_owner:
+            if scheduler_server is not None:
+                scheduler_server.stop()
+            if change_sync is not None:
+                change_sync.stop()
+            if snapshot_callback is not None:
+                snapshot_callback.stop()
+                IOLoop.current().run_sync(save_snapshot)
+            TaskExpiryAlert.stop_scheduler()
+            IOLoop.current().run_sync(dispatcher.stop)
+        IOLoop.current().run_sync(store.close)
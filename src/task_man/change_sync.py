@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+
+import sqlalchemy
+from sqlalchemy import func, and_, or_
+from tornado.ioloop import IOLoop
+from tornado.locks import Event
+from tornado.util import TimeoutError
+
+from .db import DbContainer
+from .logger import app_log
+from .scheduling import TaskExpiryAlert
+
+
+class ChangeSync:
+    """
+    Incremental sync of the task cache with rows written outside of the handler hooks of this process,
+    e.g. by batch jobs or by other API instances, in the process owning TaskExpiryAlert.
+
+    Each poll reads the rows with update_dt >= (watermark - lag) through idx_task_update_dt_id, in batches ordered
+    by (update_dt, id), and applies them with TaskExpiryAlert.sync_tasks. The watermark is the clock of DB at the
+    start of the previous poll, and lag covers transactions committed after their update_dt. Rows already applied
+    within the lag window are skipped by their (id, update_dt).
+
+    Deleted rows have no update_dt, so they are not synced: TaskExpiryAlert checks the due tasks in the store with a
+    single `id IN (...)` query right before alerting them, and drops the deleted ones.
+    """
+    def __init__(self, db_container: DbContainer, interval: float = 5.0, batch_size: int = 1000,
+                 lag: timedelta = timedelta(minutes=1), shard_index: int = 0, shard_count: int = 1):
+        self.__database = db_container.database
+        self.__tasks = db_container.tasks
+        self.__interval = interval
+        self.__batch_size = batch_size
+        self.__lag = lag
+        self.__shard_index = shard_index
+        self.__shard_count = shard_count
+        self.__watermark: Optional[datetime] = None
+        self.__applied: Dict[int, datetime] = dict()  # {id: update_dt} of rows applied within the lag window
+        self.__stopped = Event()
+
+    async def mark(self):
+        """
+        Take the watermark from the clock of DB. Should be called before the task cache is loaded from DB.
+
+        :return:
+        """
+        self.__watermark = await self.__database.fetch_val("SELECT NOW(6)")
+
+    def start(self):
+        """
+        Start polling on the current IOLoop.
+
+        :return:
+        """
+        self.__stopped.clear()
+        IOLoop.current().spawn_callback(self.run)
+
+    def stop(self):
+        self.__stopped.set()
+
+    async def run(self):
+        while not self.__stopped.is_set():
+            try:
+                await self.poll()
+            except Exception as e:
+                app_log.error(f"Failed to sync task changes: {e}")
+            try:
+                await self.__stopped.wait(timedelta(seconds=self.__interval))
+            except TimeoutError:
+                pass
+
+    async def poll(self) -> int:
+        """
+        Apply the changed rows since the last poll.
+
+        :return: int, number of applied rows
+        """
+        watermark = await self.__database.fetch_val("SELECT NOW(6)")
+        if self.__watermark is None:
+            self.__watermark = watermark
+        since = self.__watermark - self.__lag
+        count = await self.__apply_changes(since)
+        self.__watermark = watermark
+        since = watermark - self.__lag
+        self.__applied = {id: update_dt for id, update_dt in self.__applied.items() if update_dt >= since}
+        return count
+
+    async def __apply_changes(self, since: datetime) -> int:
+        tasks = self.__tasks
+        query = sqlalchemy.select([tasks.c.id, tasks.c.title, tasks.c.expiry_dt, tasks.c.update_dt]) \
+            .where(tasks.c.update_dt >= since).order_by(tasks.c.update_dt, tasks.c.id).limit(self.__batch_size)
+        if self.__shard_count > 1:
+            query = query.where(func.mod(tasks.c.id, self.__shard_count) == self.__shard_index)
+        count = 0
+        last_row = None
+        while True:
+            batch_query = query
+            if last_row is not None:
+                batch_query = query.where(and_(
+                    tasks.c.update_dt >= last_row["update_dt"],
+                    or_(tasks.c.update_dt > last_row["update_dt"], tasks.c.id > last_row["id"]),
+                ))
+            rows = await self.__database.fetch_all(batch_query)
+            changed = [
+                (row["id"], row["title"], row["expiry_dt"]) for row in rows
+                if self.__applied.get(row["id"]) != row["update_dt"]
+            ]
+            if changed:
+                await TaskExpiryAlert.sync_tasks(changed)
+                count += len(changed)
+            for row in rows:
+                self.__applied[row["id"]] = row["update_dt"]
+            if len(rows) < self.__batch_size:
+                return count
+            last_row = rows[-1]
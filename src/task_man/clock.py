@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta
+from typing import Callable
+
+Clock = Callable[[], datetime]  # returns the current naive local datetime, like datetime.now
+
+
+class FakeClock:
+    """
+    Clock which only moves when it is advanced, to simulate expiry processing in tests and benchmarks without waiting.
+    """
+    def __init__(self, now: datetime):
+        self.__now = now
+
+    def __call__(self) -> datetime:
+        return self.__now
+
+    def advance(self, delta: timedelta):
+        """
+        :param delta: timedelta to move the clock forward
+        :return:
+        """
+        self.__now += delta
@@ -0,0 +1,285 @@
+import fcntl
+import json
+import socket
+from datetime import datetime
+from collections import defaultdict
+from heapq import merge
+from itertools import islice
+from typing import Optional, List, IO, Any, Dict, Tuple
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.iostream import IOStream, StreamClosedError
+from tornado.locks import Lock
+from tornado.tcpserver import TCPServer
+
+from .logger import app_log
+from .scheduling import TaskExpiryAlert
+from .task_cache import Task
+
+
+def elect_leader(lock_path: str) -> Optional[IO]:
+    """
+    Try to become the leader process by taking an exclusive lock on lock_path.
+    The lock is held until the returned file is closed or the process exits, so a restarted process can take over.
+
+    :param lock_path: str, path of the lock file
+    :return: the opened lock file if this process is the leader, otherwise None
+    """
+    lock_file = open(lock_path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def shard_path(path: str, shard_index: int, shard_count: int) -> str:
+    """
+    Return the lock file or socket path of a shard. It is the path itself when there is a single shard.
+    """
+    return path if shard_count == 1 else f"{path}.{shard_index}"
+
+
+def shard_of(id: int, shard_count: int) -> int:
+    return id % shard_count
+
+
+def elect_shard(lock_path: str, shard_count: int, preferred: int = 0) -> Tuple[Optional[int], Optional[IO]]:
+    """
+    Try to become the owner of a shard, starting from the preferred shard. A process owns at most one shard.
+
+    :param lock_path: str, base path of the lock files
+    :param shard_count: int, number of shards
+    :param preferred: int, e.g. the task id of the forked process
+    :return: (shard index, opened lock file), or (None, None) if all shards are owned by other processes
+    """
+    for i in range(shard_count):
+        shard_index = (preferred + i) % shard_count
+        lock_file = elect_leader(shard_path(lock_path, shard_index, shard_count))
+        if lock_file is not None:
+            return shard_index, lock_file
+    return None, None
+
+
+def encode_task(task: Task) -> list:
+    id, title, expiry_dt = task
+    return [id, title, expiry_dt.isoformat() if expiry_dt is not None else None]
+
+
+def decode_task(task: list) -> Task:
+    id, title, expiry_dt = task
+    return id, title, datetime.fromisoformat(expiry_dt) if expiry_dt is not None else None
+
+
+class SchedulerServer(TCPServer):
+    """
+    Serve task cache events forwarded by SchedulerClient of the other processes, in the process owning TaskExpiryAlert.
+
+    Protocol: newline-delimited JSON over a Unix socket.
+    request: {"seq": int, "op": str, "args": list}
+    reply: {"seq": int, "result": any} or {"seq": int, "error": str}
+    """
+    def __init__(self, scheduler=TaskExpiryAlert):
+        super().__init__()
+        self.__scheduler = scheduler
+
+    async def handle_stream(self, stream: IOStream, address: Any):
+        try:
+            while True:
+                message = json.loads(await stream.read_until(b"\n"))
+                try:
+                    reply = {"seq": message["seq"], "result": await self._dispatch(message["op"], message["args"])}
+                except Exception as e:
+                    app_log.error(f"Failed to handle {message['op']} from another process: {e}")
+                    reply = {"seq": message["seq"], "error": str(e)}
+                await stream.write(json.dumps(reply).encode("utf-8") + b"\n")
+        except StreamClosedError:
+            pass
+
+    async def _dispatch(self, op: str, args: list) -> Any:
+        if op == "add_task":
+            await self.__scheduler.add_task(*decode_task(args))
+        elif op == "add_tasks":
+            await self.__scheduler.add_tasks([decode_task(task) for task in args])
+        elif op == "update_tasks":
+            await self.__scheduler.update_tasks([decode_task(task) for task in args])
+        elif op == "sync_tasks":
+            await self.__scheduler.sync_tasks([decode_task(task) for task in args])
+        elif op == "remove_task":
+            await self.__scheduler.remove_task(*args)
+        elif op == "clear_all_tasks":
+            await self.__scheduler.clear_all_tasks()
+        elif op == "get_expiring_tasks":
+            until, limit = args
+            tasks = await self.__scheduler.get_expiring_tasks(datetime.fromisoformat(until), limit)
+            return [encode_task(task) for task in tasks]
+        else:
+            raise ValueError(f"Unknown op {op}.")
+        return None
+
+
+class SchedulerClient:
+    """
+    Forward task cache events of a worker process to the process owning TaskExpiryAlert over a Unix socket.
+    It has the same async interface as TaskExpiryAlert, so it can be passed to the handlers as scheduler.
+
+    Events are only logged if the owner cannot be reached, as the owner reloads tasks from DB when it restarts.
+    """
+    def __init__(self, socket_path: str, connect_retries: int = 50, retry_interval: float = 0.1):
+        self.__socket_path = socket_path
+        self.__connect_retries = connect_retries
+        self.__retry_interval = retry_interval
+        self.__stream: Optional[IOStream] = None
+        self.__connect_lock = Lock()
+        self.__seq = 0
+        self.__pending: Dict[int, Future] = dict()
+
+    async def add_task(self, id: int, title: str, expiry_dt: Optional[datetime]):
+        if expiry_dt is not None:
+            await self.__forward("add_task", encode_task((id, title, expiry_dt)))
+
+    async def add_tasks(self, tasks: List[Task]):
+        tasks = [encode_task(task) for task in tasks if task[2] is not None]
+        if tasks:
+            await self.__forward("add_tasks", tasks)
+
+    async def update_tasks(self, tasks: List[Task]):
+        if tasks:
+            await self.__forward("update_tasks", [encode_task(task) for task in tasks])
+
+    async def sync_tasks(self, tasks: List[Task]):
+        if tasks:
+            await self.__forward("sync_tasks", [encode_task(task) for task in tasks])
+
+    async def remove_task(self, id: int):
+        await self.__forward("remove_task", [id])
+
+    async def clear_all_tasks(self):
+        await self.__forward("clear_all_tasks", [])
+
+    async def get_expiring_tasks(self, until: datetime, limit: int) -> List[Task]:
+        tasks = await self.call("get_expiring_tasks", [until.isoformat(), limit])
+        return [decode_task(task) for task in tasks]
+
+    async def call(self, op: str, args: list) -> Any:
+        """
+        Send a request to the owner process and wait for the result.
+
+        :param op: str, name of the operation
+        :param args: list of JSON serializable arguments
+        :return: result of the operation
+        """
+        stream = await self.__connect()
+        self.__seq += 1
+        seq = self.__seq
+        future = Future()
+        self.__pending[seq] = future
+        try:
+            await stream.write(json.dumps({"seq": seq, "op": op, "args": args}).encode("utf-8") + b"\n")
+        except StreamClosedError:
+            self.__pending.pop(seq, None)
+            raise
+        return await future
+
+    def close(self):
+        if self.__stream is not None:
+            self.__stream.close()
+
+    async def __forward(self, op: str, args: list):
+        try:
+            await self.call(op, args)
+        except Exception as e:
+            app_log.error(f"Failed to forward {op} to the scheduler process: {e}")
+
+    async def __connect(self) -> IOStream:
+        async with self.__connect_lock:
+            if self.__stream is not None and not self.__stream.closed():
+                return self.__stream
+            for attempt in range(self.__connect_retries):
+                stream = IOStream(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+                try:
+                    await stream.connect(self.__socket_path)
+                except StreamClosedError:
+                    await gen.sleep(self.__retry_interval)
+                    continue
+                self.__stream = stream
+                stream.io_loop.spawn_callback(self.__read, stream)
+                return stream
+            raise ConnectionError(f"Cannot connect to the scheduler process at {self.__socket_path}.")
+
+    async def __read(self, stream: IOStream):
+        try:
+            while True:
+                message = json.loads(await stream.read_until(b"\n"))
+                future = self.__pending.pop(message["seq"], None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(RuntimeError(message["error"]))
+                else:
+                    future.set_result(message["result"])
+        except StreamClosedError:
+            pending, self.__pending = self.__pending, dict()
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the scheduler process is closed."))
+
+
+class ShardRouter:
+    """
+    Route task cache events to the owners of the shards, partitioned by id % shard_count.
+    The shard owned by this process is updated directly, other shards through SchedulerClient.
+    It has the same async interface as TaskExpiryAlert, so it can be passed to the handlers as scheduler.
+    """
+    def __init__(self, socket_path: str, shard_count: int, local_shard: Optional[int] = None,
+                 local_scheduler=TaskExpiryAlert):
+        self.__shard_count = shard_count
+        self.__shards = [
+            local_scheduler if shard_index == local_shard
+            else SchedulerClient(shard_path(socket_path, shard_index, shard_count))
+            for shard_index in range(shard_count)
+        ]
+
+    async def add_task(self, id: int, title: str, expiry_dt: Optional[datetime]):
+        await self.__shards[shard_of(id, self.__shard_count)].add_task(id, title, expiry_dt)
+
+    async def add_tasks(self, tasks: List[Task]):
+        await gen.multi([
+            self.__shards[shard_index].add_tasks(shard_tasks)
+            for shard_index, shard_tasks in self.__partition(tasks).items()
+        ])
+
+    async def update_tasks(self, tasks: List[Task]):
+        await gen.multi([
+            self.__shards[shard_index].update_tasks(shard_tasks)
+            for shard_index, shard_tasks in self.__partition(tasks).items()
+        ])
+
+    async def sync_tasks(self, tasks: List[Task]):
+        await gen.multi([
+            self.__shards[shard_index].sync_tasks(shard_tasks)
+            for shard_index, shard_tasks in self.__partition(tasks).items()
+        ])
+
+    async def remove_task(self, id: int):
+        await self.__shards[shard_of(id, self.__shard_count)].remove_task(id)
+
+    async def clear_all_tasks(self):
+        await gen.multi([shard.clear_all_tasks() for shard in self.__shards])
+
+    async def get_expiring_tasks(self, until: datetime, limit: int) -> List[Task]:
+        shard_tasks = await gen.multi([shard.get_expiring_tasks(until, limit) for shard in self.__shards])
+        return list(islice(merge(*shard_tasks, key=lambda task: (task[2], task[0])), limit))
+
+    def close(self):
+        for shard in self.__shards:
+            if isinstance(shard, SchedulerClient):
+                shard.close()
+
+    def __partition(self, tasks: List[Task]) -> Dict[int, List[Task]]:
+        partitions = defaultdict(list)
+        for task in tasks:
+            partitions[shard_of(task[0], self.__shard_count)].append(task)
+        return partitions
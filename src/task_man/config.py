@@ -1,4 +1,4 @@
-from typing import NamedTuple
+from typing import NamedTuple, Optional, Tuple
 
 
 class MysqlConfig(NamedTuple):
@@ -10,7 +10,96 @@ class MysqlConfig(NamedTuple):
     pool_max_size: int = 20
 
 
+class SchedulerConfig(NamedTuple):
+    mode: str = "ioloop"  # "ioloop" or "thread"
+    cache_backend: str = "sorted_set"  # "sorted_set", "timing_wheel" or "compact"
+    warm_up: str = "blocking"  # "blocking" or "background", i.e. serve HTTP while loading tasks from DB
+    warm_up_chunk_size: int = 10000
+
+
+class SnapshotConfig(NamedTuple):
+    enabled: bool = False
+    path: str = "/tmp/task_man.snapshot"  # suffixed by the shard index with multiple shards
+    interval: float = 300.0  # seconds between snapshots, a snapshot is also written on shutdown
+    lag: float = 60.0  # seconds, rows updated since (watermark - lag) are re-read on restore
+
+
+class SyncConfig(NamedTuple):
+    enabled: bool = False  # apply rows written outside the API to the task cache
+    interval: float = 5.0  # seconds between polls
+    batch_size: int = 1000  # rows per query, and ids checked for deletion per poll
+    lag: float = 60.0  # seconds, rows updated since (last poll - lag) are re-read
+
+
+class NotificationConfig(NamedTuple):
+    sinks: Tuple[str, ...] = ("console",)  # "console", "file" and/or "webhook"
+    queue_size: int = 10000  # per sink, alerts are dropped when the queue is full
+    workers: int = 1  # per sink
+    worker_mode: str = "async"  # "async" or "thread"
+    batch_size: int = 100
+    max_retries: int = 3
+    retry_backoff: float = 0.5  # seconds, doubled on each retry
+    file_path: Optional[str] = None
+    webhook_url: Optional[str] = None
+
+
+class ResponseCacheConfig(NamedTuple):
+    enabled: bool = True  # forced off with multiple processes, as writes of other processes do not invalidate it
+    max_entries: int = 10000
+    ttl: float = 5.0  # seconds, bounds staleness for writes outside the API
+
+
+class ClusterConfig(NamedTuple):
+    lock_path: str = "/tmp/task_man.lock"  # the process holding the lock of a shard owns the scheduler of it
+    socket_path: str = "/tmp/task_man.sock"  # other processes forward task cache events to the owner through it
+    scheduler_shards: int = 1  # tasks are partitioned by id % scheduler_shards, each shard is owned by a process
+
+
+class WriteCoalescingConfig(NamedTuple):
+    enabled: bool = False  # merge concurrent single-task POST / PUT into batched statements
+    window: float = 0.002  # seconds to wait for more writes after the first one
+    max_batch: int = 500  # rows per batch, a full batch is written immediately
+
+
+class StoreConfig(NamedTuple):
+    backend: str = "mysql"  # "mysql", or "memory" for the embedded in-memory table (single process only)
+    wal_path: Optional[str] = "/tmp/task_man.wal"  # write-ahead log of "memory", None for no durability
+    flush_interval: float = 0.002  # seconds to wait for more writes before fsync of the write-ahead log
+    compact_min_records: int = 10000  # min number of records in the write-ahead log before compaction
+
+
+class AdmissionConfig(NamedTuple):
+    enabled: bool = False
+    read_limit: int = 16  # concurrently admitted requests per class, e.g. within the size of the DB pool in total
+    write_limit: int = 8
+    bulk_limit: int = 2  # bulk POST / PUT, DELETE of all tasks and streamed GET
+    queue_size: int = 64  # waiting requests per class, more requests are rejected at once
+    queue_timeout: float = 0.5  # seconds a request waits for admission before 503
+    retry_after: int = 1  # seconds, Retry-After header of 503
+    adaptive: bool = False  # adjust the limits by AIMD on the latency of admitted requests, up to the limits above
+    latency_target: float = 0.05  # seconds, latency beyond which the adaptive limits are decreased
+    min_limit: int = 1
+    backoff: float = 0.9  # factor of the multiplicative decrease
+
+
+class AdminConfig(NamedTuple):
+    token: Optional[str] = None  # bearer token of the admin endpoints and of Server-Timing, disabled if None
+    max_profile_seconds: float = 60.0
+    sample_interval: float = 0.005  # seconds between stack samples of the sampling profiler
+
+
 class Config(NamedTuple):
     mysql: MysqlConfig = MysqlConfig()
-    # processes: int = 1
+    store: StoreConfig = StoreConfig()
+    scheduler: SchedulerConfig = SchedulerConfig()
+    snapshot: SnapshotConfig = SnapshotConfig()
+    sync: SyncConfig = SyncConfig()
+    notification: NotificationConfig = NotificationConfig()
+    response_cache: ResponseCacheConfig = ResponseCacheConfig()
+    write_coalescing: WriteCoalescingConfig = WriteCoalescingConfig()
+    cluster: ClusterConfig = ClusterConfig()
+    admin: AdminConfig = AdminConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    processes: int = 1  # number of forked API server processes, 0 for the number of CPUs
     port: int = 8888
+    compress_response: bool = True  # gzip responses if requested by Accept-Encoding
@@ -1,14 +1,26 @@
-from typing import NamedTuple
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import NamedTuple, List, Dict, Iterable, Tuple, AsyncGenerator, Callable, Hashable, Any, Optional, Mapping
+from weakref import WeakKeyDictionary
 
+import aiomysql
 import sqlalchemy
 from databases import Database, DatabaseURL
+from sqlalchemy.dialects.mysql import pymysql
 
 from .config import MysqlConfig
+from .metrics import DB_POOL_CONNECTIONS, DB_POOL_WAIT
+from .tracing import SPAN_POOL, SPAN_QUERY, span
+
+
+DIALECT = pymysql.dialect(paramstyle="pyformat")
 
 
 class DbContainer(NamedTuple):
     database: Database
     tasks: sqlalchemy.Table
+    statements: "StatementCache"
 
 
 def create_db_container(db_config: MysqlConfig):
@@ -28,7 +40,354 @@ def create_db_container(db_config: MysqlConfig):
         sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
         sqlalchemy.Column("title", sqlalchemy.VARCHAR),
         sqlalchemy.Column("description", sqlalchemy.VARCHAR),
-        sqlalchemy.Column("expiry_dt", sqlalchemy.DATETIME)
+        sqlalchemy.Column("expiry_dt", sqlalchemy.DATETIME),
+        sqlalchemy.Column("update_dt", sqlalchemy.DATETIME),
     )
 
-    return DbContainer(database=database, tasks=tasks)
+    return DbContainer(database=database, tasks=tasks, statements=StatementCache(database))
+
+
+def instrument_pool(database: Database):
+    """
+    Record the checkout wait time and the utilization of the aiomysql pool of a connected database in the metrics.
+    The checkouts of encode/databases go through Pool._acquire, which is wrapped on the pool instance.
+
+    :param database: connected Database
+    :return:
+    """
+    pool = database._backend._pool
+    acquire = pool._acquire
+
+    async def timed_acquire():
+        started_at = time.perf_counter()
+        try:
+            with span(SPAN_POOL):
+                return await acquire()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started_at)
+
+    pool._acquire = timed_acquire
+    DB_POOL_CONNECTIONS.set_function(lambda: {
+        ("open",): pool.size, ("in_use",): pool.size - pool.freesize, ("max",): pool.maxsize,
+    })
+
+
+async def get_auto_increment_increment(database: Database) -> int:
+    """
+    Read @@auto_increment_increment of the server once per Database, the step between consecutive auto-increment ids.
+
+    :param database: Database
+    :return: int
+    """
+    increment = _auto_increment_increments.get(database)
+    if increment is None:
+        increment = _auto_increment_increments[database] = \
+            int(await database.fetch_val("SELECT @@auto_increment_increment"))
+    return increment
+
+
+_auto_increment_increments: "WeakKeyDictionary[Database, int]" = WeakKeyDictionary()
+
+
+async def insert_many(database: Database, table: sqlalchemy.Table, rows: List[dict], chunk_size: int = 1000) -> List[int]:
+    """
+    Insert rows with multi-row INSERT statements of up to chunk_size rows, and return the assigned ids in order.
+    It relies on MySQL assigning auto-increment ids to the rows of a single multi-row INSERT from LAST_INSERT_ID()
+    in steps of @@auto_increment_increment, which holds for "simple inserts" in all innodb_autoinc_lock_mode.
+    Rows with an explicit "id" would make it a "mixed-mode insert", whose ids cannot be derived, so they are rejected.
+    Should be called within a transaction.
+
+    :param database: Database
+    :param table: sqlalchemy.Table with auto-increment "id"
+    :param rows: list of rows to be inserted without "id", missing columns are inserted as NULL
+    :param chunk_size: max number of rows per INSERT statement
+    :return: list of assigned ids, in the same order as rows
+    :raises ValueError: if a row contains "id"
+    """
+    columns = sorted({column for row in rows for column in row})
+    if "id" in columns:
+        raise ValueError("Rows to be inserted should not contain id.")
+    increment = await get_auto_increment_increment(database)
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = [{column: row.get(column) for column in columns} for row in rows[start:start + chunk_size]]
+        first_id = await database.execute(query=table.insert().values(chunk))
+        ids.extend(range(first_id, first_id + len(chunk) * increment, increment))
+    return ids
+
+
+async def fetch_by_ids(database: Database, table: sqlalchemy.Table, ids: Iterable[int], columns: List[str],
+                       for_update: bool = False, chunk_size: int = 1000) -> Dict[int, dict]:
+    """
+    Fetch the rows with given ids, with chunked `id IN (...)` queries.
+
+    :param database: Database
+    :param table: sqlalchemy.Table with primary key "id"
+    :param ids: ids of the rows
+    :param columns: names of the columns to be fetched, "id" is always fetched
+    :param for_update: lock the rows with SELECT ... FOR UPDATE, should be called within a transaction
+    :param chunk_size: max number of ids per query
+    :return: {id: row as dict}
+    """
+    ids = list(dict.fromkeys(ids))
+    selected = [table.c.id] + [table.c[column] for column in columns if column != "id"]
+    rows = dict()
+    for start in range(0, len(ids), chunk_size):
+        query = sqlalchemy.select(selected).where(table.c.id.in_(ids[start:start + chunk_size]))
+        if for_update:
+            query = query.with_for_update()
+        for row in await database.fetch_all(query=query):
+            rows[row["id"]] = dict(row)
+    return rows
+
+
+async def update_many(database: Database, table: sqlalchemy.Table, rows: List[dict], chunk_size: int = 500):
+    """
+    Update rows by "id" with set-based statements of up to chunk_size rows:
+    UPDATE table SET column = CASE id WHEN ... THEN ... ELSE column END, ... WHERE id IN (...)
+    Each row only updates the columns it contains. If an id appears more than once, the last row wins.
+    Should be called within a transaction.
+
+    :param database: Database
+    :param table: sqlalchemy.Table with primary key "id"
+    :param rows: list of rows to be updated, each containing "id"
+    :param chunk_size: max number of rows per UPDATE statement
+    :return:
+    """
+    merged = dict()
+    for row in rows:
+        merged.setdefault(row["id"], dict()).update(row)
+    rows = list(merged.values())
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        columns = sorted({column for row in chunk for column in row if column != "id"})
+        values = {
+            column: sqlalchemy.case(
+                {row["id"]: row[column] for row in chunk if column in row},
+                value=table.c.id,
+                else_=table.c[column],
+            )
+            for column in columns
+        }
+        if values:
+            query = table.update().where(table.c.id.in_([row["id"] for row in chunk])).values(**values)
+            await database.execute(query=query)
+
+
+def compile_query(query: sqlalchemy.sql.ClauseElement) -> Tuple[str, dict]:
+    """
+    Compile a SQLAlchemy Core statement to SQL string and arguments for the MySQL driver, like encode/databases does.
+
+    :param query: SQLAlchemy Core statement
+    :return: (sql, args)
+    """
+    compiled = query.compile(dialect=DIALECT)
+    args = compiled.construct_params()
+    for key, value in args.items():
+        if key in compiled._bind_processors:
+            args[key] = compiled._bind_processors[key](value)
+    return compiled.string, args
+
+
+async def iterate_unbuffered(database: Database, query: sqlalchemy.sql.ClauseElement,
+                             fetch_size: int = 500) -> AsyncGenerator[dict, None]:
+    """
+    Iterate rows of a query with a server-side (unbuffered) cursor, so that memory usage does not grow with the size
+    of the result. Unlike Database.iterate, the rows are not loaded to the client all at once.
+    The connection is occupied until the iteration ends, or until the generator is closed with aclose().
+
+    :param database: Database
+    :param query: SQLAlchemy Core statement
+    :param fetch_size: number of rows fetched from the server per round trip
+    :return: async generator of rows as dict
+    """
+    with span(SPAN_QUERY):
+        sql, args = compile_query(query)
+    async with database.connection() as connection:
+        cursor = await connection.raw_connection.cursor(aiomysql.SSCursor)
+        try:
+            await cursor.execute(sql, args)
+            columns = [description[0] for description in cursor.description]
+            while True:
+                rows = await cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+        finally:
+            await cursor.close()
+
+
+class CompiledStatement(NamedTuple):
+    sql: str
+    params: Dict[str, Any]  # bind values of the built statement, overridden by the values at execution time
+    bind_processors: Dict[str, Callable[[Any], Any]]
+
+
+class StatementCache:
+    """
+    Cache of compiled SQL of parameterized SQLAlchemy Core statements, keyed by the shape of the query.
+
+    encode/databases compiles the expression of every statement on each execution, which is a visible share of the
+    CPU time of simple requests. Here a statement is built with named bindparam() for its values and compiled once
+    per key, then executed on the raw connection of databases with the values bound at execution time.
+    Within a transaction of databases, the connection of the transaction is used.
+    Rows are returned as dict without the result processors of SQLAlchemy, as the driver already converts the
+    MySQL types of the tables, like iterate_unbuffered.
+    """
+    def __init__(self, database: Database, max_entries: int = 1024):
+        """
+        :param database: Database
+        :param max_entries: max number of compiled statements, least recently used ones are evicted
+        """
+        self.__database = database
+        self.__max_entries = max_entries
+        self.__statements: "OrderedDict[Hashable, CompiledStatement]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, key: Hashable, build: Callable[[], sqlalchemy.sql.ClauseElement]) -> CompiledStatement:
+        """
+        Return the compiled statement of key, building and compiling it only if it is not cached.
+
+        :param key: shape of the query, must determine the statement built by build except the bind values
+        :param build: function building the statement, with named bindparam() for the values
+        :return: CompiledStatement
+        """
+        statement = self.__statements.get(key)
+        if statement is not None:
+            self.__statements.move_to_end(key)
+            self.hits += 1
+            return statement
+        self.misses += 1
+        compiled = build().compile(dialect=DIALECT)
+        statement = CompiledStatement(
+            sql=compiled.string,
+            params={name: bind.effective_value for bind, name in compiled.bind_names.items()},
+            bind_processors=dict(compiled._bind_processors),
+        )
+        self.__statements[key] = statement
+        while len(self.__statements) > self.__max_entries:
+            self.__statements.popitem(last=False)
+        return statement
+
+    @staticmethod
+    def bind(statement: CompiledStatement, values: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Return the arguments of the driver for the compiled statement with values.
+
+        :param statement: CompiledStatement
+        :param values: {name of bindparam: value}
+        :return: dict
+        """
+        args = {**statement.params, **values}
+        for name, process in statement.bind_processors.items():
+            args[name] = process(args[name])
+        return args
+
+    async def fetch_all(self, key: Hashable, build: Callable[[], sqlalchemy.sql.ClauseElement],
+                        values: Mapping[str, Any]) -> List[dict]:
+        async with self.__cursor(key, build, values) as cursor:
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in await cursor.fetchall()]
+
+    async def fetch_one(self, key: Hashable, build: Callable[[], sqlalchemy.sql.ClauseElement],
+                        values: Mapping[str, Any]) -> Optional[dict]:
+        async with self.__cursor(key, build, values) as cursor:
+            row = await cursor.fetchone()
+            return dict(zip([description[0] for description in cursor.description], row)) if row else None
+
+    async def execute(self, key: Hashable, build: Callable[[], sqlalchemy.sql.ClauseElement],
+                      values: Mapping[str, Any]) -> int:
+        """
+        Execute a statement without result rows.
+
+        :return: int, id of the inserted row, or number of affected rows, like Database.execute
+        """
+        async with self.__cursor(key, build, values) as cursor:
+            return cursor.lastrowid if cursor.lastrowid else cursor.rowcount
+
+    async def get_by_id(self, table: sqlalchemy.Table, id: int, columns: Iterable[str]) -> Optional[dict]:
+        """
+        Fetch columns of the row with id.
+
+        :param table: sqlalchemy.Table with primary key "id"
+        :param id: int, id of the row
+        :param columns: names of the columns
+        :return: row as dict, or None if not found
+        """
+        columns = tuple(columns)
+
+        def build():
+            return sqlalchemy.select([table.c[column] for column in columns]) \
+                .where(table.c.id == sqlalchemy.bindparam("pk"))
+        return await self.fetch_one(("get_by_id", table.name, columns), build, {"pk": id})
+
+    async def insert(self, table: sqlalchemy.Table, row: Mapping[str, Any]) -> int:
+        """
+        Insert a row.
+
+        :param table: sqlalchemy.Table with auto-increment "id"
+        :param row: row to be inserted
+        :return: int, id of the inserted row
+        """
+        columns = tuple(sorted(row))
+
+        def build():
+            return table.insert().values({column: sqlalchemy.bindparam(f"set_{column}") for column in columns})
+        return await self.execute(("insert", table.name, columns), build,
+                                  {f"set_{column}": row[column] for column in columns})
+
+    async def update_by_id(self, table: sqlalchemy.Table, id: int, values: Mapping[str, Any],
+                           expected: Optional[Mapping[str, Any]] = None, now_columns: Iterable[str] = ()) -> int:
+        """
+        Update columns of the row with id, optionally only if other columns have the expected values.
+
+        :param table: sqlalchemy.Table with primary key "id"
+        :param id: int, id of the row
+        :param values: {column: new value}, except "id"
+        :param expected: {column: value} the row should have to be updated
+        :param now_columns: names of DATETIME(6) columns set to NOW(6), the clock of DB
+        :return: int, number of changed rows
+        """
+        columns = tuple(sorted(column for column in values if column != "id"))
+        conditions = tuple(sorted(expected or ()))
+        now_columns = tuple(sorted(now_columns))
+
+        def build():
+            condition = sqlalchemy.and_(table.c.id == sqlalchemy.bindparam("pk"), *(
+                table.c[column] == sqlalchemy.bindparam(f"where_{column}") for column in conditions
+            ))
+            new_values = {column: sqlalchemy.bindparam(f"set_{column}") for column in columns}
+            new_values.update((column, sqlalchemy.func.now(6)) for column in now_columns)
+            return table.update().where(condition).values(new_values)
+        bind_values = {"pk": id}
+        bind_values.update((f"set_{column}", values[column]) for column in columns)
+        bind_values.update((f"where_{column}", expected[column]) for column in conditions)
+        return await self.execute(("update_by_id", table.name, columns, conditions, now_columns), build, bind_values)
+
+    async def delete_by_id(self, table: sqlalchemy.Table, id: int) -> int:
+        """
+        Delete the row with id.
+
+        :param table: sqlalchemy.Table with primary key "id"
+        :param id: int, id of the row
+        :return: int, number of deleted rows
+        """
+        def build():
+            return table.delete().where(table.c.id == sqlalchemy.bindparam("pk"))
+        return await self.execute(("delete_by_id", table.name), build, {"pk": id})
+
+    @asynccontextmanager
+    async def __cursor(self, key: Hashable, build: Callable[[], sqlalchemy.sql.ClauseElement],
+                       values: Mapping[str, Any]):
+        with span(SPAN_QUERY):
+            statement = self.compile(key, build)
+            args = self.bind(statement, values)
+        async with self.__database.connection() as connection:
+            cursor = await connection.raw_connection.cursor()
+            try:
+                await cursor.execute(statement.sql, args)
+                yield cursor
+            finally:
+                await cursor.close()
@@ -0,0 +1,76 @@
+import threading
+
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError
+
+from task_man.profiling import PROFILE_FORMAT_COLLAPSED, PROFILE_FORMAT_PSTATS, format_collapsed, profile_ioloop, \
+    sample_stacks
+from task_man.scheduling import TaskExpiryAlert
+from . import URI_HEADER
+from .base import BaseHandler
+
+DEFAULT_PROFILE_SECONDS = 5.0
+
+
+class ProfileHandler(BaseHandler):
+    endpoint = URI_HEADER + r"/admin/profile"
+    __running = False  # a single profile at a time per process
+
+    def initialize(self, max_seconds: float, sample_interval: float):
+        self.__max_seconds = max_seconds
+        self.__sample_interval = sample_interval
+
+    async def get(self):
+        """
+        Profile this process for a while, and respond the profile. The server keeps serving meanwhile.
+        Admin only, with "Authorization: Bearer <AdminConfig.token>".
+
+        parameters:
+        -   seconds: Optional, duration of the profile, 5 if not inputted, up to AdminConfig.max_profile_seconds.
+            format: Optional, "collapsed" (default) for the samples of the IOLoop thread and of the scheduler thread
+                (in "thread" mode) in the collapsed-stack format of flame graph tools, or "pstats" for a cProfile dump
+                of the IOLoop thread, to be loaded with pstats.Stats(path).
+        responses:
+            200:
+                description: the profile, text/plain for "collapsed", application/octet-stream for "pstats"
+            400:
+                description: if query arguments are invalid
+            403:
+                description: if the request is not authorized as admin
+            409:
+                description: if a profile is already running
+        :return:
+        """
+        if not self.is_admin():
+            raise HTTPError(403, "Admin only.")
+        try:
+            seconds = float(self.get_query_argument("seconds", str(DEFAULT_PROFILE_SECONDS)))
+        except ValueError:
+            raise HTTPError(400, f"Invalid seconds: {self.get_query_argument('seconds')}")
+        if not 0 < seconds <= self.__max_seconds:
+            raise HTTPError(400, f"seconds should be between 0 and {self.__max_seconds}.")
+        profile_format = self.get_query_argument("format", PROFILE_FORMAT_COLLAPSED)
+        if profile_format not in (PROFILE_FORMAT_COLLAPSED, PROFILE_FORMAT_PSTATS):
+            raise HTTPError(400, f"Invalid format: {profile_format}")
+        if ProfileHandler.__running:
+            raise HTTPError(409, "A profile is already running.")
+
+        ProfileHandler.__running = True
+        try:
+            if profile_format == PROFILE_FORMAT_PSTATS:
+                body = await profile_ioloop(seconds)
+                self.set_header("Content-Type", "application/octet-stream")
+                self.set_header("Content-Disposition", 'attachment; filename="task_man.pstats"')
+                self.write(body)
+                return
+            threads = {threading.get_ident(): "ioloop"}
+            scheduler_thread = TaskExpiryAlert.get_thread_ident()
+            if scheduler_thread is not None:
+                threads[scheduler_thread] = "scheduler"
+            stacks = await IOLoop.current().run_in_executor(
+                None, sample_stacks, threads, seconds, self.__sample_interval
+            )
+            self.set_header("Content-Type", "text/plain; charset=utf-8")
+            self.write(format_collapsed(stacks))
+        finally:
+            ProfileHandler.__running = False
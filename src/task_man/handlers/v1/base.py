@@ -0,0 +1,100 @@
+import hmac
+import time
+from typing import Any, Optional
+
+from tornado.web import RequestHandler
+
+from task_man.admission import AdmissionControl, AdmissionLimiter
+from task_man.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS, HTTP_REQUESTS_IN_FLIGHT
+from task_man.serialization import JSON_CONTENT_TYPE, dumps
+from task_man.tracing import CURRENT_TRACE, RequestTrace, SPAN_SERIALIZE, span
+
+SERVER_TIMING_HEADER = "X-Server-Timing"  # request header of admin requests opting in to Server-Timing
+
+
+class BaseHandler(RequestHandler):
+    endpoint: str  # URL pattern of the handler, used as the route label of the metrics
+    __in_flight = False
+    __trace: Optional[RequestTrace] = None
+    __admitted: Optional[AdmissionLimiter] = None
+    __admitted_at = 0.0
+
+    async def prepare(self):
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        self.__in_flight = True
+        if SERVER_TIMING_HEADER in self.request.headers and self.is_admin():
+            self.__trace = RequestTrace()
+            CURRENT_TRACE.set(self.__trace)
+        admission: Optional[AdmissionControl] = self.settings.get("admission")
+        admission_class = self.get_admission_class() if admission is not None else None
+        if admission_class is not None:
+            limiter = admission.get_limiter(admission_class)
+            if not await limiter.acquire():
+                self.set_status(503, "Server overloaded.")
+                self.set_header("Retry-After", str(admission.retry_after))
+                self.finish()
+                return
+            self.__admitted = limiter
+            self.__admitted_at = time.perf_counter()
+
+    def get_admission_class(self) -> Optional[str]:
+        """
+        Return the class of the request for admission control, one of task_man.admission.ADMISSION_READ,
+        ADMISSION_WRITE and ADMISSION_BULK, or None to always admit it, e.g. for health checks and metrics.
+        """
+        return None
+
+    def is_admin(self) -> bool:
+        """
+        Return True if the request carries "Authorization: Bearer <token>" with the admin token of the application
+        settings (AdminConfig.token). Always False if no admin token is configured.
+        """
+        token = self.settings.get("admin_token")
+        if not token:
+            return False
+        scheme, _, credentials = self.request.headers.get("Authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+    def finish(self, chunk: Any = None):
+        if self.__trace is not None and not self._headers_written:
+            self.set_header("Server-Timing", self.__trace.server_timing(self.request.request_time()))
+        return super().finish(chunk)
+
+    def on_finish(self):
+        """
+        Record the latency and the status code of the request in the metrics of its route.
+        """
+        self.__end_in_flight()
+        self.__release()
+        route, method = self.endpoint, self.request.method
+        HTTP_REQUEST_DURATION.labels(route, method).observe(self.request.request_time())
+        HTTP_REQUESTS.inc(label_values=(route, method, str(self.get_status())))
+
+    def on_connection_close(self):
+        self.__end_in_flight()
+
+    def __release(self):
+        """
+        Release the admission of the request. Only called on finish: after the client disconnects, the handler may
+        still be running its statements.
+        """
+        if self.__admitted is not None:
+            limiter, self.__admitted = self.__admitted, None
+            limiter.release(time.perf_counter() - self.__admitted_at)
+
+    def __end_in_flight(self):
+        if self.__in_flight:
+            self.__in_flight = False
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+
+    def write_json(self, obj: Any):
+        """
+        Write obj as JSON response with the fast JSON encoder of task_man.serialization.
+
+        :param obj: JSON serializable object, may contain datetime
+        :return:
+        """
+        self.set_header("Content-Type", JSON_CONTENT_TYPE)
+        with span(SPAN_SERIALIZE):
+            body = dumps(obj)
+        self.write(body)
@@ -1,9 +1,8 @@
-from tornado.web import RequestHandler
-
 from . import URI_HEADER
+from .base import BaseHandler
 
 
-class HealthHandler(RequestHandler):
+class HealthHandler(BaseHandler):
     endpoint = URI_HEADER + r"/health"
 
     def get(self):
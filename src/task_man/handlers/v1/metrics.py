@@ -0,0 +1,15 @@
+from task_man.metrics import CONTENT_TYPE, REGISTRY
+
+from . import URI_HEADER
+from .base import BaseHandler
+
+
+class MetricsHandler(BaseHandler):
+    endpoint = URI_HEADER + r"/metrics"
+
+    def get(self):
+        """
+        Metrics of this process in the Prometheus text format.
+        """
+        self.set_header("Content-Type", CONTENT_TYPE)
+        self.write(REGISTRY.render())
@@ -0,0 +1,222 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union, Mapping, Tuple, Any
+
+import sqlalchemy
+from sqlalchemy import Table, and_, or_, bindparam
+from tornado.web import HTTPError
+
+ORDER_BY_ID = "id"
+ORDER_BY_EXPIRY_DT = "expiry_dt"
+TASK_FIELDS = ("id", "title", "description", "expiry_dt")
+OPTIONAL_FIELDS = ("update_dt",)  # only responded if requested in "fields"
+DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_fields(args: Dict[str, List[bytes]], default: Tuple[str, ...] = TASK_FIELDS) -> Tuple[str, ...]:
+    """
+    Parse the "fields" query argument, a comma-separated list of fields to be responded.
+
+    :param args: query arguments
+    :param default: fields if "fields" is not inputted
+    :return: tuple of field names, default (all fields in TASK_FIELDS) if "fields" is not inputted
+    """
+    if "fields" not in args:
+        return default
+    fields = tuple(dict.fromkeys(
+        field.strip() for value in args["fields"] for field in value.decode("utf-8").split(",") if field.strip()
+    ))
+    invalid_fields = [field for field in fields if field not in TASK_FIELDS + OPTIONAL_FIELDS]
+    if invalid_fields or not fields:
+        raise HTTPError(400, f"Invalid fields: {','.join(invalid_fields)}")
+    return fields
+
+
+def parse_duration(value: str) -> timedelta:
+    """
+    Parse a duration query argument, in seconds or with a unit suffix: "90", "90s", "30m", "2h" or "7d".
+
+    :param value: str
+    :return: timedelta
+    """
+    unit = DURATION_UNITS.get(value[-1:])
+    try:
+        amount = float(value[:-1] if unit is not None else value)
+        if not 0 <= amount:
+            raise ValueError(value)
+        return timedelta(seconds=amount * (unit or 1))
+    except (ValueError, OverflowError):
+        raise HTTPError(400, f"Invalid duration: {value}")
+
+
+def encode_cursor(order_by: str, row: Mapping) -> str:
+    """
+    Encode the position after row as an opaque cursor token.
+
+    :param order_by: "id" or "expiry_dt"
+    :param row: last row of a page
+    :return: str, urlsafe base64 token
+    """
+    position = {"order_by": order_by, "id": row["id"]}
+    if order_by == ORDER_BY_EXPIRY_DT:
+        position["expiry_dt"] = row["expiry_dt"].isoformat()
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token: str) -> dict:
+    """
+    Decode a cursor token from encode_cursor.
+
+    :param token: str, urlsafe base64 token
+    :return: dict with "order_by", "id" and optionally "expiry_dt"
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        position["id"] = int(position["id"])
+        if position["order_by"] == ORDER_BY_EXPIRY_DT:
+            position["expiry_dt"] = datetime.fromisoformat(position["expiry_dt"])
+        elif position["order_by"] != ORDER_BY_ID:
+            raise ValueError(position["order_by"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPError(400, f"Invalid cursor: {e}")
+    return position
+
+
+class TaskListQuery:
+    """
+    Query arguments of listing tasks, with offset / keyset (cursor) pagination and filters on expiry_dt.
+
+    With a cursor, each page is an index range scan on PRIMARY (order by id) or on
+    idx_task_expiry_dt_id (order by expiry_dt, id), instead of scanning and discarding all rows before an offset.
+    """
+    def __init__(self, args: Dict[str, List[bytes]]):
+        self.fields = parse_fields(args)
+        self.limit = self.__get_int(args, "limit")
+        self.offset = self.__get_int(args, "offset")
+        self.order_by = self.__get(args, "order_by") or ORDER_BY_ID
+        if self.order_by not in (ORDER_BY_ID, ORDER_BY_EXPIRY_DT):
+            raise HTTPError(400, f"Invalid order_by: {self.order_by}")
+        self.expiry_from = self.__get_datetime(args, "expiry_from")
+        self.expiry_to = self.__get_datetime(args, "expiry_to")
+        self.has_expiry = self.__get_bool(args, "has_expiry")
+        self.stream = self.__get_bool(args, "stream") or False
+        if self.order_by == ORDER_BY_EXPIRY_DT:
+            if self.has_expiry is False:
+                raise HTTPError(400, "Cannot order by expiry_dt for tasks without expiry_dt.")
+            self.has_expiry = True
+
+        self.after_id = self.__get_int(args, "after_id")
+        self.after_expiry_dt: Optional[datetime] = None
+        cursor = self.__get(args, "cursor")
+        if cursor is not None:
+            position = decode_cursor(cursor)
+            if position["order_by"] != self.order_by:
+                raise HTTPError(400, "Cursor does not match order_by.")
+            self.after_id = position["id"]
+            self.after_expiry_dt = position.get("expiry_dt")
+        if self.after_id is not None and self.order_by == ORDER_BY_EXPIRY_DT and self.after_expiry_dt is None:
+            raise HTTPError(400, "after_id is only supported when ordering by id, use cursor instead.")
+
+    def query(self, tasks: Table) -> sqlalchemy.sql.Select:
+        """
+        Build the SELECT statement of a page, selecting only the requested fields and the fields of the cursor.
+        Values are named bindparam(), so the statement only depends on `shape()` and can be compiled once.
+
+        :param tasks: sqlalchemy.Table of tasks
+        :return: sqlalchemy Select
+        """
+        cursor_fields = (ORDER_BY_ID, ORDER_BY_EXPIRY_DT) if self.order_by == ORDER_BY_EXPIRY_DT else (ORDER_BY_ID,)
+        query = sqlalchemy.select([tasks.c[field] for field in dict.fromkeys(self.fields + cursor_fields)])
+        conditions = []
+        if self.has_expiry is True:
+            conditions.append(tasks.c.expiry_dt.isnot(None))
+        elif self.has_expiry is False:
+            conditions.append(tasks.c.expiry_dt.is_(None))
+        if self.expiry_from is not None:
+            conditions.append(tasks.c.expiry_dt >= bindparam("expiry_from", self.expiry_from))
+        if self.expiry_to is not None:
+            conditions.append(tasks.c.expiry_dt < bindparam("expiry_to", self.expiry_to))
+        if self.after_id is not None:
+            if self.order_by == ORDER_BY_EXPIRY_DT:
+                after_expiry_dt = bindparam("after_expiry_dt", self.after_expiry_dt)
+                conditions.append(tasks.c.expiry_dt >= after_expiry_dt)
+                conditions.append(or_(tasks.c.expiry_dt > after_expiry_dt, tasks.c.id > bindparam("after_id", self.after_id)))
+            else:
+                conditions.append(tasks.c.id > bindparam("after_id", self.after_id))
+        if conditions:
+            query = query.where(and_(*conditions))
+
+        if self.order_by == ORDER_BY_EXPIRY_DT:
+            query = query.order_by(tasks.c.expiry_dt, tasks.c.id)
+        else:
+            query = query.order_by(tasks.c.id)
+        if self.limit is not None:
+            query = query.limit(bindparam("limit", self.limit))
+        if self.offset is not None:
+            query = query.offset(bindparam("offset", self.offset))
+        return query
+
+    def shape(self) -> tuple:
+        """
+        Return the key of the statement built by `query()`, i.e. everything but the bind values.
+
+        :return: tuple
+        """
+        return self.fields, self.order_by, self.has_expiry, tuple(self.parameters())
+
+    def parameters(self) -> Dict[str, Any]:
+        """
+        Return the bind values of the statement built by `query()`.
+
+        :return: {name of bindparam: value}
+        """
+        parameters = dict(
+            expiry_from=self.expiry_from, expiry_to=self.expiry_to, after_id=self.after_id,
+            after_expiry_dt=self.after_expiry_dt if self.order_by == ORDER_BY_EXPIRY_DT else None,
+            limit=self.limit, offset=self.offset,
+        )
+        return {name: value for name, value in parameters.items() if value is not None}
+
+    def next_cursor(self, count: int, last_row: Optional[Union[Mapping, sqlalchemy.engine.RowProxy]]) -> Optional[str]:
+        """
+        Return the cursor of the next page, or None if this is the last page.
+
+        :param count: number of rows of this page
+        :param last_row: last row of this page
+        :return: str or None
+        """
+        if self.limit is None or count < self.limit or last_row is None:
+            return None
+        return encode_cursor(self.order_by, last_row)
+
+    @staticmethod
+    def __get(args: Dict[str, List[bytes]], name: str) -> Optional[str]:
+        return args[name][0].decode("utf-8") if name in args else None
+
+    @classmethod
+    def __get_int(cls, args: Dict[str, List[bytes]], name: str) -> Optional[int]:
+        value = cls.__get(args, name)
+        try:
+            return int(value) if value is not None else None
+        except ValueError:
+            raise HTTPError(400, f"Invalid {name}: {value}")
+
+    @classmethod
+    def __get_datetime(cls, args: Dict[str, List[bytes]], name: str) -> Optional[datetime]:
+        value = cls.__get(args, name)
+        try:
+            return datetime.fromisoformat(value) if value is not None else None
+        except ValueError:
+            raise HTTPError(400, f"Invalid {name}: {value}")
+
+    @classmethod
+    def __get_bool(cls, args: Dict[str, List[bytes]], name: str) -> Optional[bool]:
+        value = cls.__get(args, name)
+        if value is None:
+            return None
+        if value.lower() in ("true", "1"):
+            return True
+        if value.lower() in ("false", "0"):
+            return False
+        raise HTTPError(400, f"Invalid {name}: {value}")
@@ -1,60 +1,158 @@
 import json
-from typing import Union, Mapping
+from email.utils import parsedate_to_datetime
+from typing import Union, Mapping, List, Optional, Iterable
 from datetime import datetime
 from tornado.escape import json_decode
-from tornado.web import RequestHandler
+from tornado.iostream import StreamClosedError
+from tornado.web import HTTPError
 import sqlalchemy
-from sqlalchemy import Table
-from databases import Database
 
 from task_man.scheduling import TaskExpiryAlert, Task
+from task_man.admission import ADMISSION_BULK, ADMISSION_READ, ADMISSION_WRITE
 from task_man.logger import app_log
+from task_man.response_cache import ResponseCache, make_cached_response, make_etag, parse_etag
+from task_man.serialization import JSON_CONTENT_TYPE, dumps, project_row
+from task_man.store import TaskStore, parse_datetime
+from task_man.tracing import SPAN_DB, SPAN_PARSE, SPAN_SCHEDULER, SPAN_SERIALIZE, span
 from . import URI_HEADER
+from .base import BaseHandler
+from .pagination import TaskListQuery, parse_fields, parse_duration
 
-
-def process_row(row: Union[Mapping, sqlalchemy.engine.RowProxy]) -> dict:
-    row = dict(row)
-    if ("expiry_dt" in row) and (row["expiry_dt"] is not None):
-        row["expiry_dt"] = str(row["expiry_dt"])
-    return row
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+STREAM_CHUNK_SIZE = 500
+PATCH_FIELDS = ("title", "description", "expiry_dt")
+EXPIRING_FIELDS = ("id", "title", "expiry_dt")  # fields kept in the task cache
+EXPIRING_DEFAULT_LIMIT = 100
+EXPIRING_MAX_LIMIT = 1000
 
 
 def get_task_schedule(row: Union[Mapping, sqlalchemy.engine.RowProxy]) -> Task:
-    return row.get("id"), row.get("title"), datetime.fromisoformat(row.get("expiry_dt")) if row.get("expiry_dt") else None
+    return row.get("id"), row.get("title"), parse_datetime(row.get("expiry_dt"))
 
 
-class TasksHandler(RequestHandler):
+class TasksHandler(BaseHandler):
     endpoint = URI_HEADER + r"/tasks"
 
-    def initialize(self, tasks: Table, database: Database, scheduler: TaskExpiryAlert):
-        self.__tasks = tasks
-        self.__database = database
+    def initialize(self, store: TaskStore, scheduler: TaskExpiryAlert, response_cache: Optional[ResponseCache] = None):
+        self.__store = store
         self.__scheduler = scheduler
+        self.__response_cache = response_cache
+        self.__list_query: Optional[TaskListQuery] = None
+        self.__new_task: Optional[dict] = None
+
+    def get_admission_class(self) -> Optional[str]:
+        method = self.request.method
+        if method == "GET":
+            return ADMISSION_BULK if self.__get_list_query().stream or self.__accepts_ndjson() else ADMISSION_READ
+        if method == "POST":
+            return ADMISSION_BULK if "tasks" in self.__get_new_task() else ADMISSION_WRITE
+        return ADMISSION_BULK  # PUT and DELETE of all tasks
+
+    def __get_list_query(self) -> TaskListQuery:
+        if self.__list_query is None:
+            with span(SPAN_PARSE):
+                self.__list_query = TaskListQuery(self.request.query_arguments)
+        return self.__list_query
+
+    def __accepts_ndjson(self) -> bool:
+        return NDJSON_CONTENT_TYPE in self.request.headers.get("Accept", "")
+
+    def __get_new_task(self) -> dict:
+        if self.__new_task is None:
+            with span(SPAN_PARSE):
+                try:
+                    self.__new_task = json_decode(self.request.body)
+                except json.JSONDecodeError:
+                    body_arguments = self.request.body_arguments
+                    self.__new_task = {k: v[0].decode("utf-8") for k, v in body_arguments.items()}
+        return self.__new_task
 
     async def get(self):  # response all tasks
         """
-        Get all tasks or pagination with offset and limit as query arguments
+        Get all tasks, with pagination by offset and limit, or by cursor and limit, as query arguments
 
         parameters:
         -   limit: Optional, Number of records to fetch. Fetch from "offset" to last records if not inputted.
             offset: Optional, Position of the 1st record. Fetch from 1st record if not inputted.
+            order_by: Optional, "id" (default) or "expiry_dt". Ordering by "expiry_dt" only returns tasks with expiry_dt.
+            after_id: Optional, Fetch records with id greater than after_id when ordering by "id".
+            cursor: Optional, "next_cursor" of the previous page.
+            expiry_from: Optional, datetime string in isoformat, fetch records with expiry_dt >= expiry_from.
+            expiry_to: Optional, datetime string in isoformat, fetch records with expiry_dt < expiry_to.
+            has_expiry: Optional, "true" or "false", fetch records with non-null or null expiry_dt.
+            stream: Optional, "true" to stream the response in chunks with flat memory usage.
+            fields: Optional, comma-separated fields to be responded, e.g. "id,title". All fields if not inputted.
+        request headers:
+            Accept: Optional, "application/x-ndjson" to stream the response as newline-delimited JSON of tasks.
         responses:
             200:
                 description: list of tasks
+                response body:
+                {
+                    "tasks": [...],
+                    "next_cursor": cursor of the next page, only if limit is inputted and there may be more records
+                }
+            400:
+                description: if query arguments are invalid
         :return:
         """
-        args = self.request.query_arguments
-        query = self.__tasks.select()
-        if "limit" in args:
-            query = query.limit(int(args["limit"][0]))
-        if "offset" in args:
-            query = query.offset(int(args["offset"][0]))
-        rows = await self.__database.fetch_all(query=query)
-        self.write({"tasks": [process_row(row) for row in rows]})
+        list_query = self.__get_list_query()
+        ndjson = self.__accepts_ndjson()
+        if list_query.stream or ndjson:
+            await self.__stream_tasks(list_query, ndjson)
+            return
+
+        with span(SPAN_DB):
+            rows = await self.__store.list_tasks(list_query)
+        with span(SPAN_SERIALIZE):
+            response = {"tasks": [project_row(row, list_query.fields) for row in rows]}
+            next_cursor = list_query.next_cursor(len(rows), rows[-1] if rows else None)
+            if next_cursor is not None:
+                response["next_cursor"] = next_cursor
+        self.write_json(response)
+
+    async def __stream_tasks(self, list_query: TaskListQuery, ndjson: bool):
+        """
+        Stream tasks from a server-side cursor of the store, and flush the response every STREAM_CHUNK_SIZE tasks,
+        as JSON in the same format as non-streamed response, or as newline-delimited JSON of tasks.
+        """
+        if ndjson:
+            self.set_header("Content-Type", NDJSON_CONTENT_TYPE)
+        else:
+            self.set_header("Content-Type", JSON_CONTENT_TYPE)
+            self.write(b'{"tasks":[')
+        count = 0
+        last_row = None
+        rows = self.__store.iterate_tasks(list_query)
+        try:
+            try:
+                async for row in rows:
+                    if ndjson:
+                        self.write(dumps(project_row(row, list_query.fields)) + b"\n")
+                    else:
+                        self.write((b"," if count else b"") + dumps(project_row(row, list_query.fields)))
+                    count += 1
+                    last_row = row
+                    if count % STREAM_CHUNK_SIZE == 0:
+                        await self.flush()
+            finally:  # returns the connection of a server-side cursor to the pool
+                await rows.aclose()
+        except StreamClosedError:  # the client disconnected, not an error of the server
+            return
+        except Exception:
+            if count < STREAM_CHUNK_SIZE:  # nothing flushed yet, answered with the error page
+                raise
+            # the status line is already sent, so the response is cut off to be seen as incomplete by the client
+            app_log.exception(f"Failed to stream tasks after {count} tasks.")
+            self.request.connection.close()
+            return
+        if not ndjson:
+            next_cursor = list_query.next_cursor(count, last_row)
+            self.write(b"]" + (b',"next_cursor":' + dumps(next_cursor) if next_cursor else b"") + b"}")
 
-    async def post(self):  # create one task, return the task with id
+    async def post(self):  # create one task or bulk create tasks, return the task(s) with id
         """
-        Create new task
+        Create new task, or bulk create new tasks if request body contains "tasks"
 
         parameters: None
         request body:
@@ -63,6 +161,17 @@ class TasksHandler(RequestHandler):
             "description": string (optional),
             "expiry_dt": datetime string in isoformat with local timezone (optional)
         }
+        or
+        {
+            "tasks": [
+                {
+                    "title": string,
+                    "description": string (optional),
+                    "expiry_dt": datetime string in isoformat with local timezone (optional)
+                },
+                ...
+            ]
+        }
         responses:
             200:
                 response body:
@@ -70,18 +179,47 @@ class TasksHandler(RequestHandler):
                     "id": task_id of created task,
                     **request_body
                 }
+                or, for bulk create (in the same order as request body)
+                {
+                    "tasks": [
+                        {
+                            "id": task_id of created task,
+                            **task
+                        },
+                        ...
+                    ]
+                }
+            400:
+                description: if a task in request body contains "id", which is assigned by the store
         :return:
         """
-        try:
-            new_task = json_decode(self.request.body)
-        except json.JSONDecodeError:
-            body_arguments = self.request.body_arguments
-            new_task = {k: v[0].decode("utf-8") for k, v in body_arguments.items()}
+        new_task = self.__get_new_task()
+        new_tasks = new_task["tasks"] if "tasks" in new_task else [new_task]
+        if any("id" in task for task in new_tasks):  # ids are assigned by the store
+            raise HTTPError(400, "Invalid fields: id")
+        if "tasks" in new_task:
+            await self.__post_tasks(new_tasks)
+            return
 
-        query = self.__tasks.insert().values(**new_task)
-        new_id = await self.__database.execute(query=query)
-        await self.__scheduler.add_task(*get_task_schedule({**new_task, "id": new_id}))
-        self.write({"id": new_id, **new_task})
+        with span(SPAN_DB):
+            new_id = await self.__store.insert_task(new_task)
+        self.__invalidate([new_id])
+        with span(SPAN_SCHEDULER):
+            await self.__scheduler.add_task(*get_task_schedule({**new_task, "id": new_id}))
+        self.write_json({"id": new_id, **new_task})
+
+    async def __post_tasks(self, new_tasks: List[dict]):
+        """
+        Bulk create tasks in one transaction (multi-row INSERT statements with MySQL),
+        and register their expiry to the scheduler in one batch.
+        """
+        with span(SPAN_DB):
+            new_ids = await self.__store.insert_tasks(new_tasks)
+        self.__invalidate(new_ids)
+        created_tasks = [{"id": new_id, **new_task} for new_id, new_task in zip(new_ids, new_tasks)]
+        with span(SPAN_SCHEDULER):
+            await self.__scheduler.add_tasks([get_task_schedule(task) for task in created_tasks])
+        self.write_json({"tasks": created_tasks})
 
     async def put(self):  # bulk update of tasks
         """
@@ -103,15 +241,34 @@ class TasksHandler(RequestHandler):
         }
         responses:
             200:
+                response body:
+                {
+                    "updated": [ids of updated tasks],
+                    "discarded": [ids not found in DB]
+                }
         :return:
         """
-        input_tasks = json_decode(self.request.body)
-        async with self.__database.transaction():
-            for input_task in input_tasks["tasks"]:
-                id = input_task["id"]
-                query = self.__tasks.update().where(self.__tasks.c.id == id).values(**input_task)
-                await self.__database.execute(query=query)
-                await self.__scheduler.add_task(*get_task_schedule(input_task))
+        with span(SPAN_PARSE):
+            input_tasks = json_decode(self.request.body)["tasks"]
+        with span(SPAN_DB):
+            existing_tasks = await self.__store.update_tasks(input_tasks, ("title", "expiry_dt"))
+        matched_tasks = [input_task for input_task in input_tasks if input_task["id"] in existing_tasks]
+        self.__invalidate(existing_tasks)
+
+        schedules = dict()
+        for input_task in matched_tasks:
+            if ("title" in input_task) or ("expiry_dt" in input_task):
+                existing_task = existing_tasks[input_task["id"]]
+                existing_task.update(input_task)
+                schedules[input_task["id"]] = get_task_schedule(existing_task)
+        with span(SPAN_SCHEDULER):
+            await self.__scheduler.update_tasks(list(schedules.values()))
+        self.write_json({
+            "updated": list(dict.fromkeys(input_task["id"] for input_task in matched_tasks)),
+            "discarded": list(dict.fromkeys(
+                input_task["id"] for input_task in input_tasks if input_task["id"] not in existing_tasks
+            )),
+        })
 
     async def delete(self):  # delete all tasks
         """
@@ -122,42 +279,91 @@ class TasksHandler(RequestHandler):
                 description: if id is found in DB
         :return:
         """
-        query = self.__tasks.delete()
-        await self.__database.execute(query=query)
-        await self.__scheduler.clear_all_tasks()
+        with span(SPAN_DB):
+            await self.__store.delete_all_tasks()
+        if self.__response_cache is not None:
+            self.__response_cache.invalidate_all()
+        with span(SPAN_SCHEDULER):
+            await self.__scheduler.clear_all_tasks()
+
+    def __invalidate(self, ids: Iterable[int]):
+        if self.__response_cache is not None:
+            for id in ids:
+                self.__response_cache.invalidate(id)
 
 
-class TaskByIdHandler(RequestHandler):
+class TaskByIdHandler(BaseHandler):
     endpoint = URI_HEADER + r"/tasks/([0-9]+)"
 
-    def initialize(self, tasks: Table, database: Database, scheduler: TaskExpiryAlert):
-        self.__tasks: Table = tasks
-        self.__database = database
+    def initialize(self, store: TaskStore, scheduler: TaskExpiryAlert, response_cache: Optional[ResponseCache] = None):
+        self.__store = store
         self.__scheduler = scheduler
+        self.__response_cache = response_cache
+
+    def get_admission_class(self) -> Optional[str]:
+        return ADMISSION_READ if self.request.method == "GET" else ADMISSION_WRITE
 
     async def get(self, id: int):  # response one task
         """
         Get one task by id.
+        Responses are cached in process and invalidated on writes through the API.
 
+        parameters:
+        -   fields: Optional, comma-separated fields to be responded, e.g. "id,title". All fields if not inputted.
+        request headers:
+            If-None-Match: Optional, ETag of a previous response.
+            If-Modified-Since: Optional, Last-Modified of a previous response (update_dt of the task).
         responses:
             200:
                 description: if id is found in DB
+                response headers: ETag, Last-Modified
                 response body:
                 {
                     "id": task_id of created task,
                     **request_body
                 }
+            304:
+                description: if the task is not modified since the previous response
             404:
                 description: if id is not found in DB
         :return:
         """
-        query = self.__tasks.select().where(self.__tasks.c.id == id)
-        row = await self.__database.fetch_one(query=query)
-        if row is not None:
-            self.write(process_row(row))
-        else:
-            app_log.error(f"No task with id {id}.")
-            self.set_status(404, "Task not founded.")
+        id = int(id)
+        with span(SPAN_PARSE):
+            fields = parse_fields(self.request.query_arguments)
+        response = self.__response_cache.get(id, fields) if self.__response_cache is not None else None
+        if response is None:
+            token = self.__response_cache.token() if self.__response_cache is not None else None
+            with span(SPAN_DB):
+                row = await self.__store.get_task(id, dict.fromkeys(fields + ("update_dt",)))
+            if row is None:
+                app_log.error(f"No task with id {id}.")
+                self.set_status(404, "Task not founded.")
+                return
+            with span(SPAN_SERIALIZE):
+                body = dumps(project_row(row, fields))
+            if self.__response_cache is not None:
+                response = self.__response_cache.put(id, fields, body, row["update_dt"], token)
+            else:
+                response = make_cached_response(body, row["update_dt"])
+
+        self.set_header("Etag", response.etag)
+        if response.last_modified is not None:
+            self.set_header("Last-Modified", response.last_modified)
+        if self.check_etag_header() or self.__not_modified_since(response.last_modified):
+            self.set_status(304)
+            return
+        self.set_header("Content-Type", JSON_CONTENT_TYPE)
+        self.write(response.body)
+
+    def __not_modified_since(self, last_modified: Optional[datetime]) -> bool:
+        if_modified_since = self.request.headers.get("If-Modified-Since")
+        if last_modified is None or if_modified_since is None or "If-None-Match" in self.request.headers:
+            return False
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
 
     async def put(self, id: int):  # update specific task
         """
@@ -182,17 +388,95 @@ class TaskByIdHandler(RequestHandler):
                 description: if id is not found in DB
         :return:
         """
-        query = self.__tasks.select().where(self.__tasks.c.id == str(id))
-        task_exist = await self.__database.fetch_one(query=query)
-        if task_exist:
+        id = int(id)
+        with span(SPAN_PARSE):
             input_task = {**json_decode(self.request.body), "id": id}
-            query = self.__tasks.update().where(self.__tasks.c.id == str(id)).values(**input_task)
-            await self.__database.execute(query=query)
-            await self.__scheduler.add_task(*get_task_schedule(input_task))
-            self.write(input_task)
+        with span(SPAN_DB):
+            updated = await self.__store.update_task(id, input_task)
+        if updated:
+            if self.__response_cache is not None:
+                self.__response_cache.invalidate(id)
+            with span(SPAN_SCHEDULER):
+                await self.__scheduler.add_task(*get_task_schedule(input_task))
+            self.write_json(input_task)
         else:
             self.set_status(404, "Task not founded.")
 
+    async def patch(self, id: int):  # partially update specific task
+        """
+        Partially update existing task with a single UPDATE statement, whose affected row count decides the response.
+        The statement also sets update_dt to NOW(6) of DB, which is the version of the task for optimistic concurrency:
+        with If-Match, the task is only updated if its update_dt is unchanged, so concurrent updates are not lost.
+        The written row is read back for the new update_dt, and for the scheduler if title or expiry_dt is patched.
+
+        parameters: None
+        request headers:
+            If-Match: Optional, ETag of a previous GET or PATCH response, e.g. "2021-01-01T12:00:00.123456".
+        request body:
+        {
+            "title": string (optional),
+            "description": string (optional),
+            "expiry_dt": datetime string in isoformat with local timezone, or null (optional)
+        }
+        responses:
+            200:
+                description: if id is found in DB
+                response headers: ETag of the new version
+                response body:
+                {
+                    "id": task_id of updated task,
+                    **request_body,
+                    "update_dt": new update_dt of the task
+                }
+            400:
+                description: if request body or If-Match is invalid
+            404:
+                description: if id is not found in DB
+            412:
+                description: if the task was modified since the version of If-Match
+        :return:
+        """
+        id = int(id)
+        with span(SPAN_PARSE):
+            input_task = json_decode(self.request.body)
+            invalid_fields = [field for field in input_task if field not in PATCH_FIELDS]
+            if invalid_fields or not input_task:
+                raise HTTPError(400, f"Invalid fields: {','.join(invalid_fields)}")
+            if_match = self.__parse_if_match()
+        expected = {"update_dt": if_match} if if_match is not None else None
+
+        is_scheduled = ("title" in input_task) or ("expiry_dt" in input_task)
+        read_fields = ("title", "expiry_dt", "update_dt") if is_scheduled else ("update_dt",)
+        with span(SPAN_DB):
+            task = await self.__store.patch_task(id, input_task, expected, read_fields)
+        if task is None:
+            await self.__respond_not_updated(id, if_match)
+            return
+
+        if self.__response_cache is not None:
+            self.__response_cache.invalidate(id)
+        if is_scheduled:
+            with span(SPAN_SCHEDULER):  # an unchanged expiry_dt which was already alerted is not alerted again
+                await self.__scheduler.sync_tasks([get_task_schedule({"id": id, **task})])
+        self.set_header("Etag", make_etag(task["update_dt"]))
+        self.write_json({"id": id, **input_task, "update_dt": str(task["update_dt"])})
+
+    def __parse_if_match(self) -> Optional[datetime]:
+        if_match = self.request.headers.get("If-Match", "").strip()
+        if not if_match or if_match == "*":
+            return None
+        try:
+            return parse_etag(if_match)
+        except ValueError:
+            raise HTTPError(400, f"Invalid If-Match: {if_match}")
+
+    async def __respond_not_updated(self, id: int, if_match: Optional[datetime]):
+        if if_match is not None:
+            if await self.__store.get_task(id, ("id",)) is not None:
+                self.set_status(412, "Task modified.")
+                return
+        self.set_status(404, "Task not founded.")
+
     async def delete(self, id: int):  # delete one task
         """
         Delete existing task
@@ -204,9 +488,74 @@ class TaskByIdHandler(RequestHandler):
                 description: if id is not found in DB
         :return:
         """
-        query = self.__tasks.delete().where(self.__tasks.c.id == id)
-        is_deleted = await self.__database.execute(query=query)
+        id = int(id)
+        with span(SPAN_DB):
+            is_deleted = await self.__store.delete_task(id)
+        if self.__response_cache is not None:
+            self.__response_cache.invalidate(id)
         if not is_deleted:
             self.set_status(404, "Task not founded.")
         else:
-            await self.__scheduler.remove_task(id)
+            with span(SPAN_SCHEDULER):
+                await self.__scheduler.remove_task(id)
+
+
+class ExpiringTasksHandler(BaseHandler):
+    endpoint = URI_HEADER + r"/tasks/expiring"
+
+    def initialize(self, store: TaskStore, scheduler: TaskExpiryAlert):
+        self.__store = store
+        self.__scheduler = scheduler
+
+    def get_admission_class(self) -> Optional[str]:
+        return ADMISSION_READ
+
+    async def get(self):  # response tasks expiring soon
+        """
+        Get the tasks expiring within a duration from now, in order of expiry_dt, answered from the task cache of the
+        scheduler instead of a range scan on task.expiry_dt. The tasks are checked in DB with one query by primary key,
+        which drops tasks deleted outside the API and fetches the fields not kept in the task cache (e.g. description,
+        or title with the "compact" backend). So fewer than limit tasks may be returned.
+
+        parameters:
+        -   within: Duration from now, in seconds or with a unit, e.g. "90", "30m", "2h" or "7d".
+            limit: Optional, Max number of tasks, 100 if not inputted, up to 1000.
+            fields: Optional, comma-separated fields to be responded, "id,title,expiry_dt" if not inputted.
+        responses:
+            200:
+                description: list of tasks
+                response body:
+                {
+                    "tasks": [...]
+                }
+            400:
+                description: if query arguments are invalid
+        :return:
+        """
+        within = self.get_query_argument("within", None)
+        if within is None:
+            raise HTTPError(400, "within is required.")
+        within = parse_duration(within)
+        try:
+            limit = int(self.get_query_argument("limit", str(EXPIRING_DEFAULT_LIMIT)))
+        except ValueError:
+            raise HTTPError(400, f"Invalid limit: {self.get_query_argument('limit')}")
+        if not 0 < limit <= EXPIRING_MAX_LIMIT:
+            raise HTTPError(400, f"limit should be between 1 and {EXPIRING_MAX_LIMIT}.")
+        fields = parse_fields(self.request.query_arguments, default=EXPIRING_FIELDS)
+        try:
+            until = datetime.now() + within
+        except OverflowError:
+            raise HTTPError(400, f"Invalid within: {self.get_query_argument('within')}")
+
+        tasks = [
+            {"id": id, "title": title, "expiry_dt": expiry_dt}
+            for id, title, expiry_dt in await self.__scheduler.get_expiring_tasks(until, limit)
+        ]
+        columns = [field for field in fields if field not in ("id", "title", "expiry_dt")]
+        if "title" in fields and any(task["title"] is None for task in tasks):
+            columns.append("title")
+        if tasks:  # also without columns, as tasks deleted outside the API are only dropped from the cache when due
+            rows = await self.__store.get_tasks([task["id"] for task in tasks], columns)
+            tasks = [{**task, **rows[task["id"]]} for task in tasks if task["id"] in rows]  # skip deleted tasks
+        self.write_json({"tasks": [project_row(task, fields) for task in tasks]})
@@ -0,0 +1,313 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice, takewhile
+from typing import List, Dict, Iterable, Optional, Mapping, Any, AsyncGenerator, Iterator
+
+from sortedcontainers import SortedDict, SortedList
+from tornado.ioloop import IOLoop
+
+from .handlers.v1.pagination import TaskListQuery, ORDER_BY_EXPIRY_DT
+from .logger import app_log
+from .store import TaskStore, parse_datetime
+from .task_cache import Task
+from .write_coalescing import WriteQueue
+
+COLUMNS = ("id", "title", "description", "expiry_dt", "update_dt")
+DATETIME_COLUMNS = ("expiry_dt", "update_dt")
+ITERATE_CHUNK_SIZE = 500
+
+
+def encode_record(op: str, **values) -> bytes:
+    """
+    Encode a WAL record as a JSON line. Datetimes are written in isoformat.
+    """
+    return json.dumps({"op": op, **values}, default=datetime.isoformat, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class MemoryTaskStore(TaskStore):
+    """
+    Embedded TaskStore: the table is kept in memory, with an id index (SortedDict of rows by id) and an expiry index
+    (SortedList of (expiry_dt, id) of rows with expiry_dt), so that each method is an index lookup or range scan
+    like the MySQL statements it replaces, and runs atomically in the IOLoop thread.
+
+    With wal_path, it is made durable by an append-only write-ahead log of JSON lines (full rows for puts, ids for
+    deletes). Records of the writes arriving within flush_interval are appended and fsync-ed as one batch in a
+    single background thread, and each write returns after its batch is durable. Writes are visible to readers as
+    soon as they are applied in memory, i.e. before they are durable. When the log holds more records than
+    max(compact_min_records, number of rows), it is compacted: the live rows are written to a new file which
+    atomically replaces the log. On open, the log is replayed, and a torn last line (a crash during an append) is
+    truncated. Without wal_path, it is a purely in-memory table without dependencies, e.g. for tests and benchmarks.
+    """
+    def __init__(self, wal_path: Optional[str] = None, flush_interval: float = 0.002, max_batch: int = 500,
+                 compact_min_records: int = 10000):
+        """
+        :param wal_path: path of the write-ahead log, or None for a table without durability
+        :param flush_interval: seconds to wait for more writes after the first pending write, before fsync
+        :param max_batch: max number of writes per fsync
+        :param compact_min_records: min number of records in the log before compaction
+        """
+        self.__wal_path = wal_path
+        self.__compact_min_records = compact_min_records
+        self.__rows: SortedDict = SortedDict()  # {id: row}
+        self.__expiries = SortedList()  # (expiry_dt, id)
+        self.__next_id = 1
+        self.__wal_file = None
+        self.__wal_records = 0
+        self.__executor: Optional[ThreadPoolExecutor] = None  # a single thread, so batches are appended in order
+        self.__wal_queue = WriteQueue(self.__append_batch, flush_interval, max_batch) if wal_path else None
+        self.compactions = 0
+
+    async def open(self):
+        if self.__wal_path is None:
+            return
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task_man_wal")
+        await IOLoop.current().run_in_executor(self.__executor, self.__replay)
+        app_log.info(f"MemoryTaskStore replayed {self.__wal_records} records of {self.__wal_path}, "
+                     f"{len(self.__rows)} tasks")
+
+    async def close(self):
+        if self.__wal_file is None:
+            return
+        await self.__wal_queue.submit([])  # resolved after all the batches before it are appended
+        await IOLoop.current().run_in_executor(self.__executor, self.__wal_file.close)
+        self.__wal_file = None
+        self.__executor.shutdown()
+
+    async def get_task(self, id: int, fields: Iterable[str]) -> Optional[dict]:
+        row = self.__rows.get(id)
+        return {field: row[field] for field in fields} if row is not None else None
+
+    async def get_tasks(self, ids: Iterable[int], fields: Iterable[str]) -> Dict[int, dict]:
+        fields = ("id",) + tuple(field for field in fields if field != "id")
+        return {id: {field: self.__rows[id][field] for field in fields} for id in ids if id in self.__rows}
+
+    async def list_tasks(self, list_query: TaskListQuery) -> List[dict]:
+        return list(self.__select(list_query))
+
+    async def iterate_tasks(self, list_query: TaskListQuery) -> AsyncGenerator[dict, None]:
+        # rows are taken in chunks without awaiting, then the scan restarts after the last row of the chunk,
+        # as the indexes cannot be iterated across writes
+        remaining = list_query.limit
+        offset = list_query.offset
+        after = None
+        while remaining is None or remaining > 0:
+            chunk_size = ITERATE_CHUNK_SIZE if remaining is None else min(remaining, ITERATE_CHUNK_SIZE)
+            chunk = list(islice(self.__select(list_query, after, offset), chunk_size))
+            for row in chunk:
+                yield row
+            if len(chunk) < chunk_size:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            offset = None
+            after = chunk[-1]
+
+    async def insert_task(self, row: Mapping[str, Any]) -> int:
+        return (await self.insert_tasks([row]))[0]
+
+    async def insert_tasks(self, rows: List[Mapping[str, Any]]) -> List[int]:
+        if any("id" in row for row in rows):
+            raise ValueError("Rows to be inserted should not contain id.")
+        now = datetime.now()
+        new_rows = [self.__make_row(row, {"id": None, "title": None, "description": None, "expiry_dt": None,
+                                          "update_dt": now}) for row in rows]
+        for new_row in new_rows:
+            new_row["id"] = self.__next_id
+            self.__next_id += 1
+            self.__put(new_row)
+        await self.__log([encode_record("put", row=new_row) for new_row in new_rows])
+        return [new_row["id"] for new_row in new_rows]
+
+    async def update_task(self, id: int, row: Mapping[str, Any]) -> bool:
+        return bool(await self.update_tasks([{**row, "id": id}], ()))
+
+    async def update_tasks(self, rows: List[Mapping[str, Any]], fields: Iterable[str]) -> Dict[int, dict]:
+        fields = ("id",) + tuple(field for field in fields if field != "id")
+        merged = dict()
+        for row in rows:
+            if row["id"] in self.__rows:
+                merged.setdefault(row["id"], dict()).update(row)
+        existing_rows = {id: {field: self.__rows[id][field] for field in fields} for id in merged}
+        now = datetime.now()
+        new_rows = [self.__make_row(values, {**self.__rows[id], "update_dt": now}) for id, values in merged.items()]
+        for new_row in new_rows:  # applied only once all rows are valid
+            self.__put(new_row)
+        await self.__log([encode_record("put", row=new_row) for new_row in new_rows])
+        return existing_rows
+
+    async def patch_task(self, id: int, values: Mapping[str, Any], expected: Optional[Mapping[str, Any]] = None,
+                         fields: Iterable[str] = ("update_dt",)) -> Optional[dict]:
+        existing_row = self.__rows.get(id)
+        if existing_row is None or any(existing_row[column] != value for column, value in (expected or {}).items()):
+            return None
+        new_row = self.__make_row(values, {**existing_row, "update_dt": datetime.now()})
+        self.__put(new_row)
+        await self.__log([encode_record("put", row=new_row)])
+        return {field: new_row[field] for field in fields}
+
+    async def delete_task(self, id: int) -> bool:
+        if id not in self.__rows:
+            return False
+        self.__remove(id)
+        await self.__log([encode_record("del", id=id)])
+        return True
+
+    async def delete_all_tasks(self):
+        self.__rows.clear()
+        self.__expiries.clear()
+        await self.__log([encode_record("clear")])
+
+    async def get_schedules(self, after: datetime) -> List[Task]:
+        return [(id, self.__rows[id]["title"], expiry_dt)
+                for expiry_dt, id in self.__expiries.irange((after, float("inf")), inclusive=(False, False))]
+
+    def compact(self):
+        """
+        Replace the write-ahead log by the live rows, in the WAL thread after the batches already submitted.
+        The batches submitted later are appended to the new log: they may repeat writes already in the live rows,
+        which is harmless as records are idempotent.
+
+        :return:
+        """
+        if self.__wal_file is None:
+            return
+        records = [encode_record("meta", next_id=self.__next_id)]
+        records.extend(encode_record("put", row=row) for row in self.__rows.values())
+        self.__wal_records = 0  # counted from now, so the next compaction is not triggered meanwhile
+        IOLoop.current().run_in_executor(self.__executor, self.__rewrite, records)
+
+    def __make_row(self, values: Mapping[str, Any], row: dict) -> dict:
+        invalid_columns = [column for column in values if column not in COLUMNS]
+        if invalid_columns:
+            raise ValueError(f"Unknown columns: {','.join(invalid_columns)}")
+        row.update((column, value) for column, value in values.items() if column != "id")
+        for column in DATETIME_COLUMNS:
+            row[column] = parse_datetime(row[column])
+        return row
+
+    def __put(self, row: dict):
+        id = row["id"]
+        if id in self.__rows:
+            self.__remove(id)
+        self.__rows[id] = row
+        if row["expiry_dt"] is not None:
+            self.__expiries.add((row["expiry_dt"], id))
+        self.__next_id = max(self.__next_id, id + 1)
+
+    def __remove(self, id: int):
+        row = self.__rows.pop(id)
+        if row["expiry_dt"] is not None:
+            self.__expiries.remove((row["expiry_dt"], id))
+
+    def __select(self, list_query: TaskListQuery, after: Optional[Mapping] = None,
+                 offset: Optional[int] = None) -> Iterator[dict]:
+        """
+        Scan the rows of list_query in order, from the id or expiry index, like the SELECT of TaskListQuery.query.
+
+        :param list_query: TaskListQuery
+        :param after: last row of the previous chunk, overriding the position of list_query
+        :param offset: number of rows to skip, overriding the offset of list_query
+        :return: iterator of rows with the fields of list_query and of its cursor, up to the limit of list_query
+        """
+        if after is None:
+            after = {"id": list_query.after_id, "expiry_dt": list_query.after_expiry_dt}
+            offset = list_query.offset
+        if list_query.order_by == ORDER_BY_EXPIRY_DT:
+            fields = tuple(dict.fromkeys(list_query.fields + ("id", "expiry_dt")))
+            if after["id"] is not None:
+                keys = self.__expiries.irange((after["expiry_dt"], after["id"]), inclusive=(False, False))
+            elif list_query.expiry_from is not None:
+                keys = self.__expiries.irange((list_query.expiry_from, 0))
+            else:
+                keys = iter(self.__expiries)
+            if list_query.expiry_to is not None:
+                keys = takewhile(lambda key: key[0] < list_query.expiry_to, keys)
+            rows = (self.__rows[id] for expiry_dt, id in keys)
+        else:
+            fields = tuple(dict.fromkeys(list_query.fields + ("id",)))
+            keys = self.__rows.irange(after["id"], inclusive=(False, False)) if after["id"] is not None \
+                else iter(self.__rows)
+            rows = (self.__rows[id] for id in keys)
+        rows = (row for row in rows if self.__matches(list_query, row["expiry_dt"]))
+        start = offset or 0
+        stop = start + list_query.limit if list_query.limit is not None else None
+        return ({field: row[field] for field in fields} for row in islice(rows, start, stop))
+
+    @staticmethod
+    def __matches(list_query: TaskListQuery, expiry_dt: Optional[datetime]) -> bool:
+        if expiry_dt is None:
+            return not list_query.has_expiry and list_query.expiry_from is None and list_query.expiry_to is None
+        return list_query.has_expiry is not False \
+            and (list_query.expiry_from is None or expiry_dt >= list_query.expiry_from) \
+            and (list_query.expiry_to is None or expiry_dt < list_query.expiry_to)
+
+    async def __log(self, records: List[bytes]):
+        """
+        Append records to the write-ahead log in the next batch, and wait until they are durable.
+        """
+        if self.__wal_queue is None or not records:
+            return
+        self.__wal_records += len(records)
+        if self.__wal_records > max(self.__compact_min_records, len(self.__rows)):
+            self.compact()
+        await self.__wal_queue.submit(records)
+
+    async def __append_batch(self, batch: List[List[bytes]]) -> List[None]:
+        await IOLoop.current().run_in_executor(self.__executor, self.__append, b"".join(b"".join(records)
+                                                                                        for records in batch))
+        return [None] * len(batch)
+
+    def __append(self, data: bytes):  # in the WAL thread
+        if data:
+            self.__wal_file.write(data)
+            self.__wal_file.flush()
+            os.fsync(self.__wal_file.fileno())
+
+    def __rewrite(self, records: List[bytes]):  # in the WAL thread
+        temp_path = self.__wal_path + ".tmp"
+        try:
+            with open(temp_path, "wb") as temp_file:
+                temp_file.writelines(records)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self.__wal_path)
+        except OSError as e:
+            app_log.error(f"Failed to compact {self.__wal_path}: {e}")
+            return
+        self.__wal_file.close()
+        self.__wal_file = open(self.__wal_path, "ab")
+        self.compactions += 1
+
+    def __replay(self):  # in the WAL thread, before serving
+        valid_size = 0
+        if os.path.exists(self.__wal_path):
+            with open(self.__wal_path, "rb") as wal_file:
+                for line in wal_file:
+                    try:
+                        self.__apply(json.loads(line))
+                    except ValueError:
+                        if wal_file.read(1) or line.endswith(b"\n"):
+                            raise ValueError(f"Corrupted record at byte {valid_size} of {self.__wal_path}")
+                        app_log.warning(f"Truncating a torn record at byte {valid_size} of {self.__wal_path}")
+                        break
+                    valid_size += len(line)
+                    self.__wal_records += 1
+        self.__wal_file = open(self.__wal_path, "ab")
+        self.__wal_file.truncate(valid_size)
+
+    def __apply(self, record: dict):
+        op = record["op"]
+        if op == "put":
+            self.__put(self.__make_row(record["row"], {"id": record["row"]["id"]}))
+        elif op == "del":
+            if record["id"] in self.__rows:
+                self.__remove(record["id"])
+        elif op == "clear":
+            self.__rows.clear()
+            self.__expiries.clear()
+        elif op == "meta":
+            self.__next_id = max(self.__next_id, record["next_id"])
+        else:
+            raise ValueError(f"Unknown op {op}")
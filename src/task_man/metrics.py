@@ -0,0 +1,224 @@
+"""
+Process-wide metrics exposed by /v1/metrics in the Prometheus text format (version 0.0.4).
+
+Updates are plain int / float operations on preallocated slots without locks: metrics are updated on the IOLoop
+thread, except the scheduler lag in "thread" mode, where a rare lost update is acceptable.
+Labelled series are created on first use and reused afterwards, so observing does not allocate per request.
+Gauges backed by a function are sampled only when the metrics are rendered.
+With multiple processes, each process exposes its own metrics.
+"""
+from bisect import bisect_left
+from math import inf
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def format_value(value: float) -> str:
+    if value == inf:
+        return "+Inf"
+    if value == -inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    """
+    Base class of the metrics, holding a series per tuple of label values.
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._series = dict()  # {label values: series}
+
+    def render(self) -> List[str]:
+        """
+        :return: lines of the metric in the Prometheus text format
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for label_values, series in sorted(self._series.items()):
+            lines.extend(self._render_series(format_labels(self.label_names, label_values), label_values, series))
+        return lines
+
+    def _render_series(self, labels: str, label_values: tuple, series) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonic counter, e.g. COUNTER.inc(label_values=("GET",)).
+    """
+    type = "counter"
+
+    def inc(self, amount: float = 1, label_values: tuple = ()):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def get(self, label_values: tuple = ()) -> float:
+        return self._series.get(label_values, 0)
+
+    def _render_series(self, labels: str, label_values: tuple, value: float) -> Iterable[str]:
+        yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Gauge(Metric):
+    """
+    Gauge set by the application, or sampled from a function on rendering if set_function is called.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self.__function: Optional[Callable[[], Dict[tuple, float]]] = None
+
+    def set(self, value: float, label_values: tuple = ()):
+        self._series[label_values] = value
+
+    def inc(self, amount: float = 1, label_values: tuple = ()):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def dec(self, amount: float = 1, label_values: tuple = ()):
+        self._series[label_values] = self._series.get(label_values, 0) - amount
+
+    def get(self, label_values: tuple = ()) -> float:
+        return self._series.get(label_values, 0)
+
+    def set_function(self, function: Optional[Callable[[], Dict[tuple, float]]]):
+        """
+        Sample the gauge from function on rendering, replacing the values set by the application.
+
+        :param function: function returning {label values: value}, or None to stop sampling
+        :return:
+        """
+        self.__function = function
+
+    def render(self) -> List[str]:
+        if self.__function is not None:
+            self._series = dict(self.__function())
+        return super().render()
+
+    def _render_series(self, labels: str, label_values: tuple, value: float) -> Iterable[str]:
+        yield f"{self.name}{labels} {format_value(value)}"
+
+
+class HistogramSeries:
+    """
+    Bucket counts of a histogram series, preallocated so that observe only increments a slot.
+    """
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed buckets, e.g. HISTOGRAM.labels("GET").observe(0.01).
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def labels(self, *label_values: str) -> HistogramSeries:
+        """
+        :param label_values: values of the labels, in the order of label_names
+        :return: HistogramSeries of the label values, created on first use
+        """
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series.setdefault(label_values, HistogramSeries(self.upper_bounds))
+        return series
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_series(self, labels: str, label_values: tuple, series: HistogramSeries) -> Iterable[str]:
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds + (inf,), list(series.counts)):
+            cumulative += count
+            bucket_labels = format_labels(self.label_names + ("le",), label_values + (format_value(upper_bound),))
+            yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+        yield f"{self.name}_sum{labels} {format_value(series.sum)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.__metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.__metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        :return: all registered metrics in the Prometheus text format
+        """
+        lines = []
+        for metric in self.__metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "task_man_http_request_duration_seconds", "Latency of HTTP requests by route.", ("route", "method"),
+))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "task_man_http_requests_total", "HTTP requests by route and status code.", ("route", "method", "code"),
+))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "task_man_http_requests_in_flight", "HTTP requests being processed.",
+))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "task_man_db_pool_wait_seconds", "Time waiting to check out a connection from the DB pool.",
+))
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "task_man_db_pool_connections", "Connections of the DB pool by state (open, in_use, max).", ("state",),
+))
+TASK_CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "task_man_task_cache_entries", "Entries of the task cache by kind (tasks, stale).", ("kind",),
+))
+ADMISSION_LIMIT = REGISTRY.register(Gauge(
+    "task_man_admission_requests", "Admission control by class of requests and state (limit, in_use, waiting).",
+    ("class", "state"),
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "task_man_admission_rejected_total", "Requests rejected by admission control with 503, by class and reason.",
+    ("class", "reason"),
+))
+SCHEDULER_LAG = REGISTRY.register(Histogram(
+    "task_man_scheduler_lag_seconds", "Time from the due time (expiry_dt - 15 minutes) of a task to its alert.",
+    buckets=LAG_BUCKETS,
+))
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple, List, Optional, Dict
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+from tornado.queues import Queue, QueueFull
+
+from .config import NotificationConfig
+from .logger import app_log
+
+WORKER_MODE_ASYNC = "async"
+WORKER_MODE_THREAD = "thread"
+
+_thread_local = threading.local()
+
+
+class Alert(NamedTuple):
+    id: int
+    title: str
+    expiry_dt: datetime
+    alert_dt: datetime
+
+    @property
+    def message(self) -> str:
+        if self.expiry_dt > self.alert_dt:
+            return f"Your task (id:{self.id},title:\"{self.title}\") will be expired at {self.expiry_dt}!"
+        return f"Your task (id:{self.id},title:\"{self.title}\") is expired already at {self.expiry_dt}!"
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "expiry_dt": str(self.expiry_dt),
+            "alert_dt": str(self.alert_dt),
+            "message": self.message,
+        }
+
+
+class AlertSink:
+    """
+    Base class of the destinations of alerts.
+    Subclasses implement `send`, which delivers a batch of alerts and raises an exception on failure.
+    """
+    name = "sink"
+
+    def __init__(self, batch_size: int = 100):
+        self.batch_size = batch_size
+
+    async def send(self, alerts: List[Alert]):
+        raise NotImplementedError
+
+
+class ConsoleSink(AlertSink):
+    """
+    Log alerts to the console with app_log.
+    """
+    name = "console"
+
+    async def send(self, alerts: List[Alert]):
+        for alert in alerts:
+            app_log.info(alert.message)
+
+
+class FileSink(AlertSink):
+    """
+    Append alerts to a file as JSON lines.
+    Opening and writing the file are blocking, so they run in a thread of the sink instead of the event loop of the
+    worker, which is the IOLoop in "async" worker mode. The single thread also keeps the batches of concurrent
+    workers from interleaving in the file.
+    """
+    name = "file"
+
+    def __init__(self, path: str, batch_size: int = 100):
+        super().__init__(batch_size)
+        self.path = path
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file_sink")
+
+    async def send(self, alerts: List[Alert]):
+        lines = "".join(json.dumps(alert.to_json()) + "\n" for alert in alerts)
+        await IOLoop.current().run_in_executor(self.__executor, self.__append, lines)
+
+    def __append(self, lines: str):
+        with open(self.path, "a") as f:
+            f.write(lines)
+
+
+class WebhookSink(AlertSink):
+    """
+    POST a batch of alerts to an HTTP webhook as {"alerts": [...]}.
+    """
+    name = "webhook"
+
+    def __init__(self, url: str, batch_size: int = 100, request_timeout: float = 10.0):
+        super().__init__(batch_size)
+        self.url = url
+        self.request_timeout = request_timeout
+
+    async def send(self, alerts: List[Alert]):
+        await AsyncHTTPClient().fetch(
+            self.url,
+            method="POST",
+            headers={"Content-Type": "application/json"},
+            body=json.dumps({"alerts": [alert.to_json() for alert in alerts]}),
+            request_timeout=self.request_timeout,
+        )
+
+
+class SinkStats:
+    """
+    Counters of a sink. Only updated in the IOLoop thread.
+    """
+    def __init__(self):
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+
+class NotificationDispatcher:
+    """
+    Deliver alerts to sinks asynchronously, so that a slow sink does not stall the scheduler.
+
+    Each sink has its own bounded queue and pool of workers. Alerts are dropped (and counted) when the queue of a sink
+    is full instead of blocking the caller. Workers take up to `sink.batch_size` alerts from the queue at a time and
+    retry failed batches with exponential backoff.
+    Workers are coroutines on the IOLoop ("async" mode) or run sinks in a ThreadPoolExecutor ("thread" mode).
+    """
+    def __init__(self, sinks: List[AlertSink], queue_size: int = 10000, workers: int = 1,
+                 worker_mode: str = WORKER_MODE_ASYNC, max_retries: int = 3, retry_backoff: float = 0.5):
+        if worker_mode not in (WORKER_MODE_ASYNC, WORKER_MODE_THREAD):
+            raise ValueError(f"Unknown worker mode {worker_mode}.")
+        self.__sinks = sinks
+        self.__queue_size = queue_size
+        self.__workers = workers
+        self.__worker_mode = worker_mode
+        self.__max_retries = max_retries
+        self.__retry_backoff = retry_backoff
+        self.__queues: Dict[str, Queue] = dict()
+        self.__stats = {sink.name: SinkStats() for sink in sinks}
+        self.__io_loop: Optional[IOLoop] = None
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__io_thread_id: Optional[int] = None
+
+    def start(self):
+        """
+        Start the workers on the current IOLoop.
+
+        :return:
+        """
+        self.__io_loop = IOLoop.current()
+        self.__io_thread_id = threading.get_ident()
+        if self.__worker_mode == WORKER_MODE_THREAD:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__workers * len(self.__sinks))
+        for sink in self.__sinks:
+            queue = Queue(maxsize=self.__queue_size)
+            self.__queues[sink.name] = queue
+            for _ in range(self.__workers):
+                self.__io_loop.spawn_callback(self.__work, sink, queue)
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Wait until the queued alerts are delivered (or timeout), and then stop the workers.
+
+        :param timeout: float, seconds to wait for the queues to be drained
+        :return:
+        """
+        for queue in self.__queues.values():
+            try:
+                await queue.join(timeout=IOLoop.current().time() + timeout)
+            except gen.TimeoutError:
+                app_log.error(f"{queue.qsize()} alerts are not delivered before stopping.")
+            while not queue.empty():
+                queue.get_nowait()
+                queue.task_done()
+            for _ in range(self.__workers):
+                queue.put_nowait(None)
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+
+    def submit(self, alerts: List[Alert]):
+        """
+        Enqueue alerts to all sinks. Never blocks. Can be called from any thread.
+
+        :param alerts: list of Alert
+        :return:
+        """
+        if threading.get_ident() == self.__io_thread_id:
+            self.__enqueue(alerts)
+        else:
+            self.__io_loop.add_callback(self.__enqueue, alerts)
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Return counters and queue depth of each sink.
+
+        :return: {sink name: {counter name: int}}
+        """
+        return {
+            name: {
+                "queue_depth": self.__queues[name].qsize() if name in self.__queues else 0,
+                **vars(stats),
+            }
+            for name, stats in self.__stats.items()
+        }
+
+    def __enqueue(self, alerts: List[Alert]):
+        for name, queue in self.__queues.items():
+            stats = self.__stats[name]
+            for alert in alerts:
+                try:
+                    queue.put_nowait(alert)
+                    stats.enqueued += 1
+                except QueueFull:
+                    stats.dropped += 1
+
+    async def __work(self, sink: AlertSink, queue: Queue):
+        while True:
+            alert = await queue.get()
+            if alert is None:
+                queue.task_done()
+                return
+            batch = [alert]
+            while len(batch) < sink.batch_size and not queue.empty():
+                alert = queue.get_nowait()
+                if alert is None:  # leave the stop signal to another worker
+                    queue.task_done()
+                    queue.put_nowait(None)
+                    break
+                batch.append(alert)
+            try:
+                await self.__send_with_retry(sink, batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def __send_with_retry(self, sink: AlertSink, batch: List[Alert]):
+        stats = self.__stats[sink.name]
+        for attempt in range(self.__max_retries + 1):
+            try:
+                if self.__executor is None:
+                    await sink.send(batch)
+                else:
+                    await self.__io_loop.run_in_executor(self.__executor, _send_in_thread, sink, batch)
+                stats.sent += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.__max_retries:
+                    stats.failed += len(batch)
+                    app_log.error(f"Failed to send {len(batch)} alerts to {sink.name} sink: {e}")
+                    return
+                stats.retried += 1
+                await gen.sleep(self.__retry_backoff * 2 ** attempt)
+
+
+def _send_in_thread(sink: AlertSink, alerts: List[Alert]):
+    """
+    Run sink.send in a worker thread of "thread" mode, with an event loop owned by the thread.
+    """
+    loop = getattr(_thread_local, "loop", None)
+    if loop is None:
+        loop = _thread_local.loop = asyncio.new_event_loop()
+    loop.run_until_complete(sink.send(alerts))
+
+
+def create_sinks(config: NotificationConfig) -> List[AlertSink]:
+    """
+    Create sinks from notification config.
+
+    :param config: notification config
+    :return: list of AlertSink
+    """
+    sinks = []
+    for name in config.sinks:
+        if name == ConsoleSink.name:
+            sinks.append(ConsoleSink(config.batch_size))
+        elif name == FileSink.name:
+            sinks.append(FileSink(config.file_path, config.batch_size))
+        elif name == WebhookSink.name:
+            sinks.append(WebhookSink(config.webhook_url, config.batch_size))
+        else:
+            raise ValueError(f"Unknown alert sink {name}.")
+    return sinks
+
+
+def create_dispatcher(config: NotificationConfig) -> NotificationDispatcher:
+    """
+    Create NotificationDispatcher from notification config.
+
+    :param config: notification config
+    :return: NotificationDispatcher
+    """
+    return NotificationDispatcher(
+        create_sinks(config),
+        queue_size=config.queue_size,
+        workers=config.workers,
+        worker_mode=config.worker_mode,
+        max_retries=config.max_retries,
+        retry_backoff=config.retry_backoff,
+    )
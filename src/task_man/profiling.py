@@ -0,0 +1,87 @@
+"""
+On-demand profiling of a running server, for the admin endpoint /v1/admin/profile.
+
+sample_stacks is a sampling profiler: a separate thread reads the stacks of the target threads (the IOLoop thread,
+and the scheduler thread in "thread" mode) every interval through sys._current_frames, without tracing the profiled
+code, and counts the samples per stack in the collapsed-stack format of flame graph tools.
+profile_ioloop runs the deterministic cProfile on the IOLoop thread for a while, and returns a pstats dump.
+"""
+import cProfile
+import marshal
+import os
+import sys
+import time
+from types import FrameType
+from typing import Dict
+
+from tornado import gen
+
+PROFILE_FORMAT_COLLAPSED = "collapsed"
+PROFILE_FORMAT_PSTATS = "pstats"
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame: FrameType, root: str) -> str:
+    """
+    :param frame: innermost frame of a thread
+    :param root: name of the thread, the first element of the stack
+    :return: stack from the root to frame, separated by ";"
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+def sample_stacks(threads: Dict[int, str], seconds: float, interval: float) -> Dict[str, int]:
+    """
+    Sample the stacks of threads every interval for seconds. Blocking, should be run in a separate thread.
+
+    :param threads: {ident of thread: name of thread}
+    :param seconds: duration of the profile
+    :param interval: seconds between samples
+    :return: {collapsed stack: number of samples}
+    """
+    stacks = dict()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        for ident, name in threads.items():
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = collapse_stack(frame, name)
+                stacks[stack] = stacks.get(stack, 0) + 1
+        frames = frame = None  # do not keep the frames of other threads alive while sleeping
+        time.sleep(interval)
+    return stacks
+
+
+def format_collapsed(stacks: Dict[str, int]) -> str:
+    """
+    :param stacks: {collapsed stack: number of samples}
+    :return: one "stack samples" line per stack, most sampled first, e.g. for flamegraph.pl or speedscope
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+
+async def profile_ioloop(seconds: float) -> bytes:
+    """
+    Profile the current IOLoop thread with cProfile for seconds, while it keeps serving.
+
+    :param seconds: duration of the profile
+    :return: pstats dump, the format of pstats.Stats.dump_stats, to be loaded with pstats.Stats(path)
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        await gen.sleep(seconds)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
@@ -0,0 +1,132 @@
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional, Dict, Tuple, Hashable, Callable
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime]  # timezone-aware, in UTC
+    expire_at: float
+
+
+def make_etag(update_dt: datetime) -> str:
+    """
+    :param update_dt: update_dt of the row, which is the version of the task
+    :return: ETag of the version, e.g. "2021-01-01T12:00:00.123456" with the quotes, as expected by If-Match of PATCH
+    """
+    return '"' + update_dt.isoformat() + '"'
+
+
+def parse_etag(etag: str) -> datetime:
+    """
+    :param etag: ETag returned by make_etag
+    :return: update_dt of the ETag
+    :raises ValueError: if etag is not in the form of make_etag
+    """
+    if len(etag) < 2 or etag[0] != '"' or etag[-1] != '"':
+        raise ValueError(f"Not a quoted ETag: {etag}")
+    return datetime.fromisoformat(etag[1:-1])
+
+
+def make_cached_response(body: bytes, update_dt: Optional[datetime], expire_at: float = 0.0) -> CachedResponse:
+    """
+    Create CachedResponse with ETag and Last-Modified from update_dt of the row, or ETag from the body without it.
+
+    :param body: serialized response body
+    :param update_dt: naive datetime in local time from DB, or None
+    :param expire_at: time of expiry on the clock of the cache
+    :return: CachedResponse
+    """
+    etag = make_etag(update_dt) if update_dt is not None else '"' + hashlib.sha1(body).hexdigest() + '"'
+    last_modified = update_dt.astimezone(timezone.utc) if update_dt is not None else None
+    return CachedResponse(body, etag, last_modified, expire_at)
+
+
+class ResponseCache:
+    """
+    Bounded in-process LRU cache with TTL of serialized responses of tasks, keyed by task id and response fields.
+    Only accessed in the IOLoop thread, so it is not thread-safe.
+
+    Entries are invalidated by the handlers on writes. To avoid caching a row read before a concurrent write,
+    a response is only stored if no invalidation happened since `token()` was taken before reading the row.
+    The TTL bounds staleness for writes outside the API. Writes of other processes are not seen either, so serve does
+    not use it with multiple processes.
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.__max_entries = max_entries
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__entries: "OrderedDict[int, Dict[Hashable, CachedResponse]]" = OrderedDict()
+        self.__invalidations = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id: int, fields: Tuple[str, ...]) -> Optional[CachedResponse]:
+        """
+        Return the cached response of task id with fields, or None if not cached or expired.
+
+        :param id: int, id of the task
+        :param fields: fields of the response
+        :return: CachedResponse or None
+        """
+        responses = self.__entries.get(id)
+        response = responses.get(fields) if responses is not None else None
+        if response is None or response.expire_at <= self.__clock():
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(id)
+        self.hits += 1
+        return response
+
+    def token(self) -> int:
+        """
+        Return a token to be passed to `put`, should be taken before reading the row from DB.
+
+        :return: int
+        """
+        return self.__invalidations
+
+    def put(self, id: int, fields: Tuple[str, ...], body: bytes, update_dt: Optional[datetime],
+            token: int) -> CachedResponse:
+        """
+        Create a CachedResponse and store it, unless any entry is invalidated since token is taken.
+
+        :param id: int, id of the task
+        :param fields: fields of the response
+        :param body: serialized response body
+        :param update_dt: update_dt of the row
+        :param token: from `token()` before reading the row
+        :return: CachedResponse
+        """
+        response = make_cached_response(body, update_dt, self.__clock() + self.__ttl)
+        if token == self.__invalidations:
+            self.__entries.setdefault(id, dict())[fields] = response
+            self.__entries.move_to_end(id)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+        return response
+
+    def invalidate(self, id: int):
+        """
+        Remove all cached responses of task id.
+
+        :param id: int, id of the task
+        :return:
+        """
+        self.__invalidations += 1
+        self.__entries.pop(id, None)
+
+    def invalidate_all(self):
+        """
+        Remove all cached responses.
+
+        :return:
+        """
+        self.__invalidations += 1
+        self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
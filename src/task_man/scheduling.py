@@ -1,132 +1,246 @@
+import threading
 import time
 from datetime import datetime, timedelta
-from typing import Tuple, Optional
-from threading import RLock
-from sortedcontainers import SortedSet
+from heapq import heappop, heappush, merge
+from itertools import islice
+from typing import Optional, List, Set, Iterable, Dict, Tuple
+import sqlalchemy
+from sqlalchemy import func, and_, or_
+from tornado.ioloop import IOLoop
+from tornado.locks import Event
+from tornado.util import TimeoutError
 
-from .db import DbContainer
+from .clock import Clock
+from .db import DbContainer, fetch_by_ids, iterate_unbuffered
 from .logger import app_log
+from .metrics import SCHEDULER_LAG
+from .notification import Alert, NotificationDispatcher
+from .snapshot import read_snapshot, write_snapshot
+from .store import TaskStore
+from .task_cache import BaseTaskCache, Task, TaskCache
 
-Task = Tuple[int, str, Optional[datetime]]
 TIMEDELTA = timedelta(minutes=15)
+MIN_WAIT = timedelta(milliseconds=1)
 
+SCHEDULER_MODE_IOLOOP = "ioloop"
+SCHEDULER_MODE_THREAD = "thread"
 
-class TaskCache:
-    """
-    Thread-safe object to provide functionality of a task queue with fast read, write and delete.
+WARM_UP_CHUNK_SIZE = 10000
+SNAPSHOT_LAG = timedelta(minutes=1)
 
-    Let n be the number of tasks.
-    Space complexity: O(n)
-    Time complexity:
-        add_task: O(log n)
-        get_next_task: O(log n)
-        remove_task: O(log n)
-    """
-    def __init__(self):
-        self.__lock = RLock()
-        self.__tasks_schedules = SortedSet()  # {(expiry_dt, id)}
-        self.__tasks_dict = dict()  # {[id: (title, expiry_dt)]}
 
-    def add_task(self, task: Task):
+class TaskExpiryAlert:
+    __clock = staticmethod(datetime.now)  # Clock, a staticmethod so that plain functions are not bound
+    __stopped = False
+    __generation = 0
+    __task_cache = TaskCache()
+    __io_loop: Optional[IOLoop] = None
+    __wakeup: Optional[Event] = None
+    __thread: Optional[threading.Thread] = None  # scheduler thread in "thread" mode
+    __next_due: Optional[datetime] = None
+    __processed_at: Optional[datetime] = None  # clock of the last processing of due tasks
+    __dispatcher: Optional[NotificationDispatcher] = None
+    __store: Optional[TaskStore] = None
+    __warming_up = False
+    __touched_ids: Set[int] = set()  # ids written during warm-up
+    __alerted: Dict[int, Task] = dict()  # {id: Task} of alerted tasks not expired yet
+    __alerted_expiries: List[Tuple[datetime, int]] = []  # heap of (expiry_dt, id) to expire __alerted
+
+    @classmethod
+    def set_task_cache(cls, task_cache: BaseTaskCache):
         """
-        Add Task to the task queue.
-        If a Task with the same id already exists, an existing record will be replaced.
-        Otherwise will add a new record with key id.
+        Replace the task cache backend. Should be called before the scheduler is started.
 
-        :param task: Task
+        :param task_cache: task cache backend, e.g. from task_man.task_cache.create_task_cache
         :return:
         """
-        id, title, expiry_dt = task
-        self.__lock.acquire()
-        try:
-            if id in self.__tasks_dict:
-                self.__tasks_schedules.remove((self.__tasks_dict[id][1], id))
-            self.__tasks_dict[id] = (title, expiry_dt)
-            self.__tasks_schedules.add((expiry_dt, id))
-        finally:
-            self.__lock.release()
+        cls.__task_cache = task_cache
 
-    def get_next_task(self) -> Optional[Task]:
+    @classmethod
+    def set_dispatcher(cls, dispatcher: Optional[NotificationDispatcher]):
         """
-        Return the most earliest Task in terms of expiry datetime.
-        It will return a task if there is at least one task in self.__tasks_schedules
+        Deliver alerts through a started NotificationDispatcher. Alerts are logged directly if it is None.
 
-        :return: task: Task or None
+        :param dispatcher: NotificationDispatcher or None
+        :return:
         """
-        self.__lock.acquire()
-        try:
-            if self.__tasks_schedules:
-                expiry_dt, id = self.__tasks_schedules[0]
-                task_content = self.__tasks_dict.get(id)
-                task = id, task_content[0], task_content[1]
-            else:
-                task = None
-        finally:
-            self.__lock.release()
-        return task
+        cls.__dispatcher = dispatcher
 
-    def task_done(self, task: Task):
+    @classmethod
+    def set_clock(cls, clock: Clock = datetime.now):
         """
-        Remove task from self.__tasks_schedules and self.__tasks_dict.
+        Replace the clock deciding which tasks are due, e.g. by task_man.clock.FakeClock to simulate expiry processing
+        without waiting. After moving a fake clock, call wake_up so that the "ioloop" scheduler re-checks its deadline.
 
-        :param task: Task
+        :param clock: function returning the current datetime, datetime.now by default
         :return:
         """
-        id, title, expiry_dt = task
-        self.remove_task(id)
+        cls.__clock = staticmethod(clock)
+        cls.wake_up()
 
-    def remove_task(self, id: int):
+    @classmethod
+    def wake_up(cls):
         """
-        Remove task from both self.__tasks_schedules and self.__tasks_dict
+        Wake up the "ioloop" scheduler to process the due tasks now. Can be called from any thread.
 
-        :param task: Task
         :return:
         """
-        self.__lock.acquire()
-        try:
-            title, expiry_dt = self.__tasks_dict[id]
-            self.__tasks_schedules.discard((expiry_dt, id))
-            del self.__tasks_dict[id]
-        except KeyError:
-            pass
-        finally:
-            self.__lock.release()
+        if cls.__wakeup is not None and not cls.__stopped:
+            cls.__io_loop.add_callback(cls.__wakeup.set)
 
-    def clear_all_tasks(self):
+    @classmethod
+    def set_store(cls, store: Optional[TaskStore]):
         """
-        Clear all tasks from both self.__tasks_schedules and self.__tasks_dict
+        Set the store where due tasks are checked right before notifying user, so that tasks deleted outside the API
+        are not notified, and their titles are fetched when the task cache does not store titles.
 
-        :param task: Task
+        :param store: TaskStore or None
         :return:
         """
-        self.__lock.acquire()
+        cls.__store = store
+
+    @classmethod
+    async def initialize(cls, db_container: DbContainer, shard_index: int = 0, shard_count: int = 1,
+                         chunk_size: int = WARM_UP_CHUNK_SIZE):
+        """
+        Read to-be-expired tasks from DB and load into task_cache.
+        With shard_count > 1, only tasks of the shard (id % shard_count == shard_index) are loaded.
+
+        Only id, title and expiry_dt are selected, in chunks ordered by (expiry_dt, id) with keyset pagination.
+        The chunks are gathered and bulk loaded as a pre-sorted run once they are at least as many as the tasks
+        already loaded, so the earliest tasks are scheduled at once and each load merges runs in linear time.
+        It can run in background while the server is serving: tasks written during warm-up are not overwritten by
+        the loaded rows, and clear_all_tasks cancels the warm-up.
+
+        :param db_container: DbContainer
+        :param shard_index: int, shard owned by this process
+        :param shard_count: int, number of shards
+        :param chunk_size: int, number of rows per chunk
+        :return:
+        """
+        database = db_container.database
+        tasks = db_container.tasks
+        title = tasks.c.title if cls.__task_cache.stores_titles else sqlalchemy.literal_column("NULL").label("title")
+        query = sqlalchemy.select([tasks.c.id, title, tasks.c.expiry_dt]) \
+            .where(tasks.c.expiry_dt > cls.__clock()).order_by(tasks.c.expiry_dt, tasks.c.id).limit(chunk_size)
+        if shard_count > 1:
+            query = query.where(func.mod(tasks.c.id, shard_count) == shard_index)
+        cls.__touched_ids = set()
+        cls.__warming_up = True
+        count = 0
+        run: List[Task] = []  # chunks gathered but not loaded yet
         try:
-            self.__tasks_schedules = SortedSet()
-            self.__tasks_dict = dict()
-        except KeyError:
-            pass
+            last_row = None
+            while cls.__warming_up:
+                chunk_query = query
+                if last_row is not None:
+                    chunk_query = query.where(and_(
+                        tasks.c.expiry_dt >= last_row["expiry_dt"],
+                        or_(tasks.c.expiry_dt > last_row["expiry_dt"], tasks.c.id > last_row["id"]),
+                    ))
+                rows = await database.fetch_all(chunk_query)
+                if not rows or not cls.__warming_up:
+                    break
+                run.extend((row["id"], row["title"], row["expiry_dt"]) for row in rows)
+                if len(run) >= count:  # a run as large as the cache, which SortedList.update merges in linear time
+                    count += cls.__load_run(run)
+                    run = []
+                if len(rows) < chunk_size:
+                    break
+                last_row = rows[-1]
+            if run and cls.__warming_up:
+                count += cls.__load_run(run)
         finally:
-            self.__lock.release()
+            cls.__warming_up = False
+            cls.__touched_ids = set()
+        app_log.info(f"TaskExpiryAlert.initialize loaded {count} tasks")
 
+    @classmethod
+    async def load_from_store(cls, store: TaskStore):
+        """
+        Read to-be-expired tasks from an embedded store (e.g. MemoryTaskStore) and load into task_cache at once,
+        as its expiry index is already sorted in memory.
 
-class TaskExpiryAlert:
-    __stopped = False
-    __task_cache = TaskCache()
+        :param store: TaskStore
+        :return:
+        """
+        tasks = await store.get_schedules(cls.__clock())
+        cls.__task_cache.load_tasks(tasks)
+        if tasks:
+            cls.__rearm(tasks[0][2])
+        app_log.info(f"TaskExpiryAlert.load_from_store loaded {len(tasks)} tasks")
 
     @classmethod
-    async def initialize(cls, db_container: DbContainer):
+    async def restore(cls, db_container: DbContainer, path: str, shard_index: int = 0, shard_count: int = 1,
+                      chunk_size: int = WARM_UP_CHUNK_SIZE) -> bool:
         """
-        Read to-be-expired tasks from DB and load into task_cache.
+        Load task_cache from a snapshot file written by save_snapshot, then catch up with DB:
+        rows with update_dt newer than the watermark of the snapshot are re-read, and tasks of the snapshot deleted
+        since then are removed by checking their ids in DB.
+        Like initialize, it can run in background, tasks written meanwhile are not overwritten.
 
-        :return:
+        :param db_container: DbContainer
+        :param path: str, path of the snapshot file
+        :param shard_index: int, shard owned by this process
+        :param shard_count: int, number of shards
+        :param chunk_size: int, number of rows per query or per batch applied to task_cache
+        :return: bool, False if there is no usable snapshot and initialize should be called instead
         """
+        snapshot = await IOLoop.current().run_in_executor(None, read_snapshot, path)
+        if snapshot is None or (snapshot.shard_index, snapshot.shard_count) != (shard_index, shard_count):
+            return False
         database = db_container.database
         tasks = db_container.tasks
-        query = tasks.select().where(tasks.c.expiry_dt > datetime.now())
-        async for row in database.iterate(query=query):
-            task = dict(row)
-            await cls.add_task(task.get("id"), task.get("title"), task.get("expiry_dt"))
-        print('TaskExpiryAlert.initialize end')
+        now = cls.__clock()
+        cls.__touched_ids = set()
+        cls.__warming_up = True
+        try:
+            loaded = [task for task in snapshot.tasks if task[2] > now]
+            cls.__task_cache.load_tasks(loaded)
+            existing_ids = await fetch_by_ids(database, tasks, [task[0] for task in loaded], [], chunk_size=chunk_size)
+            deleted = [(id, title, None) for id, title, expiry_dt in loaded if id not in existing_ids]
+            cls.__apply_loaded(deleted)
+
+            query = sqlalchemy.select([tasks.c.id, tasks.c.title, tasks.c.expiry_dt]) \
+                .where(tasks.c.update_dt >= snapshot.watermark)
+            if shard_count > 1:
+                query = query.where(func.mod(tasks.c.id, shard_count) == shard_index)
+            changed = []
+            async for row in iterate_unbuffered(database, query):
+                expiry_dt = row["expiry_dt"]
+                changed.append((row["id"], row["title"], expiry_dt if expiry_dt is not None and expiry_dt > now else None))
+                if len(changed) >= chunk_size:
+                    cls.__apply_loaded(changed)
+                    changed = []
+            cls.__apply_loaded(changed)
+        finally:
+            cls.__warming_up = False
+            cls.__touched_ids = set()
+        app_log.info(f"TaskExpiryAlert.restore loaded {len(loaded)} tasks from {path}, "
+                     f"removed {len(deleted)} deleted tasks and caught up {snapshot.watermark}")
+        return True
+
+    @classmethod
+    async def save_snapshot(cls, db_container: DbContainer, path: str, shard_index: int = 0, shard_count: int = 1,
+                            lag: timedelta = SNAPSHOT_LAG):
+        """
+        Write the tasks in task_cache to a snapshot file.
+        The watermark is read from the clock of DB before copying task_cache, minus lag, so that the rows updated by
+        transactions committed after their update_dt are still re-read by restore.
+
+        :param db_container: DbContainer
+        :param path: str, path of the snapshot file
+        :param shard_index: int, shard owned by this process
+        :param shard_count: int, number of shards
+        :param lag: timedelta, max duration between update_dt of a row and the update of task_cache
+        :return:
+        """
+        if cls.__warming_up:
+            return
+        watermark = await db_container.database.fetch_val("SELECT NOW(6)") - lag
+        tasks = cls.__task_cache.get_tasks()
+        await IOLoop.current().run_in_executor(None, write_snapshot, path, tasks, watermark, shard_index, shard_count)
+        app_log.info(f"TaskExpiryAlert.save_snapshot saved {len(tasks)} tasks to {path}")
 
     @classmethod
     async def add_task(cls, id: int, title: str, expiry_dt: Optional[datetime]):
@@ -138,8 +252,97 @@ class TaskExpiryAlert:
         :param expiry_dt: datetime, expiry datetime of the task
         :return:
         """
+        cls.__touch([id])
         if expiry_dt is not None:
             cls.__task_cache.add_task((id, title, expiry_dt))
+            cls.__rearm(expiry_dt)
+
+    @classmethod
+    async def add_tasks(cls, tasks: List[Task]):
+        """
+        Add a batch of new tasks to task_cache under a single lock acquisition. Can be called from any thread.
+        Tasks without expiry_dt are ignored.
+
+        :param tasks: list of Task (id, title, expiry_dt)
+        :return:
+        """
+        cls.__touch(task[0] for task in tasks)
+        tasks = [task for task in tasks if task[2] is not None]
+        if tasks:
+            cls.__task_cache.add_tasks(tasks)
+            cls.__rearm(min(task[2] for task in tasks))
+
+    @classmethod
+    async def update_tasks(cls, tasks: List[Task]):
+        """
+        Apply a batch of latest snapshots of tasks to task_cache under a single lock acquisition.
+        Can be called from any thread. Tasks without expiry_dt are removed from task_cache.
+
+        :param tasks: list of Task (id, title, expiry_dt)
+        :return:
+        """
+        if tasks:
+            cls.__touch(task[0] for task in tasks)
+            cls.__task_cache.update_tasks(tasks)
+            expiry_dts = [task[2] for task in tasks if task[2] is not None]
+            if expiry_dts:
+                cls.__rearm(min(expiry_dts))
+
+    @classmethod
+    async def sync_tasks(cls, tasks: List[Task]):
+        """
+        Apply a batch of snapshots of tasks read from DB by the change sync, which may have been applied already.
+        Tasks already expired, and tasks already alerted with the same expiry_dt, are removed instead of added,
+        so that a row seen again does not alert the user twice.
+
+        :param tasks: list of Task (id, title, expiry_dt)
+        :return:
+        """
+        now = cls.__clock()
+        snapshots = []
+        for id, title, expiry_dt in tasks:
+            alerted = cls.__alerted.get(id)
+            if expiry_dt is not None and (expiry_dt <= now or (alerted is not None and alerted[2] == expiry_dt)):
+                expiry_dt = None
+            snapshots.append((id, title, expiry_dt))
+        await cls.update_tasks(snapshots)
+
+    @classmethod
+    def get_tasks(cls) -> List[Task]:
+        """
+        Return all tasks in task_cache sorted by (expiry_dt, id).
+
+        :return: list of Task
+        """
+        return cls.__task_cache.get_tasks()
+
+    @classmethod
+    def get_cache_stats(cls) -> Tuple[int, int]:
+        """
+        :return: (number of tasks, number of stale entries) of task_cache
+        """
+        return cls.__task_cache.get_stats()
+
+    @classmethod
+    async def get_expiring_tasks(cls, until: datetime, limit: int) -> List[Task]:
+        """
+        Return the earliest tasks expiring from now until `until`, sorted by (expiry_dt, id), from task_cache and
+        from the tasks already alerted ahead of their expiry_dt (within TIMEDELTA), without querying DB.
+        Title is None if task_cache does not store titles.
+
+        :param until: datetime, tasks with expiry_dt < until are returned
+        :param limit: int, max number of tasks
+        :return: list of Task
+        """
+        now = cls.__clock()
+        alerted = sorted(
+            (task for task in list(cls.__alerted.values()) if now < task[2] < until),
+            key=lambda task: (task[2], task[0]),
+        )
+        pending = [task for task in cls.__task_cache.get_tasks_until(until, limit + len(alerted)) if task[2] > now]
+        pending_ids = {task[0] for task in pending}
+        alerted = [task for task in alerted if task[0] not in pending_ids]  # rescheduled since alerted
+        return list(islice(merge(alerted, pending, key=lambda task: (task[2], task[0])), limit))
 
     @classmethod
     async def remove_task(cls, id: int):
@@ -151,56 +354,225 @@ class TaskExpiryAlert:
         :param expiry_dt: datetime, expiry datetime of the task
         :return:
         """
+        cls.__touch([id])
         cls.__task_cache.remove_task(id)
 
     @classmethod
     async def clear_all_tasks(cls):
         """
         Clear all tasks from task_cache. Can be called from any thread.
+        It cancels the warm-up, as the rows not yet loaded are deleted.
 
         :return:
         """
+        cls.__warming_up = False
         cls.__task_cache.clear_all_tasks()
+        cls.__alerted = dict()
+        cls.__alerted_expiries = []
+
+    @classmethod
+    def start_scheduler(cls, mode: str = SCHEDULER_MODE_IOLOOP):
+        """
+        Start the schedule job of TaskExpiryAlert.
+        In "ioloop" mode, the scheduler is a coroutine on the current IOLoop which sleeps until the next due task.
+        In "thread" mode, the scheduler polls the task cache in a separate thread.
+
+        :param mode: str, "ioloop" or "thread"
+        :return:
+        """
+        cls.__generation += 1
+        cls.__stopped = False
+        cls.__processed_at = None
+        cls.__io_loop = IOLoop.current()
+        if mode == SCHEDULER_MODE_IOLOOP:
+            cls.__wakeup = Event()
+            cls.__io_loop.spawn_callback(cls.run_scheduler)
+        elif mode == SCHEDULER_MODE_THREAD:
+            cls.__thread = threading.Thread(target=cls.scheduler, name="scheduler")
+            cls.__thread.start()
+        else:
+            raise ValueError(f"Unknown scheduler mode {mode}.")
+
+    @classmethod
+    async def run_scheduler(cls):
+        """
+        The main body of the schedule job of TaskExpiryAlert in "ioloop" mode.
+        It sleeps until the earliest (expiry_dt - TIMEDELTA) deadline, and is woken up earlier if a task with an
+        earlier deadline is added.
+
+        :return:
+        """
+        generation = cls.__generation
+        wakeup = cls.__wakeup
+        while not cls.__stopped and generation == cls.__generation:
+            wakeup.clear()
+            try:
+                cls.__process_due_tasks()
+                task = cls.__task_cache.get_next_task()
+                if task is None:
+                    cls.__next_due = None
+                    await wakeup.wait()
+                    continue
+                cls.__next_due = task[2] - TIMEDELTA
+                # at least MIN_WAIT: a task due exactly at the cutoff of pop_due_tasks is only popped after it
+                await wakeup.wait(max(cls.__next_due - cls.__clock(), MIN_WAIT))
+            except TimeoutError:
+                pass
+            except Exception as e:
+                app_log.error(e)
+        cls.__next_due = None
 
     @classmethod
     def scheduler(cls):
         """
-        The main body of the schedule job of TaskExpiryAlert.
+        The main body of the schedule job of TaskExpiryAlert in "thread" mode.
         It is long-living and should be called only when invoking a new thread.
 
         :return:
         """
+        generation = cls.__generation
         while True:
-            if cls.__stopped:
+            if cls.__stopped or generation != cls.__generation:
                 return
             try:
-                task = cls.__task_cache.get_next_task()
-                if (task is not None) and (task[2] - datetime.now() - TIMEDELTA).total_seconds() < 0:
-                    cls.__notify_user(*task)
-                    cls.__task_cache.task_done(task)
-                else:
+                if not cls.__process_due_tasks():
                     time.sleep(0.1)
             except Exception as e:
                 app_log.error(e)
 
+    @classmethod
+    def get_thread_ident(cls) -> Optional[int]:
+        """
+        :return: ident of the scheduler thread in "thread" mode if it is running, None in "ioloop" mode
+        """
+        thread = cls.__thread
+        return thread.ident if thread is not None and thread.is_alive() else None
+
     @classmethod
     def stop_scheduler(cls):
         cls.__stopped = True
+        if cls.__wakeup is not None:
+            cls.__io_loop.add_callback(cls.__wakeup.set)
 
     @classmethod
-    def __notify_user(cls, id: int, title: str, expiry_dt: datetime):
+    def __load_run(cls, tasks: List[Task]) -> int:
         """
-        Demo function for notifying user about task expiration.
-        In this demo, it will only print a message to the console.
-        In real situation, it may send an email or push a message to a MQ.
-        TODO: consider execute the task in ThreadPoolExecutor.
+        Bulk load tasks read from DB during warm-up, except the tasks written meanwhile.
 
-        :param id: int, id of the task
-        :param title: str, title of the task
-        :param expiry_dt: datetime, expiry datetime of the task
+        :param tasks: list of Task with expiry_dt, sorted by (expiry_dt, id)
+        :return: int, number of tasks read
+        """
+        cls.__task_cache.load_tasks(tasks, cls.__touched_ids)
+        cls.__rearm(tasks[0][2])
+        return len(tasks)
+
+    @classmethod
+    def __apply_loaded(cls, tasks: List[Task]):
+        """
+        Apply snapshots of tasks loaded during warm-up, except the tasks written meanwhile. Tasks without expiry_dt are
+        removed.
+
+        :param tasks: list of Task (id, title, expiry_dt)
+        :return:
+        """
+        if tasks and cls.__warming_up:
+            cls.__task_cache.update_tasks([task for task in tasks if task[0] not in cls.__touched_ids])
+
+    @classmethod
+    def __touch(cls, ids: Iterable[int]):
+        """
+        Record ids written during warm-up, which are skipped by the loader. Called before task_cache is updated.
+
+        :param ids: ids of the written tasks
+        :return:
+        """
+        if cls.__warming_up:
+            cls.__touched_ids.update(ids)
+
+    @classmethod
+    def __rearm(cls, expiry_dt: datetime):
+        """
+        Wake up the "ioloop" scheduler if the new deadline is earlier than the one it is sleeping on.
+        Can be called from any thread.
+
+        :param expiry_dt: datetime, expiry datetime of the added task
+        :return:
+        """
+        if cls.__wakeup is None or cls.__stopped:
+            return
+        next_due = cls.__next_due
+        if next_due is None or expiry_dt - TIMEDELTA < next_due:
+            cls.__io_loop.add_callback(cls.__wakeup.set)
+
+    @classmethod
+    def __process_due_tasks(cls) -> int:
+        """
+        Drain all tasks which will be expired within TIMEDELTA from task_cache and notify user in a single batch.
+
+        :return: int, number of notified tasks
+        """
+        now = cls.__clock()
+        since, cls.__processed_at = cls.__processed_at, now
+        tasks = cls.__task_cache.pop_due_tasks(now + TIMEDELTA)
+        for task in tasks:
+            id, title, expiry_dt = task
+            cls.__alerted[id] = task
+            heappush(cls.__alerted_expiries, (expiry_dt, id))
+        if tasks:
+            if cls.__store is not None and cls.__io_loop is not None:
+                cls.__io_loop.add_callback(cls.__notify_existing_tasks, tasks, since)
+            else:
+                cls.__notify_users(tasks, since)
+        while cls.__alerted_expiries and cls.__alerted_expiries[0][0] <= now:
+            expiry_dt, id = heappop(cls.__alerted_expiries)
+            if id in cls.__alerted and cls.__alerted[id][2] == expiry_dt:
+                del cls.__alerted[id]
+        return len(tasks)
+
+    @classmethod
+    async def __notify_existing_tasks(cls, tasks: List[Task], since: Optional[datetime] = None):
+        """
+        Check a batch of due tasks in the store with a single query right before notifying user, so that tasks deleted
+        outside the API (e.g. by batch jobs) are not notified, and fetch their titles if task_cache does not store them.
+        If the store cannot be read, user is notified of all the tasks, with the titles of task_cache.
+
+        :param tasks: list of Task (id, title, expiry_dt), title is None if task_cache does not store titles
+        :param since: datetime, see __notify_users
+        :return:
+        """
+        try:
+            if cls.__task_cache.stores_titles:
+                rows = await cls.__store.get_tasks([task[0] for task in tasks], [])
+                tasks = [task for task in tasks if task[0] in rows]
+            else:
+                rows = await cls.__store.get_tasks([task[0] for task in tasks], ["title"])
+                tasks = [(id, rows[id]["title"], expiry_dt) for id, title, expiry_dt in tasks if id in rows]
+        except Exception as e:
+            app_log.error(f"Failed to check due tasks in the store: {e}")
+        if tasks:
+            cls.__notify_users(tasks, since)
+
+    @classmethod
+    def __notify_users(cls, tasks: List[Task], since: Optional[datetime] = None):
+        """
+        Notify user about a batch of task expirations.
+        Alerts are handed to the NotificationDispatcher at once, which delivers them to the sinks (console, file,
+        webhook) asynchronously. Without a dispatcher, alerts are only printed to the console.
+
+        :param tasks: list of Task (id, title, expiry_dt)
+        :param since: datetime, the previous processing of due tasks: the scheduler lag is only observed for tasks due
+            after it, as tasks added when already due or missed before a restart are not delayed by the scheduler
         :return:
         """
-        if expiry_dt > datetime.now():
-            app_log.info(f"Your task (id:{id},title:\"{title}\") will be expired at {expiry_dt}!")
+        now = cls.__clock()
+        alerts = [Alert(id, title, expiry_dt, now) for id, title, expiry_dt in tasks]
+        if since is not None:
+            for id, title, expiry_dt in tasks:
+                due_dt = expiry_dt - TIMEDELTA
+                if due_dt >= since:
+                    SCHEDULER_LAG.observe((now - due_dt).total_seconds())
+        if cls.__dispatcher is not None:
+            cls.__dispatcher.submit(alerts)
         else:
-            app_log.info(f"Your task (id:{id},title:\"{title}\") is expired already at {expiry_dt}!")
+            for alert in alerts:
+                app_log.info(alert.message)
@@ -0,0 +1,46 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Mapping, Union
+
+import sqlalchemy
+
+try:
+    import orjson
+except ImportError:  # optional dependency, install with `pip install task_man[fast_json]`
+    orjson = None
+
+JSON_CONTENT_TYPE = "application/json; charset=UTF-8"
+
+
+def _default(obj: Any) -> str:
+    """
+    Serialize datetime like str(datetime), which is the format of datetime in responses.
+    """
+    if isinstance(obj, (datetime, date, Decimal)):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serialize obj to JSON bytes, with orjson if available, otherwise with the stdlib json.
+    Datetime values are serialized directly by the encoder, without converting rows beforehand.
+
+    :param obj: JSON serializable object, may contain datetime
+    :return: bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(obj, default=_default).encode("utf-8")
+
+
+def project_row(row: Union[Mapping, sqlalchemy.engine.RowProxy], fields: Iterable[str]) -> dict:
+    """
+    Pick fields from a DB row, without converting the values.
+
+    :param row: DB row
+    :param fields: names of the fields
+    :return: dict
+    """
+    return {field: row[field] for field in fields}
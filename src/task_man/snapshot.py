@@ -0,0 +1,116 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import NamedTuple, List, Optional
+
+from .task_cache import Task
+
+MAGIC = b"TMSN"
+VERSION = 2
+# magic, version, shard_index, shard_count, watermark (epoch microseconds), number of tasks
+HEADER = struct.Struct("<4sIiiqq")
+ITEM_SIZE = 8  # all arrays are little-endian int64, 8-byte aligned after the header
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class Snapshot(NamedTuple):
+    watermark: datetime
+    shard_index: int
+    shard_count: int
+    tasks: List[Task]  # sorted by (expiry_dt, id)
+
+
+def _to_epoch_us(dt: datetime) -> int:
+    return (dt - EPOCH) // MICROSECOND
+
+
+def _from_epoch_us(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+def _decode_offset(offset: int) -> int:
+    return offset if offset >= 0 else -1 - offset  # the end offset of a null title is stored as -1 - offset
+
+
+def _check_platform():
+    if sys.byteorder != "little" or array("q").itemsize != ITEM_SIZE:
+        raise RuntimeError("Snapshots are only supported on little-endian platforms with 8-byte int64 arrays.")
+
+
+def write_snapshot(path: str, tasks: List[Task], watermark: datetime, shard_index: int = 0, shard_count: int = 1):
+    """
+    Write tasks to a binary snapshot file, replacing the file atomically.
+
+    Layout after the header: ids (int64[n]), expiry_dt in epoch microseconds (int64[n]),
+    offsets of titles (int64[n + 1]) and the UTF-8 encoded titles. The end offset of a null title is stored as
+    -1 - offset, so that it is not read as "". Datetimes are naive, in the time zone of DB.
+
+    :param path: str, path of the snapshot file
+    :param tasks: list of Task with expiry_dt, sorted by (expiry_dt, id)
+    :param watermark: datetime, rows with update_dt earlier than it are reflected in tasks
+    :param shard_index: int, shard of the tasks
+    :param shard_count: int, number of shards
+    :return:
+    """
+    _check_platform()
+    ids = array("q", (task[0] for task in tasks))
+    expiry_dts = array("q", (_to_epoch_us(task[2]) for task in tasks))
+    offsets = array("q", [0])
+    titles = bytearray()
+    for task in tasks:
+        if task[1] is None:
+            offsets.append(-1 - len(titles))
+        else:
+            titles += task[1].encode("utf-8")
+            offsets.append(len(titles))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, shard_index, shard_count, _to_epoch_us(watermark), len(tasks)))
+        for values in (ids, expiry_dts, offsets):
+            values.tofile(f)
+        f.write(titles)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Optional[Snapshot]:
+    """
+    Read a snapshot file written by write_snapshot through mmap.
+
+    :param path: str, path of the snapshot file
+    :return: Snapshot, or None if the file does not exist or is not a valid snapshot
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, version, shard_index, shard_count, watermark, count = HEADER.unpack_from(buffer)
+            arrays_end = HEADER.size + ITEM_SIZE * (3 * count + 1)
+            if magic != MAGIC or version != VERSION or size < arrays_end:
+                return None
+            _check_platform()
+            ids, expiry_dts, offsets = array("q"), array("q"), array("q")
+            ids.frombytes(buffer[HEADER.size:HEADER.size + ITEM_SIZE * count])
+            expiry_dts.frombytes(buffer[HEADER.size + ITEM_SIZE * count:HEADER.size + ITEM_SIZE * 2 * count])
+            offsets.frombytes(buffer[HEADER.size + ITEM_SIZE * 2 * count:arrays_end])
+            if size != arrays_end + _decode_offset(offsets[count]):
+                return None
+            titles = buffer[arrays_end:]
+    tasks = []
+    for i in range(count):
+        end = offsets[i + 1]
+        title = None if end < 0 else titles[_decode_offset(offsets[i]):end].decode("utf-8")
+        tasks.append((ids[i], title, _from_epoch_us(expiry_dts[i])))
+    return Snapshot(_from_epoch_us(watermark), shard_index, shard_count, tasks)
@@ -0,0 +1,215 @@
+from datetime import datetime
+from typing import List, Dict, Iterable, Optional, Mapping, Any, AsyncGenerator
+
+import sqlalchemy
+
+from .db import DbContainer, instrument_pool, insert_many, fetch_by_ids, update_many, iterate_unbuffered
+from .handlers.v1.pagination import TaskListQuery
+from .task_cache import Task
+from .write_coalescing import WriteCoalescer
+
+STORE_MYSQL = "mysql"
+STORE_MEMORY = "memory"
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """
+    Convert a column value to a naive local datetime, like MySQL does for DATETIME columns.
+
+    :param value: datetime, datetime string in isoformat (with or without timezone), or None
+    :return: datetime or None
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if value else None
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class TaskStore:
+    """
+    Storage of task rows beneath the handlers. Rows are dicts of the columns id, title, description, expiry_dt and
+    update_dt. Each method is atomic: the rows it reads are not modified by other requests until it returns.
+    """
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_task(self, id: int, fields: Iterable[str]) -> Optional[dict]:
+        """
+        :param id: int, id of the task
+        :param fields: names of the columns
+        :return: row, or None if not found
+        """
+        raise NotImplementedError
+
+    async def get_tasks(self, ids: Iterable[int], fields: Iterable[str]) -> Dict[int, dict]:
+        """
+        :param ids: ids of the tasks
+        :param fields: names of the columns, "id" is always returned
+        :return: {id: row} of the tasks found
+        """
+        raise NotImplementedError
+
+    async def list_tasks(self, list_query: TaskListQuery) -> List[dict]:
+        """
+        :param list_query: TaskListQuery
+        :return: rows of the page, with the fields of list_query and of its cursor
+        """
+        raise NotImplementedError
+
+    def iterate_tasks(self, list_query: TaskListQuery) -> AsyncGenerator[dict, None]:
+        """
+        Iterate the rows of list_query without holding all of them in memory at once.
+        The generator may hold a connection until it is exhausted, so it should be closed with aclose() otherwise.
+
+        :param list_query: TaskListQuery
+        :return: async generator of rows
+        """
+        raise NotImplementedError
+
+    async def insert_task(self, row: Mapping[str, Any]) -> int:
+        """
+        :param row: task without id
+        :return: int, id of the created task
+        """
+        raise NotImplementedError
+
+    async def insert_tasks(self, rows: List[Mapping[str, Any]]) -> List[int]:
+        """
+        Create tasks in one transaction.
+
+        :param rows: tasks without id
+        :return: ids of the created tasks, in the same order as rows
+        :raises ValueError: if a row contains "id", ids are assigned by the store
+        """
+        raise NotImplementedError
+
+    async def update_task(self, id: int, row: Mapping[str, Any]) -> bool:
+        """
+        :param id: int, id of the task
+        :param row: columns to be updated
+        :return: bool, False if the task is not found
+        """
+        raise NotImplementedError
+
+    async def update_tasks(self, rows: List[Mapping[str, Any]], fields: Iterable[str]) -> Dict[int, dict]:
+        """
+        Update tasks by "id" in one transaction, discarding rows with unknown ids. If an id appears more than once,
+        the last row wins.
+
+        :param rows: columns to be updated, each containing "id"
+        :param fields: names of the columns to be read before the update
+        :return: {id: row before the update} of the tasks found
+        """
+        raise NotImplementedError
+
+    async def patch_task(self, id: int, values: Mapping[str, Any], expected: Optional[Mapping[str, Any]] = None,
+                         fields: Iterable[str] = ("update_dt",)) -> Optional[dict]:
+        """
+        Update the task only if it has the expected values, and set its update_dt to the current time of the store.
+
+        :param id: int, id of the task
+        :param values: columns to be updated, except update_dt
+        :param expected: {column: value} the task should have to be updated
+        :param fields: names of the columns to be read after the update
+        :return: row written by this update with fields, or None if the task is not found or not as expected
+        """
+        raise NotImplementedError
+
+    async def delete_task(self, id: int) -> bool:
+        """
+        :param id: int, id of the task
+        :return: bool, False if the task is not found
+        """
+        raise NotImplementedError
+
+    async def delete_all_tasks(self):
+        raise NotImplementedError
+
+    async def get_schedules(self, after: datetime) -> List[Task]:
+        """
+        :param after: datetime
+        :return: list of Task (id, title, expiry_dt) with expiry_dt later than after, sorted by (expiry_dt, id)
+        """
+        raise NotImplementedError
+
+
+class MysqlTaskStore(TaskStore):
+    """
+    TaskStore on the MySQL table of DbContainer. Single-row statements go through the StatementCache of DbContainer,
+    and single-task INSERT / UPDATE through WriteCoalescer if it is given.
+    """
+    def __init__(self, db_container: DbContainer, write_coalescer: Optional[WriteCoalescer] = None):
+        self.__database = db_container.database
+        self.__tasks = db_container.tasks
+        self.__statements = db_container.statements
+        self.__write_coalescer = write_coalescer
+
+    async def open(self):
+        await self.__database.connect()
+        instrument_pool(self.__database)
+
+    async def close(self):
+        await self.__database.disconnect()
+
+    async def get_task(self, id: int, fields: Iterable[str]) -> Optional[dict]:
+        return await self.__statements.get_by_id(self.__tasks, id, fields)
+
+    async def get_tasks(self, ids: Iterable[int], fields: Iterable[str]) -> Dict[int, dict]:
+        return await fetch_by_ids(self.__database, self.__tasks, ids, list(fields))
+
+    async def list_tasks(self, list_query: TaskListQuery) -> List[dict]:
+        return await self.__statements.fetch_all(
+            ("list_page", list_query.shape()), lambda: list_query.query(self.__tasks), list_query.parameters()
+        )
+
+    def iterate_tasks(self, list_query: TaskListQuery) -> AsyncGenerator[dict, None]:
+        return iterate_unbuffered(self.__database, list_query.query(self.__tasks))
+
+    async def insert_task(self, row: Mapping[str, Any]) -> int:
+        if self.__write_coalescer is not None:
+            return await self.__write_coalescer.insert(dict(row))
+        return await self.__statements.insert(self.__tasks, row)
+
+    async def insert_tasks(self, rows: List[Mapping[str, Any]]) -> List[int]:
+        async with self.__database.transaction():
+            return await insert_many(self.__database, self.__tasks, rows)
+
+    async def update_task(self, id: int, row: Mapping[str, Any]) -> bool:
+        if self.__write_coalescer is not None:
+            return await self.__write_coalescer.update({**row, "id": id})
+        if await self.__statements.get_by_id(self.__tasks, id, ("id",)) is None:
+            return False
+        await self.__statements.update_by_id(self.__tasks, id, row)
+        return True
+
+    async def update_tasks(self, rows: List[Mapping[str, Any]], fields: Iterable[str]) -> Dict[int, dict]:
+        async with self.__database.transaction():
+            existing_rows = await fetch_by_ids(self.__database, self.__tasks, [row["id"] for row in rows],
+                                               list(fields), for_update=True)
+            await update_many(self.__database, self.__tasks, [row for row in rows if row["id"] in existing_rows])
+        return existing_rows
+
+    async def patch_task(self, id: int, values: Mapping[str, Any], expected: Optional[Mapping[str, Any]] = None,
+                         fields: Iterable[str] = ("update_dt",)) -> Optional[dict]:
+        # A single UPDATE with expected in its WHERE, whose affected row count tells if the task is found and as
+        # expected (NOW(6) always changes the row), then a plain read of the written row: the row lock taken by the
+        # UPDATE is held until commit, so the row read back is the one of this update, not of a later one.
+        async with self.__database.transaction():
+            if not await self.__statements.update_by_id(self.__tasks, id, values, expected, ("update_dt",)):
+                return None
+            return await self.__statements.get_by_id(self.__tasks, id, fields)
+
+    async def delete_task(self, id: int) -> bool:
+        return bool(await self.__statements.delete_by_id(self.__tasks, id))
+
+    async def delete_all_tasks(self):
+        await self.__database.execute(query=self.__tasks.delete())
+
+    async def get_schedules(self, after: datetime) -> List[Task]:
+        query = sqlalchemy.select([self.__tasks.c.id, self.__tasks.c.title, self.__tasks.c.expiry_dt]) \
+            .where(self.__tasks.c.expiry_dt > after).order_by(self.__tasks.c.expiry_dt, self.__tasks.c.id)
+        return [(row["id"], row["title"], row["expiry_dt"]) async for row in iterate_unbuffered(self.__database, query)]
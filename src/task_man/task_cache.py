@@ -0,0 +1,715 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from heapq import heapify, heappop, heappush
+from itertools import islice
+from typing import Tuple, Optional, Dict, List, Iterable, Container
+from threading import RLock
+from sortedcontainers import SortedList
+
+Task = Tuple[int, str, Optional[datetime]]
+
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+MICROSECOND = timedelta(microseconds=1)
+MINUTES_PER_HOUR = 60
+MINUTES_PER_DAY = 24 * 60
+
+
+class BaseTaskCache:
+    """
+    Thread-safe base class of task cache backends, which provide functionality of a task queue ordered by expiry_dt.
+
+    The public methods acquire the lock and delegate to the unlocked primitives implemented by the subclasses:
+    _add_task, _get_next_task, _pop_due_tasks, _remove_task and _clear_all_tasks.
+    """
+    stores_titles = True  # False if tasks are returned with title None
+
+    def __init__(self):
+        self._lock = RLock()
+
+    def add_task(self, task: Task):
+        """
+        Add Task to the task queue.
+        If a Task with the same id already exists, an existing record will be replaced.
+        Otherwise will add a new record with key id.
+
+        :param task: Task
+        :return:
+        """
+        self._lock.acquire()
+        try:
+            self._add_task(task)
+        finally:
+            self._lock.release()
+
+    def add_tasks(self, tasks: Iterable[Task]):
+        """
+        Add a batch of Tasks to the task queue within a single acquisition of the lock.
+
+        :param tasks: iterable of Task
+        :return:
+        """
+        self._lock.acquire()
+        try:
+            for task in tasks:
+                self._add_task(task)
+        finally:
+            self._lock.release()
+
+    def update_tasks(self, tasks: Iterable[Task]):
+        """
+        Apply a batch of latest snapshots of tasks within a single acquisition of the lock.
+        Tasks with expiry_dt are added or replaced, while tasks without expiry_dt are removed.
+
+        :param tasks: iterable of Task
+        :return:
+        """
+        self._lock.acquire()
+        try:
+            for task in tasks:
+                if task[2] is None:
+                    self._remove_task(task[0])
+                else:
+                    self._add_task(task)
+        finally:
+            self._lock.release()
+
+    def load_tasks(self, tasks: List[Task], skip_ids: Container[int] = ()):
+        """
+        Bulk load a chunk of tasks sorted by (expiry_dt, id) within a single acquisition of the lock, e.g. on warm-up.
+        Tasks with id in skip_ids are not loaded, so that the rows loaded from DB do not overwrite newer snapshots.
+
+        :param tasks: list of Task with expiry_dt, sorted by (expiry_dt, id)
+        :param skip_ids: ids of tasks not to be loaded
+        :return:
+        """
+        self._lock.acquire()
+        try:
+            self._load_tasks([task for task in tasks if task[0] not in skip_ids] if skip_ids else tasks)
+        finally:
+            self._lock.release()
+
+    def get_next_task(self) -> Optional[Task]:
+        """
+        Return the most earliest Task in terms of expiry datetime, or None if the task queue is empty.
+
+        :return: task: Task or None
+        """
+        self._lock.acquire()
+        try:
+            return self._get_next_task()
+        finally:
+            self._lock.release()
+
+    def pop_due_tasks(self, cutoff: datetime) -> List[Task]:
+        """
+        Remove and return all tasks with expiry_dt earlier than cutoff, in order of expiry_dt,
+        within a single acquisition of the lock.
+
+        :param cutoff: datetime, tasks with expiry_dt < cutoff are due
+        :return: list of due tasks
+        """
+        self._lock.acquire()
+        try:
+            return self._pop_due_tasks(cutoff)
+        finally:
+            self._lock.release()
+
+    def get_tasks(self) -> List[Task]:
+        """
+        Return all tasks sorted by (expiry_dt, id) within a single acquisition of the lock, e.g. for a snapshot.
+
+        :return: list of Task
+        """
+        self._lock.acquire()
+        try:
+            return self._get_tasks()
+        finally:
+            self._lock.release()
+
+    def get_tasks_until(self, cutoff: datetime, limit: Optional[int] = None) -> List[Task]:
+        """
+        Return the earliest tasks with expiry_dt earlier than cutoff, sorted by (expiry_dt, id), without removing them,
+        within a single acquisition of the lock, so that they are a consistent snapshot of the cache.
+
+        :param cutoff: datetime, tasks with expiry_dt < cutoff are returned
+        :param limit: max number of tasks, all tasks before cutoff if None
+        :return: list of Task
+        """
+        self._lock.acquire()
+        try:
+            return self._get_tasks_until(cutoff, limit)
+        finally:
+            self._lock.release()
+
+    def task_done(self, task: Task):
+        """
+        Remove a processed task from the task queue.
+
+        :param task: Task
+        :return:
+        """
+        id, title, expiry_dt = task
+        self.remove_task(id)
+
+    def remove_task(self, id: int):
+        """
+        Remove task from the task queue. Do nothing if the task is not found.
+
+        :param id: int, id of the task
+        :return:
+        """
+        self._lock.acquire()
+        try:
+            self._remove_task(id)
+        finally:
+            self._lock.release()
+
+    def clear_all_tasks(self):
+        """
+        Clear all tasks from the task queue.
+
+        :return:
+        """
+        self._lock.acquire()
+        try:
+            self._clear_all_tasks()
+        finally:
+            self._lock.release()
+
+    def get_stats(self) -> Tuple[int, int]:
+        """
+        Return the number of tasks and the number of stale entries, i.e. entries of replaced or removed tasks which
+        still take space until they are skipped or dropped.
+
+        :return: (number of tasks, number of stale entries)
+        """
+        self._lock.acquire()
+        try:
+            return self._get_stats()
+        finally:
+            self._lock.release()
+
+    def _add_task(self, task: Task):
+        raise NotImplementedError
+
+    def _load_tasks(self, tasks: List[Task]):
+        for task in tasks:
+            self._add_task(task)
+
+    def _get_next_task(self) -> Optional[Task]:
+        raise NotImplementedError
+
+    def _pop_due_tasks(self, cutoff: datetime) -> List[Task]:
+        raise NotImplementedError
+
+    def _get_tasks(self) -> List[Task]:
+        raise NotImplementedError
+
+    def _get_tasks_until(self, cutoff: datetime, limit: Optional[int]) -> List[Task]:
+        return list(islice((task for task in self._get_tasks() if task[2] < cutoff), limit))
+
+    def _remove_task(self, id: int):
+        raise NotImplementedError
+
+    def _clear_all_tasks(self):
+        raise NotImplementedError
+
+    def _get_stats(self) -> Tuple[int, int]:
+        raise NotImplementedError
+
+
+class TaskCache(BaseTaskCache):
+    """
+    Reference task cache backend, composed of a dict of latest snapshots and a SortedList of (expiry_dt, id).
+    The (expiry_dt, id) pairs are unique as the dict keeps a single snapshot per id, so no set is needed.
+
+    Let n be the number of tasks.
+    Space complexity: O(n)
+    Time complexity:
+        add_task: O(log n)
+        get_next_task: O(log n)
+        pop_due_tasks: O(k + log n) for k due tasks
+        remove_task: O(log n)
+        load_tasks: O(n + k) for k >= n / 4 pre-sorted tasks, O(k log n) for fewer
+    """
+    def __init__(self):
+        super().__init__()
+        self.__tasks_schedules = SortedList()  # [(expiry_dt, id)]
+        self.__tasks_dict = dict()  # {[id: (title, expiry_dt)]}
+
+    def _add_task(self, task: Task):
+        id, title, expiry_dt = task
+        if id in self.__tasks_dict:
+            self.__tasks_schedules.remove((self.__tasks_dict[id][1], id))
+        self.__tasks_dict[id] = (title, expiry_dt)
+        self.__tasks_schedules.add((expiry_dt, id))
+
+    def _load_tasks(self, tasks: List[Task]):
+        tasks_dict = self.__tasks_dict
+        for id, title, expiry_dt in tasks:
+            if id in tasks_dict:
+                self.__tasks_schedules.remove((tasks_dict[id][1], id))
+            tasks_dict[id] = (title, expiry_dt)
+        # SortedList.update re-sorts the concatenation of the list and the new sorted run, which is a linear merge,
+        # only if the run is at least a quarter of the list: a smaller run is added one task at a time
+        self.__tasks_schedules.update([(expiry_dt, id) for id, title, expiry_dt in tasks])
+
+    def _get_next_task(self) -> Optional[Task]:
+        if not self.__tasks_schedules:
+            return None
+        expiry_dt, id = self.__tasks_schedules[0]
+        title, expiry_dt = self.__tasks_dict[id]
+        return id, title, expiry_dt
+
+    def _pop_due_tasks(self, cutoff: datetime) -> List[Task]:
+        tasks = []
+        count = 0
+        for expiry_dt, id in self.__tasks_schedules.irange(maximum=(cutoff,), inclusive=(True, False)):
+            count += 1
+            task_content = self.__tasks_dict.get(id)
+            if task_content is not None and task_content[1] == expiry_dt:  # skip stale snapshots
+                del self.__tasks_dict[id]
+                tasks.append((id, task_content[0], expiry_dt))
+        del self.__tasks_schedules[:count]
+        return tasks
+
+    def _get_tasks(self) -> List[Task]:
+        tasks_dict = self.__tasks_dict
+        return [(id, tasks_dict[id][0], expiry_dt) for expiry_dt, id in self.__tasks_schedules]
+
+    def _get_tasks_until(self, cutoff: datetime, limit: Optional[int]) -> List[Task]:
+        tasks_dict = self.__tasks_dict
+        schedules = self.__tasks_schedules.irange(maximum=(cutoff,), inclusive=(True, False))
+        return [(id, tasks_dict[id][0], expiry_dt) for expiry_dt, id in islice(schedules, limit)]
+
+    def _remove_task(self, id: int):
+        try:
+            title, expiry_dt = self.__tasks_dict.pop(id)
+        except KeyError:
+            return
+        self.__tasks_schedules.discard((expiry_dt, id))
+
+    def _clear_all_tasks(self):
+        self.__tasks_schedules = SortedList()
+        self.__tasks_dict = dict()
+
+    def _get_stats(self) -> Tuple[int, int]:
+        return len(self.__tasks_dict), len(self.__tasks_schedules) - len(self.__tasks_dict)
+
+
+class TimingWheelTaskCache(BaseTaskCache):
+    """
+    Task cache backend implemented as a hierarchical timing wheel for a large number of pending tasks.
+
+    The wheel has 3 levels: 60 one-minute slots, 24 one-hour slots and `days` one-day slots, plus an overflow bucket
+    for tasks further in the future. A task is placed in the finest level covering its expiry minute relative to the
+    cursor of the wheel, and is cascaded to a finer level when the cursor enters its day or hour.
+    Tasks expired before the cursor are placed in the slot of the cursor.
+    The slot of the cursor keeps a heap of (expiry_dt, id), so that tasks within the same minute are still returned
+    in order of expiry_dt.
+
+    Let n be the number of tasks and k be the number of tasks in the slot of the cursor.
+    Space complexity: O(n)
+    Time complexity:
+        add_task: O(1) (O(log k) if the task is added to the slot of the cursor)
+        get_next_task: O(log k), plus O(60 + 24 + days) slots scanned when the cursor advances
+        pop_due_tasks: O(d log d) for d due tasks, plus the slots scanned
+        remove_task: O(1)
+        cascading: O(1) amortised per task per level
+    """
+    def __init__(self, days: int = 366):
+        super().__init__()
+        self.__days = days
+        self._clear_all_tasks()
+
+    def _add_task(self, task: Task):
+        id, title, expiry_dt = task
+        self._remove_task(id)
+        minute = self.__to_minute(expiry_dt)
+        if not self.__buckets:
+            self.__cursor = minute
+            self.__head_minute = None
+        self.__place(id, title, expiry_dt, minute)
+
+    def _get_next_task(self) -> Optional[Task]:
+        bucket = self.__seek()
+        if bucket is None:
+            return None
+        if self.__head_minute != self.__cursor:
+            self.__head = [(expiry_dt, id) for id, (title, expiry_dt) in bucket.items()]
+            heapify(self.__head)
+            self.__head_minute = self.__cursor
+        while True:
+            expiry_dt, id = self.__head[0]
+            item = bucket.get(id)
+            if item is not None and item[1] == expiry_dt:
+                return id, item[0], expiry_dt
+            heappop(self.__head)
+
+    def _pop_due_tasks(self, cutoff: datetime) -> List[Task]:
+        tasks = []
+        cutoff_minute = self.__to_minute(cutoff)
+        while True:
+            bucket = self.__seek()
+            if bucket is None:
+                break
+            if self.__cursor < cutoff_minute:  # the whole slot is due
+                items = sorted(bucket.items(), key=lambda item: (item[1][1], item[0]))
+                bucket.clear()
+                for id, (title, expiry_dt) in items:
+                    del self.__buckets[id]
+                    tasks.append((id, title, expiry_dt))
+                continue
+            task = self._get_next_task()
+            while task is not None and task[2] < cutoff:
+                heappop(self.__head)
+                self._remove_task(task[0])
+                tasks.append(task)
+                task = self._get_next_task() if bucket else None  # later slots are not due
+            break
+        return tasks
+
+    def _get_tasks(self) -> List[Task]:
+        tasks = [(id, bucket[id][0], bucket[id][1]) for id, bucket in self.__buckets.items()]
+        tasks.sort(key=lambda task: (task[2], task[0]))
+        return tasks
+
+    def _get_tasks_until(self, cutoff: datetime, limit: Optional[int]) -> List[Task]:
+        # slots are not sorted, so all tasks are scanned and only the tasks before cutoff are sorted
+        tasks = [(id, bucket[id][0], bucket[id][1]) for id, bucket in self.__buckets.items() if bucket[id][1] < cutoff]
+        tasks.sort(key=lambda task: (task[2], task[0]))
+        return tasks[:limit]
+
+    def _remove_task(self, id: int):
+        bucket = self.__buckets.pop(id, None)
+        if bucket is not None:
+            del bucket[id]
+
+    def _clear_all_tasks(self):
+        self.__minutes = [dict() for _ in range(MINUTES_PER_HOUR)]  # [{id: (title, expiry_dt)}]
+        self.__hours = [dict() for _ in range(MINUTES_PER_DAY // MINUTES_PER_HOUR)]
+        self.__day_slots = [dict() for _ in range(self.__days)]
+        self.__overflow = dict()
+        self.__buckets = dict()  # {id: bucket containing the task}
+        self.__cursor = 0  # epoch minute
+        self.__head = []  # heap of (expiry_dt, id) in the slot of the cursor
+        self.__head_minute = None
+
+    def _get_stats(self) -> Tuple[int, int]:
+        stale = len(self.__head)
+        if self.__head_minute == self.__cursor:  # the heap holds every task of the slot of the cursor
+            stale -= len(self.__minutes[self.__cursor % MINUTES_PER_HOUR])
+        return len(self.__buckets), stale
+
+    @staticmethod
+    def __to_minute(expiry_dt: datetime) -> int:
+        return (expiry_dt - EPOCH) // MINUTE
+
+    def __bucket_of(self, minute: int) -> Dict[int, Tuple[str, datetime]]:
+        cursor = self.__cursor
+        minute = max(minute, cursor)
+        if minute // MINUTES_PER_HOUR == cursor // MINUTES_PER_HOUR:
+            return self.__minutes[minute % MINUTES_PER_HOUR]
+        if minute // MINUTES_PER_DAY == cursor // MINUTES_PER_DAY:
+            return self.__hours[minute // MINUTES_PER_HOUR % len(self.__hours)]
+        if minute // MINUTES_PER_DAY - cursor // MINUTES_PER_DAY < self.__days:
+            return self.__day_slots[minute // MINUTES_PER_DAY % self.__days]
+        return self.__overflow
+
+    def __place(self, id: int, title: str, expiry_dt: datetime, minute: int):
+        bucket = self.__bucket_of(minute)
+        bucket[id] = (title, expiry_dt)
+        self.__buckets[id] = bucket
+        if self.__head_minute == self.__cursor and bucket is self.__minutes[self.__cursor % MINUTES_PER_HOUR]:
+            heappush(self.__head, (expiry_dt, id))
+
+    def __cascade(self, bucket: Dict[int, Tuple[str, datetime]]):
+        items = list(bucket.items())
+        bucket.clear()
+        for id, (title, expiry_dt) in items:
+            self.__place(id, title, expiry_dt, self.__to_minute(expiry_dt))
+
+    def __advance(self, minute: int):
+        """
+        Advance the cursor to the start of a later hour or day, and cascade tasks of that hour or day.
+        """
+        new_day = minute // MINUTES_PER_DAY != self.__cursor // MINUTES_PER_DAY
+        self.__cursor = minute
+        if new_day:
+            if self.__overflow:
+                self.__cascade(self.__overflow)
+            self.__cascade(self.__day_slots[minute // MINUTES_PER_DAY % self.__days])
+        self.__cascade(self.__hours[minute // MINUTES_PER_HOUR % len(self.__hours)])
+
+    def __seek(self) -> Optional[Dict[int, Tuple[str, datetime]]]:
+        """
+        Advance the cursor to the first non-empty one-minute slot and return the slot, or None if the wheel is empty.
+        """
+        while self.__buckets:
+            cursor = self.__cursor
+            hour = cursor // MINUTES_PER_HOUR
+            day = cursor // MINUTES_PER_DAY
+            for minute in range(cursor, (hour + 1) * MINUTES_PER_HOUR):
+                if self.__minutes[minute % MINUTES_PER_HOUR]:
+                    self.__cursor = minute
+                    return self.__minutes[minute % MINUTES_PER_HOUR]
+            next_minute = None
+            for h in range(hour + 1, (day + 1) * MINUTES_PER_DAY // MINUTES_PER_HOUR):
+                if self.__hours[h % len(self.__hours)]:
+                    next_minute = h * MINUTES_PER_HOUR
+                    break
+            if next_minute is None:
+                for d in range(day + 1, day + self.__days):
+                    if self.__day_slots[d % self.__days]:
+                        next_minute = d * MINUTES_PER_DAY
+                        break
+            if next_minute is None:
+                first_minute = min(self.__to_minute(expiry_dt) for title, expiry_dt in self.__overflow.values())
+                next_minute = first_minute // MINUTES_PER_DAY * MINUTES_PER_DAY
+            self.__advance(next_minute)
+        return None
+
+
+class CompactTaskCache(BaseTaskCache):
+    """
+    Memory-compact task cache backend, which stores only int64 ids and int64 expiry_dt in epoch microseconds
+    in arrays, without titles: tasks are returned with title None, and TaskExpiryAlert fetches the titles of
+    due tasks from DB in a batch.
+
+    It is composed of:
+        1. An open-addressing hash table with linear probing of id -> expiry, in 2 array('q'), for replace / remove.
+        2. A list of sorted blocks of (expiry, id) in parallel array('q'), like sortedcontainers.SortedList.
+    Ids should be non-negative, as negative values mark the empty and removed slots of the hash table.
+
+    Let n be the number of tasks and b be the size of a block.
+    Space complexity: about 50 bytes per task
+    Time complexity:
+        add_task: O(log n + b)
+        get_next_task: O(1)
+        pop_due_tasks: O(k + b) for k due tasks
+        remove_task: O(log n + b)
+        load_tasks: O(k) for k pre-sorted tasks later than all tasks in the cache
+    """
+    stores_titles = False
+
+    BLOCK_SIZE = 1024  # blocks are split when they exceed 2 * BLOCK_SIZE
+    EMPTY = -1
+    REMOVED = -2
+
+    def __init__(self):
+        super().__init__()
+        self._clear_all_tasks()
+
+    def _add_task(self, task: Task):
+        id, title, expiry_dt = task
+        self._remove_task(id)
+        expiry = self.__to_us(expiry_dt)
+        self.__hash_put(id, expiry)
+        self.__insert(expiry, id)
+
+    def _load_tasks(self, tasks: List[Task]):
+        for id, title, expiry_dt in tasks:
+            expiry = self.__to_us(expiry_dt)
+            if self.__hash_find(id) < 0 and (not self.__maxes or self.__maxes[-1] < (expiry, id)):
+                self.__hash_put(id, expiry)
+                self.__append(expiry, id)
+            else:
+                self._add_task((id, title, expiry_dt))
+
+    def _get_next_task(self) -> Optional[Task]:
+        if not self.__expiries:
+            return None
+        return self.__ids[0][0], None, self.__from_us(self.__expiries[0][0])
+
+    def _get_tasks(self) -> List[Task]:
+        from_us = self.__from_us
+        return [
+            (id, None, from_us(expiry))
+            for expiries, ids in zip(self.__expiries, self.__ids)
+            for expiry, id in zip(expiries, ids)
+        ]
+
+    def _get_tasks_until(self, cutoff: datetime, limit: Optional[int]) -> List[Task]:
+        cutoff = self.__to_us(cutoff)
+        from_us = self.__from_us
+        tasks = []
+        for expiries, ids in zip(self.__expiries, self.__ids):
+            count = bisect_left(expiries, cutoff)
+            if limit is not None:
+                count = min(count, limit - len(tasks))
+            tasks.extend((ids[i], None, from_us(expiries[i])) for i in range(count))
+            if count < len(expiries):
+                break
+        return tasks
+
+    def _pop_due_tasks(self, cutoff: datetime) -> List[Task]:
+        cutoff = self.__to_us(cutoff)
+        from_us = self.__from_us
+        tasks = []
+        while self.__expiries:
+            expiries, ids = self.__expiries[0], self.__ids[0]
+            count = bisect_left(expiries, cutoff)
+            for i in range(count):
+                self.__hash_remove(ids[i])
+                tasks.append((ids[i], None, from_us(expiries[i])))
+            if count < len(expiries):
+                del expiries[:count]
+                del ids[:count]
+                break
+            del self.__expiries[0], self.__ids[0], self.__maxes[0]
+        return tasks
+
+    def _remove_task(self, id: int):
+        slot = self.__hash_find(id)
+        if slot < 0:
+            return
+        expiry = self.__values[slot]
+        self.__keys[slot] = self.REMOVED
+        self.__size -= 1
+        block, i = self.__locate(expiry, id)
+        expiries, ids = self.__expiries[block], self.__ids[block]
+        del expiries[i], ids[i]
+        if not expiries:
+            del self.__expiries[block], self.__ids[block], self.__maxes[block]
+        elif i == len(expiries):
+            self.__maxes[block] = (expiries[-1], ids[-1])
+
+    def _clear_all_tasks(self):
+        self.__keys = array("q", [self.EMPTY]) * 8
+        self.__values = array("q", [0]) * 8
+        self.__size = 0  # number of tasks
+        self.__used = 0  # number of slots not empty, including removed ones
+        self.__expiries: List[array] = []  # sorted blocks of expiry
+        self.__ids: List[array] = []  # ids of the sorted blocks
+        self.__maxes: List[Tuple[int, int]] = []  # last (expiry, id) of each block
+
+    def __len__(self):
+        return self.__size
+
+    def _get_stats(self) -> Tuple[int, int]:
+        return self.__size, self.__used - self.__size  # removed slots of the hash table until the next rehash
+
+    @staticmethod
+    def __to_us(expiry_dt: datetime) -> int:
+        return (expiry_dt - EPOCH) // MICROSECOND
+
+    @staticmethod
+    def __from_us(expiry: int) -> datetime:
+        return EPOCH + timedelta(microseconds=expiry)
+
+    def __slot(self, id: int) -> int:
+        return (id * 0x9E3779B97F4A7C15 >> 17) & (len(self.__keys) - 1)
+
+    def __hash_find(self, id: int) -> int:
+        keys = self.__keys
+        mask = len(keys) - 1
+        slot = self.__slot(id)
+        while True:
+            key = keys[slot]
+            if key == id:
+                return slot
+            if key == self.EMPTY:
+                return -1
+            slot = (slot + 1) & mask
+
+    def __hash_put(self, id: int, expiry: int):
+        """
+        Put a new id, which should not be in the hash table.
+        """
+        if (self.__used + 1) * 10 > len(self.__keys) * 7:
+            self.__rehash()
+        keys = self.__keys
+        mask = len(keys) - 1
+        slot = self.__slot(id)
+        while keys[slot] >= 0:
+            slot = (slot + 1) & mask
+        if keys[slot] == self.EMPTY:
+            self.__used += 1
+        keys[slot] = id
+        self.__values[slot] = expiry
+        self.__size += 1
+
+    def __hash_remove(self, id: int):
+        slot = self.__hash_find(id)
+        if slot >= 0:
+            self.__keys[slot] = self.REMOVED
+            self.__size -= 1
+
+    def __rehash(self):
+        """
+        Resize the hash table for twice the number of tasks, dropping the removed slots.
+        """
+        keys, values = self.__keys, self.__values
+        capacity = 8
+        while capacity * 7 < (self.__size + 1) * 20:
+            capacity *= 2
+        self.__keys = array("q", [self.EMPTY]) * capacity
+        self.__values = array("q", [0]) * capacity
+        self.__size = 0
+        self.__used = 0
+        for key, value in zip(keys, values):
+            if key >= 0:
+                self.__hash_put(key, value)
+
+    def __locate(self, expiry: int, id: int) -> Tuple[int, int]:
+        """
+        Return (index of block, index in block) of the first entry not less than (expiry, id).
+        """
+        block = bisect_left(self.__maxes, (expiry, id))
+        if block == len(self.__maxes):
+            return block, 0
+        expiries, ids = self.__expiries[block], self.__ids[block]
+        i = bisect_left(expiries, expiry)
+        while i < len(expiries) and expiries[i] == expiry and ids[i] < id:
+            i += 1
+        return block, i
+
+    def __insert(self, expiry: int, id: int):
+        block, i = self.__locate(expiry, id)
+        if block == len(self.__maxes):
+            self.__append(expiry, id)
+            return
+        expiries, ids = self.__expiries[block], self.__ids[block]
+        expiries.insert(i, expiry)
+        ids.insert(i, id)
+        if len(expiries) > 2 * self.BLOCK_SIZE:
+            half = self.BLOCK_SIZE
+            self.__expiries.insert(block + 1, expiries[half:])
+            self.__ids.insert(block + 1, ids[half:])
+            del expiries[half:], ids[half:]
+            self.__maxes[block] = (expiries[-1], ids[-1])
+            self.__maxes.insert(block + 1, (self.__expiries[block + 1][-1], self.__ids[block + 1][-1]))
+
+    def __append(self, expiry: int, id: int):
+        """
+        Append an entry later than all entries.
+        """
+        if not self.__expiries or len(self.__expiries[-1]) >= self.BLOCK_SIZE:
+            self.__expiries.append(array("q"))
+            self.__ids.append(array("q"))
+            self.__maxes.append((expiry, id))
+        self.__expiries[-1].append(expiry)
+        self.__ids[-1].append(id)
+        self.__maxes[-1] = (expiry, id)
+
+
+TASK_CACHE_BACKENDS = {
+    "sorted_set": TaskCache,
+    "timing_wheel": TimingWheelTaskCache,
+    "compact": CompactTaskCache,
+}
+
+
+def create_task_cache(backend: str) -> BaseTaskCache:
+    """
+    Create a task cache from the name of the backend.
+
+    :param backend: str, one of the keys of TASK_CACHE_BACKENDS
+    :return: task cache
+    """
+    try:
+        return TASK_CACHE_BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"Unknown task cache backend {backend}.")
@@ -0,0 +1,79 @@
+"""
+Opt-in span timings of a request, returned in the Server-Timing response header.
+
+BaseHandler starts a RequestTrace for admin requests with the X-Server-Timing header, and sets it in CURRENT_TRACE,
+a context variable which follows the coroutines of the request. Code on the path of the request wraps its phases with
+span(name), which is a shared no-op context manager when the request is not traced.
+Spans are timed exclusively: the time of nested spans (e.g. pool wait within db) is only counted in the inner span,
+so the phases of a request add up to at most its total time.
+"""
+from contextlib import nullcontext
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, List, Optional
+
+SPAN_PARSE = "parse"  # decoding of the request body and query arguments
+SPAN_QUERY = "query"  # building, compiling and binding SQL statements
+SPAN_POOL = "pool"  # waiting for a connection of the DB pool
+SPAN_DB = "db"  # store calls, except the nested query and pool spans
+SPAN_SCHEDULER = "scheduler"  # updates and queries of the task cache of the scheduler
+SPAN_SERIALIZE = "serialize"  # encoding of the response body
+
+NULL_SPAN = nullcontext()
+
+
+class RequestTrace:
+    def __init__(self):
+        self.durations: Dict[str, float] = dict()  # {name of span: exclusive seconds}, in order of first span
+        self.__children: List[float] = [0.0]  # stack of the seconds spent in nested spans of the open spans
+
+    def enter(self) -> float:
+        self.__children.append(0.0)
+        return perf_counter()
+
+    def exit(self, name: str, started_at: float):
+        elapsed = perf_counter() - started_at
+        nested = self.__children.pop()
+        self.__children[-1] += elapsed
+        self.durations[name] = self.durations.get(name, 0.0) + elapsed - nested
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """
+        :param total: seconds of the whole request, added as the "total" metric if given
+        :return: value of the Server-Timing header, durations in milliseconds
+        """
+        durations = dict(self.durations)
+        if total is not None:
+            durations["total"] = total
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in durations.items())
+
+
+class Span:
+    __slots__ = ("trace", "name", "started_at")
+
+    def __init__(self, trace: RequestTrace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = self.trace.enter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.exit(self.name, self.started_at)
+
+
+CURRENT_TRACE: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def span(name: str):
+    """
+    Time a phase of the current request, e.g. `with span(SPAN_DB): ...`.
+
+    :param name: name of the phase, e.g. one of the SPAN_* constants
+    :return: context manager, NULL_SPAN if the current request is not traced
+    """
+    trace = CURRENT_TRACE.get()
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name)
@@ -0,0 +1,119 @@
+from typing import List, Tuple, Callable, Awaitable, Any, Optional
+
+import sqlalchemy
+from databases import Database
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from .db import insert_many, fetch_by_ids, update_many
+from .logger import app_log
+
+
+class WriteQueue:
+    """
+    Queue of single-row writes, flushed as one batch after `window` seconds since the first pending write,
+    or as soon as `max_batch` writes are pending. The future of each write is resolved with its own result.
+    If a batch fails, its writes are retried one by one, so that an invalid row only fails its own request.
+    Only accessed in the IOLoop thread.
+    """
+    def __init__(self, execute_batch: Callable[[List[Any]], Awaitable[List[Any]]], window: float = 0.002,
+                 max_batch: int = 500):
+        """
+        :param execute_batch: coroutine function executing a list of writes, returning a result per write in order
+        :param window: seconds to wait for more writes after the first pending write
+        :param max_batch: max number of writes per batch
+        """
+        self.__execute_batch = execute_batch
+        self.__window = window
+        self.__max_batch = max_batch
+        self.__pending: List[Tuple[Any, Future]] = []
+        self.__timeout: Optional[object] = None
+        self.batches = 0
+
+    def submit(self, write: Any) -> Future:
+        """
+        Add a write to the pending batch.
+
+        :param write: a write to be passed to execute_batch
+        :return: Future resolved with the result of the write
+        """
+        future = Future()
+        self.__pending.append((write, future))
+        if len(self.__pending) >= self.__max_batch:
+            self.flush()
+        elif self.__timeout is None:
+            self.__timeout = IOLoop.current().call_later(self.__window, self.flush)
+        return future
+
+    def flush(self):
+        """
+        Execute the pending writes now, in background.
+
+        :return:
+        """
+        if self.__timeout is not None:
+            IOLoop.current().remove_timeout(self.__timeout)
+            self.__timeout = None
+        batch, self.__pending = self.__pending, []
+        if batch:
+            IOLoop.current().spawn_callback(self.__execute, batch)
+
+    async def __execute(self, batch: List[Tuple[Any, Future]]):
+        self.batches += 1
+        try:
+            results = await self.__execute_batch([write for write, future in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            app_log.warning(f"Batch of {len(batch)} writes failed, retrying one by one: {e}")
+            for write, future in batch:
+                try:
+                    future.set_result((await self.__execute_batch([write]))[0])
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        for (write, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class WriteCoalescer:
+    """
+    Group commit of concurrent single-task writes: INSERTs and UPDATEs arriving within a small window are merged
+    into one transaction of multi-row statements (insert_many / update_many) on a single pool connection,
+    instead of one connection and round trip per request.
+    """
+    def __init__(self, database: Database, table: sqlalchemy.Table, window: float = 0.002, max_batch: int = 500):
+        self.__database = database
+        self.__table = table
+        self.__inserts = WriteQueue(self.__insert_batch, window, max_batch)
+        self.__updates = WriteQueue(self.__update_batch, window, max_batch)
+
+    async def insert(self, row: dict) -> int:
+        """
+        Insert a row in the next batch.
+
+        :param row: row to be inserted
+        :return: int, id of the inserted row
+        """
+        return await self.__inserts.submit(row)
+
+    async def update(self, row: dict) -> bool:
+        """
+        Update a row by "id" in the next batch. Only the columns in row are updated.
+
+        :param row: row to be updated, containing "id"
+        :return: bool, False if the row is not found
+        """
+        return await self.__updates.submit(row)
+
+    async def __insert_batch(self, rows: List[dict]) -> List[int]:
+        async with self.__database.transaction():
+            return await insert_many(self.__database, self.__table, rows)
+
+    async def __update_batch(self, rows: List[dict]) -> List[bool]:
+        async with self.__database.transaction():
+            existing_rows = await fetch_by_ids(self.__database, self.__table, [row["id"] for row in rows], [],
+                                               for_update=True)
+            await update_many(self.__database, self.__table, [row for row in rows if row["id"] in existing_rows])
+        return [row["id"] in existing_rows for row in rows]
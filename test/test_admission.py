@@ -0,0 +1,71 @@
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+
+from task_man.admission import ADMISSION_READ, AdmissionLimiter
+from task_man.app import make_app
+from task_man.config import AdmissionConfig
+from task_man.memory_store import MemoryTaskStore
+
+
+class TestAdmissionLimiter(AsyncTestCase):
+    @gen_test
+    def test_limit_and_queue(self):
+        limiter = AdmissionLimiter("read", limit=1, queue_size=1, queue_timeout=1)
+        self.assertTrue((yield limiter.acquire()))
+        waiting = gen.convert_yielded(limiter.acquire())
+        yield gen.sleep(0)
+        self.assertEqual(1, limiter.waiting)
+        self.assertFalse((yield limiter.acquire()))  # the queue is full
+        limiter.release()
+        self.assertTrue((yield waiting))
+        self.assertEqual((1, 0), (limiter.in_use, limiter.waiting))
+        limiter.release()
+        self.assertEqual(0, limiter.in_use)
+
+    @gen_test
+    def test_queue_timeout(self):
+        limiter = AdmissionLimiter("read", limit=1, queue_size=10, queue_timeout=0.01)
+        self.assertTrue((yield limiter.acquire()))
+        self.assertFalse((yield limiter.acquire()))
+        self.assertEqual((1, 0), (limiter.in_use, limiter.waiting))
+        limiter.release()
+        self.assertTrue((yield limiter.acquire()))
+
+    @gen_test
+    def test_adaptive_limit(self):
+        limiter = AdmissionLimiter("read", limit=10, queue_size=10, queue_timeout=1, adaptive=True,
+                                   latency_target=0.01, min_limit=2, backoff=0.5)
+        self.assertTrue((yield limiter.acquire()))
+        limiter.release(0.1)
+        self.assertEqual(5, limiter.limit)
+        self.assertTrue((yield limiter.acquire()))
+        limiter.release(0.1)
+        self.assertEqual(5, limiter.limit)  # decreased at most once per latency_target
+        yield gen.sleep(0.01)
+        self.assertTrue((yield limiter.acquire()))
+        limiter.release(0.1)
+        self.assertEqual(2, limiter.limit)
+        for _ in range(2):
+            self.assertTrue((yield limiter.acquire()))
+            limiter.release(0.001)
+        self.assertEqual(3, limiter.limit)
+
+
+class TestAdmissionControl(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = make_app(MemoryTaskStore(), admission=AdmissionConfig(
+            enabled=True, read_limit=1, queue_size=1, queue_timeout=0.05, retry_after=2,
+        ))
+        return self.app
+
+    def test_overloaded(self):
+        limiter = self.app.settings["admission"].get_limiter(ADMISSION_READ)
+        self.assertTrue(self.io_loop.run_sync(limiter.acquire))
+        response = self.fetch("/v1/tasks/1")
+        self.assertEqual(503, response.code)
+        self.assertEqual("2", response.headers["Retry-After"])
+        self.assertEqual(200, self.fetch("/v1/health").code)  # not subject to admission control
+        self.assertEqual(200, self.fetch("/v1/tasks", method="POST", body='{"title": "abc"}').code)
+        limiter.release()
+        self.assertEqual(200, self.fetch("/v1/tasks?limit=1").code)
+        self.assertEqual(0, limiter.in_use)
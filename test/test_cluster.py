@@ -0,0 +1,159 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from tornado.netutil import bind_unix_socket
+from tornado.testing import AsyncTestCase, gen_test
+
+from task_man.cluster import elect_leader, elect_shard, shard_path, SchedulerClient, SchedulerServer, ShardRouter
+
+
+class RecordingScheduler:
+    def __init__(self, tasks=()):
+        self.calls = []
+        self.tasks = list(tasks)  # sorted by (expiry_dt, id)
+
+    async def add_task(self, id, title, expiry_dt):
+        self.calls.append(("add_task", id, title, expiry_dt))
+
+    async def add_tasks(self, tasks):
+        self.calls.append(("add_tasks", tasks))
+
+    async def update_tasks(self, tasks):
+        self.calls.append(("update_tasks", tasks))
+
+    async def sync_tasks(self, tasks):
+        self.calls.append(("sync_tasks", tasks))
+
+    async def remove_task(self, id):
+        self.calls.append(("remove_task", id))
+
+    async def clear_all_tasks(self):
+        self.calls.append(("clear_all_tasks",))
+
+    async def get_expiring_tasks(self, until, limit):
+        return [task for task in self.tasks if task[2] < until][:limit]
+
+
+class TestElectLeader(unittest.TestCase):
+    def test_single_leader(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock_path = os.path.join(directory, "task_man.lock")
+            leader = elect_leader(lock_path)
+            self.assertIsNotNone(leader)
+            self.assertIsNone(elect_leader(lock_path))
+            leader.close()
+            follower = elect_leader(lock_path)
+            self.assertIsNotNone(follower)
+            follower.close()
+
+    def test_elect_shard(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock_path = os.path.join(directory, "task_man.lock")
+            owners = [elect_shard(lock_path, 2, task_id) for task_id in range(3)]
+            self.assertEqual([0, 1, None], [shard_index for shard_index, _ in owners])
+            for _, lock_file in owners:
+                if lock_file is not None:
+                    lock_file.close()
+
+
+class TestSchedulerClient(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "task_man.sock")
+        self.scheduler = RecordingScheduler()
+        self.server = SchedulerServer(self.scheduler)
+        self.server.add_socket(bind_unix_socket(self.socket_path))
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+        super().tearDown()
+
+    @gen_test
+    def test_forward(self):
+        expiry_dt = datetime.now().replace(microsecond=0) + timedelta(minutes=10)
+        client = SchedulerClient(self.socket_path)
+        yield client.add_task(1, "abc", expiry_dt)
+        yield client.add_task(2, "no expiry", None)
+        yield client.add_tasks([(3, "def", expiry_dt), (4, "no expiry", None)])
+        yield client.update_tasks([(1, "abc", None)])
+        yield client.sync_tasks([(2, "ghi", expiry_dt)])
+        yield client.remove_task(3)
+        yield client.clear_all_tasks()
+        client.close()
+        self.assertEqual([
+            ("add_task", 1, "abc", expiry_dt),
+            ("add_tasks", [(3, "def", expiry_dt)]),
+            ("update_tasks", [(1, "abc", None)]),
+            ("sync_tasks", [(2, "ghi", expiry_dt)]),
+            ("remove_task", 3),
+            ("clear_all_tasks",),
+        ], self.scheduler.calls)
+
+    @gen_test
+    def test_unknown_op(self):
+        client = SchedulerClient(self.socket_path)
+        with self.assertRaises(RuntimeError):
+            yield client.call("unknown", [])
+        client.close()
+
+    @gen_test
+    def test_owner_unreachable(self):
+        client = SchedulerClient(os.path.join(self.directory.name, "missing.sock"), connect_retries=2,
+                                 retry_interval=0.01)
+        with self.assertRaises(ConnectionError):
+            yield client.call("clear_all_tasks", [])
+        # events are logged and dropped, the owner reloads tasks from DB on restart
+        yield client.remove_task(1)
+
+
+class TestShardRouter(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        socket_path = os.path.join(self.directory.name, "task_man.sock")
+        self.local = RecordingScheduler()
+        self.remote = RecordingScheduler()
+        self.server = SchedulerServer(self.remote)
+        self.server.add_socket(bind_unix_socket(shard_path(socket_path, 1, 2)))
+        self.router = ShardRouter(socket_path, 2, local_shard=0, local_scheduler=self.local)
+
+    def tearDown(self):
+        self.router.close()
+        self.server.stop()
+        self.directory.cleanup()
+        super().tearDown()
+
+    @gen_test
+    def test_route_by_id(self):
+        expiry_dt = datetime.now().replace(microsecond=0) + timedelta(minutes=10)
+        yield self.router.add_task(1, "a", expiry_dt)
+        yield self.router.add_tasks([(2, "b", expiry_dt), (3, "c", expiry_dt), (4, "d", expiry_dt)])
+        yield self.router.remove_task(4)
+        yield self.router.clear_all_tasks()
+        self.assertEqual([
+            ("add_tasks", [(2, "b", expiry_dt), (4, "d", expiry_dt)]),
+            ("remove_task", 4),
+            ("clear_all_tasks",),
+        ], self.local.calls)
+        self.assertEqual([
+            ("add_task", 1, "a", expiry_dt),
+            ("add_tasks", [(3, "c", expiry_dt)]),
+            ("clear_all_tasks",),
+        ], self.remote.calls)
+
+    @gen_test
+    def test_get_expiring_tasks(self):
+        now = datetime.now().replace(microsecond=0)
+        self.local.tasks = [(2, "b", now + timedelta(minutes=1)), (4, "d", now + timedelta(minutes=4))]
+        self.remote.tasks = [(1, "a", now + timedelta(minutes=2)), (3, "c", now + timedelta(minutes=3))]
+        tasks = yield self.router.get_expiring_tasks(now + timedelta(minutes=10), 3)
+        self.assertEqual([2, 1, 3], [task[0] for task in tasks])
+        self.assertEqual(self.remote.tasks[1], tasks[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime
+
+import sqlalchemy
+from tornado.testing import AsyncTestCase, gen_test
+
+from task_man.config import MysqlConfig
+from task_man.db import StatementCache, create_db_container, insert_many
+from task_man.handlers.v1.pagination import TaskListQuery
+
+
+class TestStatementCache(unittest.TestCase):
+    def setUp(self):
+        db_container = create_db_container(MysqlConfig())
+        self.tasks = db_container.tasks
+        self.statements = StatementCache(db_container.database, max_entries=2)
+
+    def build_get_by_id(self):
+        return sqlalchemy.select([self.tasks.c.title]).where(self.tasks.c.id == sqlalchemy.bindparam("pk"))
+
+    def test_compile_once(self):
+        statement = self.statements.compile("get_by_id", self.build_get_by_id)
+        self.assertIs(statement, self.statements.compile("get_by_id", self.fail))
+        self.assertEqual("SELECT task.title FROM task WHERE task.id = %(pk)s", " ".join(statement.sql.split()))
+        self.assertEqual({"pk": 3}, self.statements.bind(statement, {"pk": 3}))
+        self.assertEqual((1, 1), (self.statements.hits, self.statements.misses))
+
+    def test_lru(self):
+        for key in ("a", "b", "a", "c"):
+            self.statements.compile(key, self.build_get_by_id)
+        self.statements.compile("a", self.fail)
+        self.assertRaises(AssertionError, self.statements.compile, "b", self.fail)
+
+    def test_list_page(self):
+        pages = [TaskListQuery({"limit": [b"2"], "after_id": [str(id).encode()]}) for id in (5, 9)]
+        statement = self.statements.compile(pages[0].shape(), lambda: pages[0].query(self.tasks))
+        self.assertIs(statement, self.statements.compile(pages[1].shape(), self.fail))
+        self.assertEqual({"after_id": 9, "limit": 2}, self.statements.bind(statement, pages[1].parameters()))
+        other = TaskListQuery({"limit": [b"2"], "expiry_from": [b"2021-01-01T00:00:00"]})
+        self.assertNotEqual(pages[0].shape(), other.shape())
+        self.assertEqual({"expiry_from": datetime(2021, 1, 1), "limit": 2}, other.parameters())
+
+
+class StubDatabase:
+    def __init__(self, increment: int, first_ids: list):
+        self.increment = increment
+        self.first_ids = first_ids
+        self.queries = []
+
+    async def fetch_val(self, query):
+        self.queries.append(query)
+        return self.increment
+
+    async def execute(self, query):
+        self.queries.append(query)
+        return self.first_ids.pop(0)
+
+
+class TestInsertMany(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tasks = create_db_container(MysqlConfig()).tasks
+
+    @gen_test
+    async def test_auto_increment_increment(self):
+        database = StubDatabase(2, [11, 21])
+        rows = [{"title": f"abc{i}"} for i in range(3)]
+        self.assertEqual([11, 13], await insert_many(database, self.tasks, rows[:2]))
+        self.assertEqual([21, 23, 25], await insert_many(database, self.tasks, rows))
+        self.assertEqual(1, database.queries.count("SELECT @@auto_increment_increment"))  # read once
+
+    @gen_test
+    async def test_reject_ids(self):
+        database = StubDatabase(1, [])
+        with self.assertRaises(ValueError):
+            await insert_many(database, self.tasks, [{"title": "abc"}, {"id": 5, "title": "def"}])
+        self.assertEqual([], database.queries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import json
+from datetime import datetime, timedelta
+
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from task_man.app import make_app
+from task_man.memory_store import MemoryTaskStore
+
+
+class StubScheduler:
+    def __init__(self):
+        self.tasks = []
+
+    async def get_expiring_tasks(self, until: datetime, limit: int):
+        return [task for task in self.tasks if task[2] < until][:limit]
+
+
+class TestExpiringTasks(AsyncHTTPTestCase):
+    def get_app(self):
+        self.store = MemoryTaskStore()
+        self.scheduler = StubScheduler()
+        return make_app(self.store, scheduler=self.scheduler)
+
+    @gen_test
+    async def test_skip_deleted_tasks(self):
+        expiry_dt = datetime.now() + timedelta(hours=1)
+        ids = await self.store.insert_tasks([{"title": "kept", "expiry_dt": expiry_dt},
+                                             {"title": "deleted", "expiry_dt": expiry_dt}])
+        self.scheduler.tasks = [(id, title, expiry_dt) for id, title in zip(ids, ("kept", "deleted"))]
+        await self.store.delete_task(ids[1])  # outside the API, the task stays in the task cache
+
+        response = await self.http_client.fetch(self.get_url("/v1/tasks/expiring?within=2h"))
+        tasks = json.loads(response.body)["tasks"]
+        self.assertEqual([(ids[0], "kept")], [(task["id"], task["title"]) for task in tasks])
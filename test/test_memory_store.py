@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from task_man.handlers.v1.pagination import TaskListQuery
+from task_man.memory_store import MemoryTaskStore
+
+
+def list_query(**args) -> TaskListQuery:
+    return TaskListQuery({name: [str(value).encode("utf-8")] for name, value in args.items()})
+
+
+class TestMemoryTaskStore(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.wal_path = os.path.join(self.directory.name, "task_man.wal")
+        self.now = datetime.now()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    async def open_store(self, **kwargs) -> MemoryTaskStore:
+        store = MemoryTaskStore(self.wal_path, flush_interval=0.001, **kwargs)
+        await store.open()
+        return store
+
+    async def insert_sample_tasks(self, store: MemoryTaskStore):
+        return await store.insert_tasks([
+            {"title": "abc1", "expiry_dt": self.now + timedelta(hours=2)},
+            {"title": "abc2", "description": "def"},
+            {"title": "abc3", "expiry_dt": (self.now + timedelta(hours=1)).isoformat()},
+            {"title": "abc4", "expiry_dt": self.now + timedelta(hours=1)},
+        ])
+
+    @gen_test
+    async def test_crud(self):
+        store = MemoryTaskStore()
+        ids = await self.insert_sample_tasks(store)
+        self.assertEqual([1, 2, 3, 4], ids)
+        with self.assertRaises(ValueError):
+            await store.insert_tasks([{"title": "abc5"}, {"id": 10, "title": "abc10"}])
+        self.assertEqual({"title": "abc2", "description": "def"}, await store.get_task(2, ("title", "description")))
+        self.assertIsNone(await store.get_task(5, ("id",)))
+
+        self.assertTrue(await store.update_task(2, {"title": "abc2_put"}))
+        self.assertFalse(await store.update_task(5, {"title": "abc5_put"}))
+        existing_rows = await store.update_tasks([{"id": 1, "expiry_dt": None}, {"id": 5, "title": "abc5"}], ("title",))
+        self.assertEqual({1: {"id": 1, "title": "abc1"}}, existing_rows)
+        self.assertEqual({1: {"id": 1, "expiry_dt": None}, 2: {"id": 2, "expiry_dt": None}},
+                         await store.get_tasks([1, 2, 5], ("expiry_dt",)))
+        with self.assertRaises(ValueError):
+            await store.update_tasks([{"id": 2, "title": "abc2_bad"}, {"id": 3, "unknown": 1}], ())
+        self.assertEqual("abc2_put", (await store.get_task(2, ("title",)))["title"])
+
+        update_dt = (await store.get_task(3, ("update_dt",)))["update_dt"]
+        row = await store.patch_task(3, {"title": "abc3_patch"}, {"update_dt": update_dt}, ("title", "update_dt"))
+        self.assertEqual("abc3_patch", row["title"])
+        self.assertLess(update_dt, row["update_dt"])
+        self.assertIsNone(await store.patch_task(3, {"title": "lost"}, {"update_dt": update_dt}))
+        self.assertIsNone(await store.patch_task(5, {"title": "abc5"}))
+
+        self.assertTrue(await store.delete_task(4))
+        self.assertFalse(await store.delete_task(4))
+        self.assertEqual([(3, "abc3_patch", self.now + timedelta(hours=1))], await store.get_schedules(self.now))
+        await store.delete_all_tasks()
+        self.assertEqual([5], await store.insert_tasks([{"title": "abc5"}]))
+
+    @gen_test
+    async def test_list_tasks(self):
+        store = MemoryTaskStore()
+        await self.insert_sample_tasks(store)
+        rows = await store.list_tasks(list_query(fields="title", limit=2, offset=1))
+        self.assertEqual([{"id": 2, "title": "abc2"}, {"id": 3, "title": "abc3"}], rows)
+
+        query = list_query(fields="id", order_by="expiry_dt", limit=2)
+        rows = await store.list_tasks(query)
+        self.assertEqual([3, 4], [row["id"] for row in rows])
+        rows = await store.list_tasks(list_query(order_by="expiry_dt", cursor=query.next_cursor(2, rows[-1])))
+        self.assertEqual(["abc1"], [row["title"] for row in rows])
+        rows = await store.list_tasks(list_query(has_expiry="false"))
+        self.assertEqual([2], [row["id"] for row in rows])
+        rows = await store.list_tasks(list_query(expiry_to=(self.now + timedelta(minutes=90)).isoformat()))
+        self.assertEqual([3, 4], [row["id"] for row in rows])
+
+        await store.insert_tasks([{"title": f"bulk{i}"} for i in range(1200)])
+        rows = [row async for row in store.iterate_tasks(list_query(after_id=2, limit=1000))]
+        self.assertEqual(list(range(3, 1003)), [row["id"] for row in rows])
+        count = 0
+        async for row in store.iterate_tasks(list_query()):
+            if count == 0:
+                await store.delete_task(1204)  # written during the iteration
+            count += 1
+        self.assertEqual(1203, count)
+
+    @gen_test
+    async def test_replay(self):
+        store = await self.open_store()
+        await self.insert_sample_tasks(store)
+        await store.update_task(1, {"title": "abc1_put"})
+        await store.delete_task(2)
+        await store.close()
+        with open(self.wal_path, "ab") as wal_file:
+            wal_file.write(b'{"op":"put","row":{"id":9')  # torn by a crash during the append
+
+        store = await self.open_store()
+        self.assertEqual({1: {"id": 1, "title": "abc1_put"}, 3: {"id": 3, "title": "abc3"}},
+                         await store.get_tasks([1, 2, 3, 9], ("title",)))
+        self.assertEqual([5], await store.insert_tasks([{"title": "abc5"}]))
+        await store.close()
+        store = await self.open_store()
+        self.assertEqual("abc5", (await store.get_task(5, ("title",)))["title"])
+        await store.close()
+
+    @gen_test
+    async def test_compaction(self):
+        store = await self.open_store(compact_min_records=10)
+        await self.insert_sample_tasks(store)
+        for i in range(20):
+            await store.update_task(1, {"title": f"abc1_{i}"})
+        await store.delete_all_tasks()
+        await store.insert_task({"title": "abc5"})
+        await store.close()
+        self.assertGreater(store.compactions, 0)
+        with open(self.wal_path, "rb") as wal_file:
+            self.assertLess(len(wal_file.readlines()), 20)
+
+        store = await self.open_store()
+        self.assertEqual({5: {"id": 5, "title": "abc5"}}, await store.get_tasks(range(1, 10), ("title",)))
+        self.assertEqual([6], await store.insert_tasks([{"title": "abc6"}]))
+        await store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
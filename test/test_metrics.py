@@ -0,0 +1,48 @@
+from tornado.testing import AsyncHTTPTestCase
+
+from task_man.app import make_app
+from task_man.memory_store import MemoryTaskStore
+from task_man.metrics import Counter, Gauge, Histogram, Registry, HTTP_REQUESTS_IN_FLIGHT
+
+
+class TestMetrics(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app(MemoryTaskStore())
+
+    def test_render(self):
+        registry = Registry()
+        counter = registry.register(Counter("requests_total", "Requests.", ("method",)))
+        gauge = registry.register(Gauge("entries", "Entries.", ("kind",)))
+        histogram = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1)))
+        counter.inc(label_values=("GET",))
+        counter.inc(2, ("GET",))
+        gauge.set_function(lambda: {("tasks",): 3, ("stale",): 1})
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual([
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{method="GET"} 3',
+            "# HELP entries Entries.",
+            "# TYPE entries gauge",
+            'entries{kind="stale"} 1',
+            'entries{kind="tasks"} 3',
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 3.65",
+            "latency_seconds_count 4",
+        ], registry.render().splitlines())
+
+    def test_metrics_endpoint(self):
+        self.assertEqual(200, self.fetch("/v1/health").code)
+        response = self.fetch("/v1/metrics")
+        self.assertEqual(200, response.code)
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.body.decode("utf-8")
+        self.assertIn('task_man_http_request_duration_seconds_count{route="/v1/health",method="GET"}', body)
+        self.assertIn('task_man_http_requests_total{route="/v1/health",method="GET",code="200"}', body)
+        self.assertIn("# TYPE task_man_scheduler_lag_seconds histogram", body)
+        self.assertEqual(0, HTTP_REQUESTS_IN_FLIGHT.get())
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+from tornado.web import Application, RequestHandler
+
+from task_man.notification import Alert, AlertSink, FileSink, NotificationDispatcher, WebhookSink, \
+    WORKER_MODE_THREAD
+
+
+def create_alerts(n: int):
+    now = datetime.now()
+    return [Alert(id, f"task{id}", now + timedelta(minutes=10), now) for id in range(n)]
+
+
+class StubWebhookHandler(RequestHandler):
+    def initialize(self, received: list, failures: list):
+        self.received = received
+        self.failures = failures
+
+    def post(self):
+        if self.failures:
+            self.failures.pop()
+            self.set_status(500)
+            return
+        self.received.append(json.loads(self.request.body)["alerts"])
+
+
+class TestWebhookSink(AsyncHTTPTestCase):
+    def get_app(self):
+        self.received = []
+        self.failures = []
+        return Application([(r"/alerts", StubWebhookHandler, dict(received=self.received, failures=self.failures))])
+
+    @gen_test
+    def test_batching(self):
+        dispatcher = NotificationDispatcher([WebhookSink(self.get_url("/alerts"), batch_size=4)])
+        dispatcher.start()
+        dispatcher.submit(create_alerts(10))
+        yield dispatcher.stop()
+        self.assertEqual([4, 4, 2], [len(batch) for batch in self.received])
+        self.assertEqual(list(range(10)), [alert["id"] for batch in self.received for alert in batch])
+        self.assertEqual(10, dispatcher.stats()["webhook"]["sent"])
+
+    @gen_test
+    def test_retry(self):
+        self.failures.extend([True, True])
+        dispatcher = NotificationDispatcher([WebhookSink(self.get_url("/alerts"))], retry_backoff=0.01)
+        dispatcher.start()
+        dispatcher.submit(create_alerts(3))
+        yield dispatcher.stop()
+        self.assertEqual(1, len(self.received))
+        stats = dispatcher.stats()["webhook"]
+        self.assertEqual((3, 2, 0), (stats["sent"], stats["retried"], stats["failed"]))
+
+
+class SlowSink(AlertSink):
+    name = "slow"
+
+    async def send(self, alerts):
+        await gen.sleep(0.01 * len(alerts))
+
+
+class TestNotificationDispatcher(AsyncTestCase):
+    @gen_test
+    def test_drop_when_queue_full(self):
+        dispatcher = NotificationDispatcher([SlowSink(batch_size=1)], queue_size=5)
+        dispatcher.start()
+        dispatcher.submit(create_alerts(8))
+        stats = dispatcher.stats()["slow"]
+        self.assertEqual((5, 3, 5), (stats["enqueued"], stats["dropped"], stats["queue_depth"]))
+        yield dispatcher.stop()
+        self.assertEqual(5, dispatcher.stats()["slow"]["sent"])
+
+    @gen_test
+    def test_file_sink_off_ioloop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alerts.log")
+            sink = FileSink(path, batch_size=2)
+            threads = []
+            write = sink._FileSink__append
+            sink._FileSink__append = lambda lines: threads.append(threading.get_ident()) or write(lines)
+            dispatcher = NotificationDispatcher([sink], workers=2)
+            dispatcher.start()
+            dispatcher.submit(create_alerts(5))
+            yield dispatcher.stop()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([0, 1, 2, 3, 4], sorted(line["id"] for line in lines))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    @gen_test
+    def test_file_sink_in_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alerts.log")
+            dispatcher = NotificationDispatcher([FileSink(path)], workers=2, worker_mode=WORKER_MODE_THREAD)
+            dispatcher.start()
+            dispatcher.submit(create_alerts(3))
+            yield dispatcher.stop()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([0, 1, 2], [line["id"] for line in lines])
@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import mysql
+from tornado.web import HTTPError
+
+from task_man.config import MysqlConfig
+from task_man.db import create_db_container
+from task_man.handlers.v1.pagination import TaskListQuery, encode_cursor, parse_fields, parse_duration
+
+
+def to_args(**kwargs):
+    return {k: [str(v).encode("utf-8")] for k, v in kwargs.items()}
+
+
+class TestTaskListQuery(unittest.TestCase):
+    tasks = create_db_container(MysqlConfig()).tasks
+
+    def compile(self, list_query: TaskListQuery) -> str:
+        return " ".join(str(list_query.query(self.tasks).compile(dialect=mysql.dialect())).split())
+
+    def test_after_id(self):
+        sql = self.compile(TaskListQuery(to_args(after_id=10, limit=2)))
+        self.assertIn("WHERE task.id > %s ORDER BY task.id", sql)
+
+    def test_expiry_cursor(self):
+        expiry_dt = datetime(2021, 1, 1, 12)
+        cursor = encode_cursor("expiry_dt", {"id": 3, "expiry_dt": expiry_dt})
+        list_query = TaskListQuery(to_args(order_by="expiry_dt", cursor=cursor, limit=1))
+        self.assertEqual((3, expiry_dt), (list_query.after_id, list_query.after_expiry_dt))
+        sql = self.compile(list_query)
+        self.assertIn("task.expiry_dt IS NOT NULL", sql)
+        self.assertIn("ORDER BY task.expiry_dt, task.id", sql)
+        self.assertEqual(cursor, list_query.next_cursor(1, {"id": 3, "expiry_dt": expiry_dt}))
+        self.assertIsNone(TaskListQuery(to_args(limit=2)).next_cursor(1, {"id": 3}))
+
+    def test_fields(self):
+        self.assertEqual(("id", "title", "description", "expiry_dt"), parse_fields({}))
+        self.assertEqual(("title", "id"), parse_fields(to_args(fields="title,id,title")))
+        self.assertEqual(("id", "update_dt"), parse_fields(to_args(fields="id,update_dt")))
+        self.assertRaises(HTTPError, parse_fields, to_args(fields="title,password"))
+        sql = self.compile(TaskListQuery(to_args(fields="title", order_by="expiry_dt")))
+        self.assertTrue(sql.startswith("SELECT task.title, task.id, task.expiry_dt FROM task"))
+
+    def test_duration(self):
+        self.assertEqual(timedelta(seconds=90), parse_duration("90"))
+        self.assertEqual(timedelta(minutes=30), parse_duration("30m"))
+        self.assertEqual(timedelta(hours=1.5), parse_duration("1.5h"))
+        for value in ("", "abc", "-1d", "nan", "1w"):
+            self.assertRaises(HTTPError, parse_duration, value)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(HTTPError, TaskListQuery, to_args(limit="abc"))
+        self.assertRaises(HTTPError, TaskListQuery, to_args(cursor="abc"))
+        self.assertRaises(HTTPError, TaskListQuery, to_args(order_by="expiry_dt", has_expiry="false"))
+        cursor = encode_cursor("id", {"id": 3})
+        self.assertRaises(HTTPError, TaskListQuery, to_args(order_by="expiry_dt", cursor=cursor))
+
+
+if __name__ == "__main__":
+    unittest.main()
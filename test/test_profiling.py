@@ -0,0 +1,73 @@
+import json
+import marshal
+import time
+import unittest
+
+from tornado.testing import AsyncHTTPTestCase
+
+from task_man.app import make_app
+from task_man.config import AdminConfig
+from task_man.memory_store import MemoryTaskStore
+from task_man.scheduling import TaskExpiryAlert
+from task_man.tracing import CURRENT_TRACE, RequestTrace, span
+
+ADMIN_HEADERS = {"Authorization": "Bearer secret"}
+
+
+class TestProfiling(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app(MemoryTaskStore(), admin=AdminConfig(token="secret", max_profile_seconds=1))
+
+    def tearDown(self):
+        self.io_loop.run_sync(TaskExpiryAlert.clear_all_tasks)
+        super().tearDown()
+
+    def test_admin_only(self):
+        self.assertEqual(403, self.fetch("/v1/admin/profile?seconds=0.01").code)
+        self.assertEqual(403, self.fetch("/v1/admin/profile?seconds=0.01", headers={"Authorization": "Bearer x"}).code)
+        self.assertEqual(400, self.fetch("/v1/admin/profile?seconds=2", headers=ADMIN_HEADERS).code)
+        self.assertEqual(400, self.fetch("/v1/admin/profile?seconds=0.01&format=svg", headers=ADMIN_HEADERS).code)
+
+    def test_collapsed_profile(self):
+        response = self.fetch("/v1/admin/profile?seconds=0.1", headers=ADMIN_HEADERS)
+        self.assertEqual(200, response.code)
+        lines = response.body.decode("utf-8").splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("ioloop;"))
+            self.assertGreater(int(count), 0)
+
+    def test_pstats_profile(self):
+        response = self.fetch("/v1/admin/profile?seconds=0.1&format=pstats", headers=ADMIN_HEADERS)
+        self.assertEqual(200, response.code)
+        self.assertIsInstance(marshal.loads(response.body), dict)
+
+    def test_server_timing(self):
+        body = json.dumps({"title": "abc", "expiry_dt": "2099-01-01T00:00:00"})
+        response = self.fetch("/v1/tasks", method="POST", body=body, headers={**ADMIN_HEADERS, "X-Server-Timing": "1"})
+        self.assertEqual(200, response.code)
+        names = [metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(["parse", "db", "scheduler", "serialize", "total"], names)
+        response = self.fetch("/v1/tasks", method="POST", body=body, headers={"X-Server-Timing": "1"})
+        self.assertEqual(200, response.code)
+        self.assertNotIn("Server-Timing", response.headers)
+
+
+class TestRequestTrace(unittest.TestCase):
+    def test_exclusive_spans(self):
+        trace = RequestTrace()
+        token = CURRENT_TRACE.set(trace)
+        try:
+            with span("db"):
+                time.sleep(0.01)
+                with span("pool"):
+                    time.sleep(0.02)
+            with span("db"):
+                pass
+        finally:
+            CURRENT_TRACE.reset(token)
+        self.assertGreaterEqual(trace.durations["pool"], 0.02)
+        self.assertGreaterEqual(trace.durations["db"], 0.01)
+        self.assertLess(trace.durations["db"], 0.02)
+        self.assertIsNone(CURRENT_TRACE.get())
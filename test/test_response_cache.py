@@ -0,0 +1,52 @@
+import unittest
+from datetime import datetime
+
+from task_man.response_cache import ResponseCache, parse_etag
+
+FIELDS = ("id", "title")
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = ResponseCache(max_entries=2, ttl=5.0, clock=lambda: self.now)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get(1, FIELDS))
+        response = self.cache.put(1, FIELDS, b'{"id":1}', datetime(2021, 1, 1), self.cache.token())
+        self.assertEqual(response, self.cache.get(1, FIELDS))
+        self.assertIsNone(self.cache.get(1, ("id",)))
+        self.assertEqual('"2021-01-01T00:00:00"', response.etag)
+        self.assertEqual(datetime(2021, 1, 1), parse_etag(response.etag))
+        self.assertRaises(ValueError, parse_etag, "2021-01-01T00:00:00")
+        self.assertEqual(self.cache.put(2, FIELDS, b'{"id":1}', None, self.cache.token()).etag,
+                         self.cache.put(3, FIELDS, b'{"id":1}', None, self.cache.token()).etag)
+        self.assertEqual((1, 2), (self.cache.hits, self.cache.misses))
+
+    def test_ttl(self):
+        self.cache.put(1, FIELDS, b'{"id":1}', None, self.cache.token())
+        self.now = 5.0
+        self.assertIsNone(self.cache.get(1, FIELDS))
+
+    def test_lru(self):
+        for id in (1, 2):
+            self.cache.put(id, FIELDS, b"{}", None, self.cache.token())
+        self.cache.get(1, FIELDS)
+        self.cache.put(3, FIELDS, b"{}", None, self.cache.token())
+        self.assertIsNotNone(self.cache.get(1, FIELDS))
+        self.assertIsNone(self.cache.get(2, FIELDS))
+
+    def test_invalidate(self):
+        token = self.cache.token()
+        self.cache.put(1, FIELDS, b"{}", None, token)
+        self.cache.invalidate(1)
+        self.assertIsNone(self.cache.get(1, FIELDS))
+        self.cache.put(1, FIELDS, b"{}", None, token)  # read before the invalidation, not stored
+        self.assertIsNone(self.cache.get(1, FIELDS))
+        self.cache.put(2, FIELDS, b"{}", None, self.cache.token())
+        self.cache.invalidate_all()
+        self.assertEqual(0, len(self.cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from task_man import serialization
+
+
+class TestSerialization(unittest.TestCase):
+    row = {"id": 1, "title": "abc", "description": None, "expiry_dt": datetime(2021, 1, 2, 3, 4, 5, 6)}
+
+    def test_dumps(self):
+        self.assertEqual(
+            {"id": 1, "title": "abc", "description": None, "expiry_dt": "2021-01-02 03:04:05.000006"},
+            json.loads(serialization.dumps(self.row))
+        )
+
+    def test_dumps_without_orjson(self):
+        expected = json.loads(serialization.dumps(self.row))
+        with mock.patch.object(serialization, "orjson", None):
+            self.assertEqual(expected, json.loads(serialization.dumps(self.row)))
+
+    def test_project_row(self):
+        self.assertEqual({"id": 1, "title": "abc"}, serialization.project_row(self.row, ("id", "title")))
+
+
+if __name__ == "__main__":
+    unittest.main()
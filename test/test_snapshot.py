@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from task_man.snapshot import read_snapshot, write_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "task_man.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        now = datetime(2021, 1, 1, 12, 34, 56, 789012)
+        tasks = [(1, "abc", now), (3, "", now + timedelta(minutes=1)), (4, None, now + timedelta(minutes=1)),
+                 (2, "タスク", now + timedelta(days=400))]
+        write_snapshot(self.path, tasks, now - timedelta(minutes=1), 1, 4)
+        snapshot = read_snapshot(self.path)
+        self.assertEqual(tasks, snapshot.tasks)
+        self.assertEqual((now - timedelta(minutes=1), 1, 4),
+                         (snapshot.watermark, snapshot.shard_index, snapshot.shard_count))
+
+    def test_null_titles(self):
+        tasks = [(1, None, datetime(2021, 1, 1)), (2, None, datetime(2021, 1, 2))]
+        write_snapshot(self.path, tasks, datetime(2021, 1, 1))
+        self.assertEqual(tasks, read_snapshot(self.path).tasks)
+
+    def test_empty(self):
+        write_snapshot(self.path, [], datetime(2021, 1, 1))
+        self.assertEqual([], read_snapshot(self.path).tasks)
+
+    def test_invalid(self):
+        self.assertIsNone(read_snapshot(self.path))
+        write_snapshot(self.path, [(1, "abc", datetime(2021, 1, 1))], datetime(2021, 1, 1))
+        with open(self.path, "rb+") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertIsNone(read_snapshot(self.path))
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot" * 10)
+        self.assertIsNone(read_snapshot(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
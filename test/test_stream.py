@@ -0,0 +1,94 @@
+import logging
+import socket
+from typing import Optional
+
+from tornado import gen
+from tornado.iostream import IOStream
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from task_man.app import make_app
+from task_man.handlers.v1.task import STREAM_CHUNK_SIZE
+from task_man.logger import app_log
+from task_man.memory_store import MemoryTaskStore
+
+
+class EndlessTaskStore(MemoryTaskStore):
+    def __init__(self, fail_after: Optional[int] = None):
+        super().__init__()
+        self.closed = False
+        self.generators = []
+        self.fail_after = fail_after
+
+    def iterate_tasks(self, list_query):
+        rows = self.__iterate_rows()
+        self.generators.append(rows)  # kept referenced, so it is not finalized by the garbage collector
+        return rows
+
+    async def __iterate_rows(self):
+        try:
+            id = 0
+            while True:
+                id += 1
+                if id == self.fail_after:
+                    raise RuntimeError("Lost connection to DB.")
+                yield {"id": id, "title": "abc", "description": None, "expiry_dt": None}
+                if id % 100 == 0:
+                    await gen.sleep(0)
+        finally:
+            self.closed = True  # e.g. the connection of a server-side cursor is returned to the pool
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestStreamTasks(AsyncHTTPTestCase):
+    def get_app(self):
+        fails = self._testMethodName == "test_cut_off_on_error"
+        self.store = EndlessTaskStore(fail_after=STREAM_CHUNK_SIZE * 2 if fails else None)
+        return make_app(self.store)
+
+    def setUp(self):
+        super().setUp()
+        self.log = RecordingHandler()
+        app_log.addHandler(self.log)
+
+    def tearDown(self):
+        app_log.removeHandler(self.log)
+        super().tearDown()
+
+    async def request_stream(self) -> IOStream:
+        stream = IOStream(socket.socket())
+        await stream.connect(("127.0.0.1", self.get_http_port()))
+        await stream.write(b"GET /v1/tasks?stream=true HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        return stream
+
+    async def wait_closed(self):
+        for _ in range(100):
+            if self.store.closed:
+                return
+            await gen.sleep(0.01)
+
+    @gen_test
+    async def test_close_rows_on_disconnect(self):
+        stream = await self.request_stream()
+        await stream.read_until(b'{"tasks":[')
+        stream.close()
+        await self.wait_closed()
+        self.assertTrue(self.store.closed)
+        self.assertEqual([], [record.getMessage() for record in self.log.records])  # not a server error
+
+    @gen_test
+    async def test_cut_off_on_error(self):
+        stream = await self.request_stream()
+        response = await stream.read_until_close()
+        await self.wait_closed()
+        self.assertTrue(self.store.closed)
+        self.assertIn(b" 200 OK", response.split(b"\r\n", 1)[0])
+        self.assertFalse(response.endswith(b"0\r\n\r\n"))  # no last chunk, the response is seen as incomplete
+        self.assertEqual(1, len(self.log.records))
@@ -1,3 +1,4 @@
+import json
 import requests
 import os
 import unittest
@@ -60,6 +61,34 @@ class TestTaskApi(unittest.TestCase):
         self.assertEqual("abc2", response.json()["tasks"][0]["title"])
         self.assertEqual("abc3", response.json()["tasks"][1]["title"])
 
+    def test_get_tasks_cursor_pagination(self):
+        response = requests.get(self.HOST_URL + "/v1/tasks?limit=3").json()
+        self.assertEqual(3, len(response["tasks"]))
+        response = requests.get(self.HOST_URL + f"/v1/tasks?limit=3&cursor={response['next_cursor']}").json()
+        self.assertEqual(["abc4"], [task["title"] for task in response["tasks"]])
+        self.assertNotIn("next_cursor", response)
+
+    def test_get_tasks_has_expiry(self):
+        response = requests.get(self.HOST_URL + "/v1/tasks?has_expiry=true")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, len(response.json()["tasks"]))
+
+    def test_get_tasks_stream(self):
+        response = requests.get(self.HOST_URL + "/v1/tasks?stream=true&limit=3")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(response.json()["tasks"]))
+        self.assertIn("next_cursor", response.json())
+
+        response = requests.get(self.HOST_URL + "/v1/tasks", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(200, response.status_code)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(["abc1", "abc2", "abc3", "abc4"], [task["title"] for task in lines])
+
+    def test_get_tasks_fields(self):
+        response = requests.get(self.HOST_URL + "/v1/tasks?fields=id,title")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"id", "title"}, set(response.json()["tasks"][0]))
+
     def test_post_one_task(self):
         request_body = {"title": "abc4", "description": "def"}
         response = requests.post(self.HOST_URL + "/v1/tasks", json=request_body)
@@ -70,6 +99,24 @@ class TestTaskApi(unittest.TestCase):
         time.sleep(1)
         self.assertEqual(5, self.__count())
 
+    def test_post_tasks(self):
+        request_body = {"tasks": [{"title": "abc5", "description": "def"}, {"title": "abc6"}]}
+        response = requests.post(self.HOST_URL + "/v1/tasks", json=request_body)
+        self.assertEqual(200, response.status_code)
+        tasks = response.json()["tasks"]
+        self.assertEqual(["abc5", "abc6"], [task["title"] for task in tasks])
+        self.assertEqual(tasks[0]["id"] + 1, tasks[1]["id"])
+        time.sleep(1)
+        self.assertEqual(6, self.__count())
+
+        response = requests.get(self.HOST_URL + f"/v1/tasks/{tasks[1]['id']}")
+        self.assertEqual("abc6", response.json()["title"])
+
+        request_body = {"tasks": [{"title": "abc7"}, {"id": tasks[1]["id"] + 100, "title": "abc8"}]}
+        response = requests.post(self.HOST_URL + "/v1/tasks", json=request_body)
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(6, self.__count())
+
     def test_put_two_tasks(self):
         response = requests.get(self.HOST_URL + "/v1/tasks").json()
         id_1 = response["tasks"][0]["id"]
@@ -83,11 +130,22 @@ class TestTaskApi(unittest.TestCase):
         }
         response = requests.put(self.HOST_URL + "/v1/tasks", json=request_body)
         self.assertEqual(200, response.status_code)
+        self.assertEqual([id_1, id_2], response.json()["updated"])
 
         response = requests.get(self.HOST_URL + "/v1/tasks").json()
         self.assertEqual(request_body["tasks"][0]["title"], response["tasks"][0]["title"])
         self.assertEqual(request_body["tasks"][1]["title"], response["tasks"][1]["title"])
 
+    def test_put_tasks_with_unknown_id(self):
+        id = requests.get(self.HOST_URL + "/v1/tasks").json()["tasks"][0]["id"]
+
+        request_body = {"tasks": [{"id": id, "title": "abc1_put"}, {"id": 0, "title": "abc0_put"}]}
+        response = requests.put(self.HOST_URL + "/v1/tasks", json=request_body)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"updated": [id], "discarded": [0]}, response.json())
+        time.sleep(1)
+        self.assertEqual(4, self.__count())
+
     def test_delete_all_task(self):
         requests.delete(self.HOST_URL + "/v1/tasks")
         time.sleep(1)
@@ -103,6 +161,20 @@ class TestTaskApi(unittest.TestCase):
         self.assertIn("description", response.json())
         self.assertEqual(id, response.json()["id"])
 
+    def test_get_one_task_not_modified(self):
+        id = requests.get(self.HOST_URL + "/v1/tasks").json()["tasks"][0]["id"]
+
+        response = requests.get(self.HOST_URL + f"/v1/tasks/{id}")
+        self.assertIn("Last-Modified", response.headers)
+        etag = response.headers["Etag"]
+        response = requests.get(self.HOST_URL + f"/v1/tasks/{id}", headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+
+        requests.put(self.HOST_URL + f"/v1/tasks/{id}", json={"title": "test_get_one_task_not_modified"})
+        response = requests.get(self.HOST_URL + f"/v1/tasks/{id}", headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("test_get_one_task_not_modified", response.json()["title"])
+
     def test_put_one_task(self):
         id = requests.get(self.HOST_URL + "/v1/tasks").json()["tasks"][0]["id"]
 
@@ -118,6 +190,47 @@ class TestTaskApi(unittest.TestCase):
         response = requests.get(self.HOST_URL + f"/v1/tasks/{id}")
         self.assertEqual(request_body["title"], response.json()["title"])
 
+    def test_patch_one_task(self):
+        id = requests.get(self.HOST_URL + "/v1/tasks").json()["tasks"][0]["id"]
+        etag = requests.get(self.HOST_URL + f"/v1/tasks/{id}").headers["Etag"]
+
+        response = requests.patch(self.HOST_URL + f"/v1/tasks/{id}", json={"description": "patched"},
+                                  headers={"If-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("patched", response.json()["description"])
+        self.assertNotEqual(etag, response.headers["Etag"])
+        self.assertEqual(response.headers["Etag"], requests.get(self.HOST_URL + f"/v1/tasks/{id}").headers["Etag"])
+
+        response = requests.patch(self.HOST_URL + f"/v1/tasks/{id}", json={"title": "lost update"},
+                                  headers={"If-Match": etag})
+        self.assertEqual(412, response.status_code)
+        response = requests.patch(self.HOST_URL + f"/v1/tasks/{id}", json={"title": "abc"},
+                                  headers={"If-Match": "2021-01-01T12:00:00"})
+        self.assertEqual(400, response.status_code)
+        response = requests.patch(self.HOST_URL + "/v1/tasks/0", json={"title": "abc"})
+        self.assertEqual(404, response.status_code)
+        response = requests.patch(self.HOST_URL + f"/v1/tasks/{id}", json={"id": 0})
+        self.assertEqual(400, response.status_code)
+
+        response = requests.get(self.HOST_URL + f"/v1/tasks/{id}")
+        self.assertEqual("patched", response.json()["description"])
+        self.assertNotEqual("lost update", response.json()["title"])
+
+    def test_get_expiring_tasks(self):
+        response = requests.get(self.HOST_URL + "/v1/tasks/expiring", params={"within": "3650d", "limit": 2})
+        self.assertEqual(200, response.status_code)
+        tasks = response.json()["tasks"]
+        self.assertLessEqual(len(tasks), 2)
+        self.assertEqual(sorted(tasks, key=lambda task: (task["expiry_dt"], task["id"])), tasks)
+
+        response = requests.get(self.HOST_URL + "/v1/tasks/expiring",
+                                params={"within": "3650d", "fields": "id,description"})
+        self.assertEqual(200, response.status_code)
+        for task in response.json()["tasks"]:
+            self.assertEqual({"id", "description"}, set(task))
+        response = requests.get(self.HOST_URL + "/v1/tasks/expiring", params={"within": "soon"})
+        self.assertEqual(400, response.status_code)
+
     def test_delete_one_task(self):
         id = requests.get(self.HOST_URL + "/v1/tasks").json()["tasks"][0]["id"]
 
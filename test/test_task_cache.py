@@ -0,0 +1,178 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from task_man.task_cache import CompactTaskCache, TaskCache, TimingWheelTaskCache, create_task_cache
+
+
+class TaskCacheTestMixin:
+    def create_cache(self):
+        raise NotImplementedError
+
+    def assertTasksEqual(self, expected, actual):
+        cache = self.create_cache()
+        if not cache.stores_titles:  # titles are fetched from DB at notification time
+            if isinstance(expected, tuple):
+                expected = (expected[0], None, expected[2])
+            else:
+                expected = [(id, None, expiry_dt) for id, title, expiry_dt in expected]
+        self.assertEqual(expected, actual)
+
+    def drain(self, cache):
+        tasks = []
+        task = cache.get_next_task()
+        while task is not None:
+            tasks.append(task)
+            cache.task_done(task)
+            task = cache.get_next_task()
+        return tasks
+
+    def test_empty(self):
+        self.assertIsNone(self.create_cache().get_next_task())
+
+    def test_order(self):
+        now = datetime(2021, 1, 1, 12, 34, 56)
+        offsets = [
+            timedelta(seconds=1), timedelta(seconds=30), timedelta(minutes=5), timedelta(minutes=59),
+            timedelta(hours=1), timedelta(hours=5, minutes=3), timedelta(hours=23), timedelta(days=1),
+            timedelta(days=3, hours=2), timedelta(days=300), timedelta(days=800), timedelta(days=-2),
+        ]
+        tasks = [(id, f"task{id}", now + offset) for id, offset in enumerate(offsets)]
+        cache = self.create_cache()
+        for task in random.sample(tasks, len(tasks)):
+            cache.add_task(task)
+        self.assertTasksEqual(sorted(tasks, key=lambda task: (task[2], task[0])), self.drain(cache))
+
+    def test_replace_and_remove(self):
+        now = datetime(2021, 1, 1)
+        cache = self.create_cache()
+        cache.add_task((1, "abc", now + timedelta(hours=2)))
+        cache.add_task((2, "def", now + timedelta(hours=1)))
+        cache.add_task((1, "abc2", now + timedelta(minutes=30)))
+        cache.add_task((3, "ghi", now + timedelta(days=2)))
+        cache.remove_task(2)
+        cache.remove_task(4)
+        self.assertTasksEqual(
+            [(1, "abc2", now + timedelta(minutes=30)), (3, "ghi", now + timedelta(days=2))],
+            self.drain(cache)
+        )
+
+    def test_add_earlier_than_next_task(self):
+        now = datetime(2021, 1, 1)
+        cache = self.create_cache()
+        cache.add_task((1, "abc", now + timedelta(days=3)))
+        self.assertEqual(1, cache.get_next_task()[0])
+        cache.add_task((2, "def", now))
+        cache.add_task((3, "ghi", now + timedelta(days=3, seconds=-1)))
+        self.assertEqual([2, 3, 1], [task[0] for task in self.drain(cache)])
+
+    def test_update_tasks(self):
+        now = datetime(2021, 1, 1)
+        cache = self.create_cache()
+        cache.add_tasks([(1, "abc", now + timedelta(hours=1)), (2, "def", now + timedelta(hours=2))])
+        cache.update_tasks([(1, "abc", None), (2, "def2", now), (3, "ghi", now + timedelta(days=1))])
+        self.assertTasksEqual([(2, "def2", now), (3, "ghi", now + timedelta(days=1))], self.drain(cache))
+
+    def test_pop_due_tasks(self):
+        now = datetime(2021, 1, 1, 12)
+        cache = self.create_cache()
+        tasks = [(id, "abc", now + timedelta(minutes=id * 7 - 30)) for id in range(20)]
+        for task in random.sample(tasks, len(tasks)):
+            cache.add_task(task)
+        self.assertTasksEqual(tasks[:5], cache.pop_due_tasks(now))
+        self.assertTasksEqual([], cache.pop_due_tasks(now))
+        self.assertTasksEqual(tasks[5:15], cache.pop_due_tasks(tasks[15][2]))
+        self.assertTasksEqual(tasks[15], cache.get_next_task())
+
+    def test_load_tasks(self):
+        now = datetime(2021, 1, 1)
+        cache = self.create_cache()
+        cache.add_tasks([(1, "live", now + timedelta(hours=3)), (2, "abc", now + timedelta(hours=4))])
+        loaded = [(id, f"task{id}", now + timedelta(minutes=id)) for id in range(6)]
+        cache.load_tasks(loaded[:3], skip_ids={1})
+        cache.load_tasks(loaded[3:])
+        self.assertTasksEqual(
+            [loaded[0], loaded[2], loaded[3], loaded[4], loaded[5], (1, "live", now + timedelta(hours=3))],
+            self.drain(cache)
+        )
+
+    def test_get_tasks(self):
+        now = datetime(2021, 1, 1)
+        tasks = [(id, f"task{id}", now + timedelta(hours=id % 3, days=id % 2)) for id in range(10)]
+        cache = self.create_cache()
+        cache.add_tasks(random.sample(tasks, len(tasks)))
+        self.assertTasksEqual(sorted(tasks, key=lambda task: (task[2], task[0])), cache.get_tasks())
+        self.assertEqual(10, len(self.drain(cache)))
+
+    def test_get_tasks_until(self):
+        now = datetime(2021, 1, 1)
+        tasks = [(id, f"task{id}", now + timedelta(minutes=id * 7 % 40)) for id in range(40)]
+        cache = self.create_cache()
+        cache.add_tasks(tasks)
+        expected = sorted(tasks, key=lambda task: (task[2], task[0]))
+        self.assertTasksEqual(expected[:20], cache.get_tasks_until(now + timedelta(minutes=20)))
+        self.assertTasksEqual(expected[:5], cache.get_tasks_until(now + timedelta(minutes=20), limit=5))
+        self.assertEqual(40, len(self.drain(cache)))
+
+    def test_clear_all_tasks(self):
+        cache = self.create_cache()
+        cache.add_task((1, "abc", datetime(2021, 1, 1)))
+        cache.clear_all_tasks()
+        self.assertIsNone(cache.get_next_task())
+
+
+    def test_get_stats(self):
+        now = datetime(2021, 1, 1, 12, 34, 56)
+        cache = self.create_cache()
+        cache.add_tasks([(id, f"task{id}", now + timedelta(seconds=id)) for id in range(10)])
+        cache.get_next_task()
+        cache.add_task((3, "task3", now + timedelta(seconds=30)))
+        cache.remove_task(5)
+        tasks, stale = cache.get_stats()
+        self.assertEqual(9, tasks)
+        self.assertGreaterEqual(stale, 0)
+        cache.clear_all_tasks()
+        self.assertEqual((0, 0), cache.get_stats())
+
+
+class TestSortedSetTaskCache(TaskCacheTestMixin, unittest.TestCase):
+    def create_cache(self):
+        return TaskCache()
+
+
+class TestCompactTaskCache(TaskCacheTestMixin, unittest.TestCase):
+    def create_cache(self):
+        return CompactTaskCache()
+
+    def test_against_sorted_set(self):
+        now = datetime(2021, 1, 1)
+        rng = random.Random(16)
+        cache, reference = CompactTaskCache(), TaskCache()
+        for step in range(20000):
+            id = rng.randrange(3000)
+            operation = rng.random()
+            if operation < 0.6:
+                task = (id, None, now + timedelta(seconds=rng.randrange(-600, 86400)))
+                cache.add_task(task)
+                reference.add_task(task)
+            elif operation < 0.9:
+                cache.remove_task(id)
+                reference.remove_task(id)
+            else:
+                cutoff = now + timedelta(seconds=rng.randrange(0, 3600))
+                self.assertEqual(reference.pop_due_tasks(cutoff), cache.pop_due_tasks(cutoff))
+        self.assertEqual(reference.get_tasks(), cache.get_tasks())
+        self.assertEqual(len(reference.get_tasks()), len(cache))
+
+
+class TestTimingWheelTaskCache(TaskCacheTestMixin, unittest.TestCase):
+    def create_cache(self):
+        return TimingWheelTaskCache()
+
+    def test_create_task_cache(self):
+        self.assertIsInstance(create_task_cache("timing_wheel"), TimingWheelTaskCache)
+        self.assertRaises(ValueError, create_task_cache, "unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,23 @@
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from task_man.scheduling import TaskExpiryAlert, TIMEDELTA
+from task_man.clock import FakeClock
+from task_man.memory_store import MemoryTaskStore
+from task_man.metrics import SCHEDULER_LAG
+from task_man.scheduling import TaskExpiryAlert, TIMEDELTA, SCHEDULER_MODE_IOLOOP
+from tornado import gen
 from tornado.testing import AsyncTestCase, gen_test
 
 
+class RecordingDispatcher:
+    def __init__(self):
+        self.alerts = []
+
+    def submit(self, alerts):
+        self.alerts.extend(alerts)
+
+
 class TestTaskExpiryAlert(AsyncTestCase):
     @classmethod
     def setUpClass(cls):
@@ -58,3 +70,103 @@ class TestTaskExpiryAlert(AsyncTestCase):
         yield TaskExpiryAlert._TaskExpiryAlert__task_cache.task_done(tasks[0])
         time.sleep(1)
         self.assertEqual(tasks[2], TaskExpiryAlert._TaskExpiryAlert__task_cache.get_next_task())
+
+
+class TestTaskExpiryAlertIOLoop(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        TaskExpiryAlert.start_scheduler(SCHEDULER_MODE_IOLOOP)
+
+    def tearDown(self):
+        TaskExpiryAlert.stop_scheduler()
+        super().tearDown()
+
+    @gen_test
+    def test_add_expire_soon_task(self):
+        yield TaskExpiryAlert.clear_all_tasks()
+        yield TaskExpiryAlert.add_task(0, "abc", datetime.now() + TIMEDELTA / 2)
+        yield gen.sleep(0.05)
+        self.assertIsNone(TaskExpiryAlert._TaskExpiryAlert__task_cache.get_next_task())
+
+    @gen_test
+    def test_rearm_on_earlier_task(self):
+        task = (1, "def", datetime.now() + TIMEDELTA * 2)
+
+        yield TaskExpiryAlert.clear_all_tasks()
+        yield TaskExpiryAlert.add_task(*task)
+        yield gen.sleep(0.05)
+        self.assertEqual(task, TaskExpiryAlert._TaskExpiryAlert__task_cache.get_next_task())
+        yield TaskExpiryAlert.add_task(0, "abc", datetime.now() + TIMEDELTA / 2)
+        yield gen.sleep(0.05)
+        self.assertEqual(task, TaskExpiryAlert._TaskExpiryAlert__task_cache.get_next_task())
+
+    @gen_test
+    def test_sync_tasks_skip_alerted(self):
+        expiry_dt = datetime.now() + TIMEDELTA / 2
+        later_task = (2, "def", datetime.now() + TIMEDELTA * 2)
+
+        yield TaskExpiryAlert.clear_all_tasks()
+        yield TaskExpiryAlert.add_task(1, "abc", expiry_dt)
+        yield gen.sleep(0.05)
+        yield TaskExpiryAlert.sync_tasks([(1, "abc", expiry_dt), later_task, (3, "ghi", datetime.now())])
+        yield gen.sleep(0.05)
+        self.assertEqual([later_task], TaskExpiryAlert.get_tasks())
+
+    @gen_test
+    def test_get_expiring_tasks(self):
+        now = datetime.now()
+        tasks = [(4, "alerted", now + TIMEDELTA / 2), (5, "pending", now + TIMEDELTA * 2),
+                 (6, "later", now + TIMEDELTA * 3)]
+
+        yield TaskExpiryAlert.clear_all_tasks()
+        yield TaskExpiryAlert.add_tasks(tasks)
+        yield gen.sleep(0.05)
+        self.assertEqual(tasks[:2], (yield TaskExpiryAlert.get_expiring_tasks(now + TIMEDELTA * 3, 10)))
+        self.assertEqual(tasks[:1], (yield TaskExpiryAlert.get_expiring_tasks(now + TIMEDELTA * 4, 1)))
+
+    @gen_test
+    def test_fake_clock(self):
+        clock = FakeClock(datetime(2030, 1, 1))
+        task = (7, "abc", clock() + TIMEDELTA * 2)
+
+        lag = SCHEDULER_LAG.labels()
+        count, total = lag.count, lag.sum
+        TaskExpiryAlert.set_clock(clock)
+        try:
+            yield TaskExpiryAlert.clear_all_tasks()
+            yield TaskExpiryAlert.add_task(*task)
+            yield gen.sleep(0.05)
+            self.assertEqual([task], TaskExpiryAlert.get_tasks())
+            clock.advance(TIMEDELTA + timedelta(seconds=1))
+            TaskExpiryAlert.wake_up()
+            yield gen.sleep(0.05)
+            self.assertEqual([], TaskExpiryAlert.get_tasks())
+            self.assertEqual([task], (yield TaskExpiryAlert.get_expiring_tasks(clock() + TIMEDELTA * 2, 10)))
+            self.assertEqual(count + 1, lag.count)
+            self.assertAlmostEqual(1.0, lag.sum - total)  # notified 1 second after the due time on the fake clock
+        finally:
+            TaskExpiryAlert.set_clock()
+
+    @gen_test
+    def test_skip_deleted_due_tasks(self):
+        clock = FakeClock(datetime(2030, 1, 1))
+        store = MemoryTaskStore()
+        tasks = [(title, clock() + TIMEDELTA * 2) for title in ("kept", "deleted")]
+        ids = yield store.insert_tasks([{"title": title, "expiry_dt": expiry_dt} for title, expiry_dt in tasks])
+        yield store.delete_task(ids[1])  # outside the API, the task stays in the task cache
+        dispatcher = RecordingDispatcher()
+
+        TaskExpiryAlert.set_clock(clock)
+        TaskExpiryAlert.set_store(store)
+        TaskExpiryAlert.set_dispatcher(dispatcher)
+        try:
+            yield TaskExpiryAlert.clear_all_tasks()
+            yield TaskExpiryAlert.add_tasks([(id, title, expiry_dt) for id, (title, expiry_dt) in zip(ids, tasks)])
+            clock.advance(TIMEDELTA + timedelta(seconds=1))
+            TaskExpiryAlert.wake_up()
+            yield gen.sleep(0.05)
+            self.assertEqual([(ids[0], "kept")], [(alert.id, alert.title) for alert in dispatcher.alerts])
+        finally:
+            TaskExpiryAlert.set_clock()
+            TaskExpiryAlert.set_store(None)
+            TaskExpiryAlert.set_dispatcher(None)
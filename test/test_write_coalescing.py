@@ -0,0 +1,47 @@
+import unittest
+
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from task_man.write_coalescing import WriteQueue
+
+
+class TestWriteQueue(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+
+    async def execute_batch(self, writes):
+        self.batches.append(list(writes))
+        await gen.sleep(0)
+        if any(write < 0 for write in writes):
+            raise ValueError("negative")
+        return [write * 10 for write in writes]
+
+    @gen_test
+    def test_coalesce_within_window(self):
+        queue = WriteQueue(self.execute_batch, window=0.01)
+        results = yield [queue.submit(write) for write in range(5)]
+        self.assertEqual([0, 10, 20, 30, 40], results)
+        self.assertEqual([[0, 1, 2, 3, 4]], self.batches)
+
+    @gen_test
+    def test_max_batch(self):
+        queue = WriteQueue(self.execute_batch, window=10, max_batch=2)
+        results = yield [queue.submit(write) for write in range(4)]
+        self.assertEqual([0, 10, 20, 30], results)
+        self.assertEqual([[0, 1], [2, 3]], self.batches)
+
+    @gen_test
+    def test_retry_one_by_one(self):
+        queue = WriteQueue(self.execute_batch, window=0.01)
+        futures = [queue.submit(write) for write in (1, -1, 2)]
+        yield gen.sleep(0.05)
+        self.assertEqual(10, futures[0].result())
+        self.assertIsInstance(futures[1].exception(), ValueError)
+        self.assertEqual(20, futures[2].result())
+        self.assertEqual([[1, -1, 2], [1], [-1], [2]], self.batches)
+
+
+if __name__ == "__main__":
+    unittest.main()